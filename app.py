@@ -1,131 +1,260 @@
-from flask import Flask, request, jsonify, Response
-from core.database import Location, Machine, db
+import time
+from flask import Flask, g, request, jsonify, Response, stream_with_context
+from werkzeug.wsgi import wrap_file
+from core import forecast, metrics, profiling, snapshot
+from core.compression import MIN_SIZE, CompressionCache, negotiate
+from core.database import Machine, db, is_configured, router
+from core.export import EXPORT_FIELDS, FORMATS, export, parse_format, parse_time
+from core.logs import LogQueryError, parse_since, plan_read, stream_segments
+from core.queries import (
+    LOCATION_FIELDS,
+    ROOM_FIELDS,
+    MACHINE_FIELDS,
+    QueryError,
+    fetch_locations,
+    parse_fields,
+    parse_limit,
+)
 
 app = Flask(__name__)
+MAX_BATCH_CLAIMS = 500
+compression_cache = CompressionCache()
+# Cookie holding the time (epoch seconds) of the client's last write, so its
+# next reads see that write even though they are new requests
+LAST_WRITE_COOKIE = "cscgo_last_write"
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def last_write():
+    """Time of this client's last write from its cookie, or None."""
+    try:
+        return float(request.cookies[LAST_WRITE_COOKIE])
+    except (KeyError, ValueError):
+        return None
 
 
 @app.before_request
 def before_request():
-    """Ensure fresh database connection before each request"""
-    if db:
-        if not db.is_closed():
-            db.close()
-        db.connect()
+    """
+    Start request timing and let read-only requests read from replicas; the
+    database connects lazily on the first query. Clients that wrote within
+    the maximum replica lag read from the primary, so they see their writes.
+    """
+    request.start_time = time.perf_counter()
+    metrics.set_route(request.url_rule.rule if request.url_rule else None)
+    g.last_write = last_write()
+    if request.method in ("GET", "HEAD"):
+        if g.last_write is None or time.time() - g.last_write >= router.max_lag:
+            router.start_reads()
+
+
+@app.after_request
+def remember_write(response):
+    """Set the last write cookie after a successful write"""
+    if request.method not in READ_ONLY_METHODS and response.status_code < 400:
+        # Kept while replicas may lag behind the write, or a snapshot built
+        # before it may still be served
+        max_age = router.max_lag
+        if snapshot.READER is not None:
+            max_age = max(max_age, snapshot.READER.max_age)
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            repr(time.time()),
+            max_age=int(max_age) + 1,
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record request latency and periodically publish this worker's metrics"""
+    start = getattr(request, "start_time", None)
+    if start is not None:
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            route=metrics.current_route(),
+            method=request.method,
+            status=response.status_code,
+        )
+    try:
+        metrics.REGISTRY.maybe_flush()
+    except OSError:
+        app.logger.warning("Could not write metrics snapshot", exc_info=True)
+    return response
 
 
 @app.teardown_request
 def teardown_request(exception=None):
-    """Close database connection after each request"""
-    if db and not db.is_closed():
+    """Close database connections after each request"""
+    metrics.set_route(None)
+    router.stop_reads()
+    if is_configured() and not db.is_closed():
         db.close()
 
 
+@app.after_request
+def compress_response(response):
+    """
+    Compress JSON responses according to the client's Accept-Encoding.
+
+    Compressed bodies are cached by content, so unchanged data is only
+    compressed once per encoding. Streamed and error responses are left as is.
+    """
+    if (
+        response.status_code != 200
+        or response.is_streamed
+        or response.direct_passthrough
+        or response.mimetype != "application/json"
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < MIN_SIZE:
+        return response
+
+    encoding = negotiate(request.accept_encodings)
+    if encoding:
+        response.set_data(compression_cache.compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
 @app.route("/", methods=["GET"])
 def get_data():
     """
     Fetch locations with their associated rooms and machines from the database.
-    Supports filtering by room ID or machine ID using query parameters.
+    Supports filtering, field projection and cursor-based pagination using query
+    parameters.
 
     Query Parameters:
         room (optional): Filter results to show only specified room ID
         machine (optional): Filter results to show only specified machine (license plate or QR code)
+        location_fields (optional): Comma separated location fields to return
+        room_fields (optional): Comma separated room fields to return
+        machine_fields (optional): Comma separated machine fields to return
+        limit (optional): Maximum number of machines, and rooms without
+            machines, to return in one page
+        cursor (optional): Cursor from the X-Next-Cursor header of the previous page
+
+    Reads are answered from the scheduler's shared snapshot when it is fresh
+    and was built after the client's last write (e.g. a claim), and from the
+    database otherwise; responses from a snapshot carry its version in the
+    X-Snapshot-Version header.
 
     Returns:
         tuple: A tuple containing:
             - JSON response with an array of location objects
-            - HTTP status code (200 for success, 500 for errors)
+            - HTTP status code (200 for success, 400 for invalid parameters,
+              500 for errors)
     """
     try:
-        room_id = request.args.get("room")
-        machine_id = request.args.get("machine")
-
-        locations = []
-        for location in Location.select():
-            loc_data = {
-                "locationId": location.locationId,
-                "description": location.description,
-                "label": location.label,
-                "dryerCount": location.dryerCount,
-                "washerCount": location.washerCount,
-                "machineCount": location.machineCount,
-                "lastUpdated": location.lastUpdated,
-                "rooms": {},
-            }
+        current = snapshot.READER.current() if snapshot.READER is not None else None
+        if current is not None and g.last_write and current.created < g.last_write:
+            current = None  # Built before this client's last write
+        snapshot.SNAPSHOT_READS.inc(
+            source="snapshot" if current is not None else "database"
+        )
+        if current is not None and not request.args:
+            return snapshot_response(current), 200
 
-            for room in location.rooms:
-                # Skip if room filter is set and doesn't match
-                if room_id and room.roomId != room_id:
-                    continue
-
-                room_data = {
-                    "roomId": room.roomId,
-                    "connected": room.connected,
-                    "description": room.description,
-                    "label": room.label,
-                    "dryerCount": room.dryerCount,
-                    "washerCount": room.washerCount,
-                    "machineCount": room.machineCount,
-                    "freePlay": room.freePlay,
-                    "lastUpdated": room.lastUpdated,
-                    "machines": [],
-                }
+        fetch = (
+            current.tables.fetch_locations if current is not None else fetch_locations
+        )
+        locations, next_cursor = fetch(
+            room_id=request.args.get("room"),
+            machine_id=request.args.get("machine"),
+            location_fields=parse_fields(
+                request.args.get("location_fields"), LOCATION_FIELDS, "location_fields"
+            ),
+            room_fields=parse_fields(
+                request.args.get("room_fields"), ROOM_FIELDS, "room_fields"
+            ),
+            machine_fields=parse_fields(
+                request.args.get("machine_fields"), MACHINE_FIELDS, "machine_fields"
+            ),
+            limit=parse_limit(request.args.get("limit")),
+            cursor=request.args.get("cursor"),
+        )
 
-                for machine in room.machines:
-                    # Skip if machine filter is set and doesn't match
-                    if (
-                        machine_id
-                        and machine.licensePlate != machine_id
-                        and machine.qrCodeId != machine_id
-                    ):
-                        continue
-
-                    machine_data = {
-                        "licensePlate": machine.licensePlate,
-                        "qrCodeId": machine.qrCodeId,
-                        "lastUser": machine.lastUser,
-                        "available": machine.available,
-                        "type": machine.type,
-                        "timeRemaining": machine.timeRemaining,
-                        "mode": machine.mode,
-                        "lastUpdated": machine.lastUpdated,
-                    }
-                    room_data["machines"].append(machine_data)
-
-                # Only add room if it has machines (when machine filter is applied)
-                if not machine_id or room_data["machines"]:
-                    loc_data["rooms"][room.roomId] = room_data
-
-            # Only add location if it has rooms (when room or machine filter is applied)
-            if not (room_id or machine_id) or loc_data["rooms"]:
-                locations.append(loc_data)
-
-        return jsonify(locations), 200
+        response = jsonify(locations)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        if current is not None:
+            response.headers["X-Snapshot-Version"] = str(current.version)
+        return response, 200
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def snapshot_response(current):
+    """
+    Respond with the snapshot's precompressed unfiltered tree.
+
+    The body is sent from the snapshot file through the server's
+    wsgi.file_wrapper, which gunicorn turns into sendfile(), so it is never
+    copied into the worker; compress_response skips such responses.
+    """
+    encoding = request.accept_encodings.best_match(current.encodings)
+    body = current.open_body(encoding)
+    if body is not None:
+        response = Response(
+            wrap_file(request.environ, body),
+            mimetype="application/json",
+            direct_passthrough=True,
+        )
+        response.content_length = body.length
+    else:
+        # Replaced since it was mapped; the mapping is still valid
+        response = Response(
+            current.body(encoding).tobytes(), mimetype="application/json"
+        )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.headers["X-Snapshot-Version"] = str(current.version)
+    return response
+
+
 @app.route("/claim", methods=["POST"])
 def get_claim():
     """
-    Process a machine claim request by updating the lastUser field.
+    Process machine claim requests by updating the lastUser field.
 
-    Expected JSON payload:
+    Expected JSON payload, either a single claim:
         {
             "user_id": "string",    # ID of the user claiming the machine
             "machine_id": "string"  # License plate or QR code of the machine
         }
+    or a batch, applied in one UPDATE statement:
+        {
+            "claims": [
+                {"user_id": "string", "machine_id": "string"},
+                ...
+            ]
+        }
 
     Returns:
         tuple: A tuple containing:
             - JSON response with success status or error message
             - HTTP status code:
                 - 200: Successful claim
+                - 400: Batch too large
                 - 404: Missing data or machine not found
                 - 500: Server error
 
     Example Success Response:
         {"success": true}
 
+    Example Batch Success Response (counts are of distinct machine IDs;
+    unmatched lists the machine IDs no machine was found for):
+        {"success": true, "claimed": 2, "requested": 3, "unmatched": ["ABC123"]}
+
     Example Error Response:
         {"error": "Machine with id ABC123 not found"}
     """
@@ -134,6 +263,9 @@ def get_claim():
     if not data:
         return jsonify({"error": "No data provided"}), 404
 
+    if "claims" in data:
+        return claim_batch(data["claims"])
+
     user_id = data.get("user_id")
     machine_id = data.get("machine_id")
 
@@ -141,62 +273,280 @@ def get_claim():
         return jsonify({"error": "Missing required fields"}), 404
 
     try:
-        # Try to find machine by license plate or QR code
-        machine = (
-            Machine.select()
-            .where(
-                (Machine.licensePlate == machine_id) | (Machine.qrCodeId == machine_id)
-            )
-            .first()
-        )
-
-        if not machine:
+        if not Machine.claim(machine_id, user_id):
             return jsonify({"error": f"Machine with id {machine_id} not found"}), 404
 
-        # Update the lastUser field
-        machine.lastUser = user_id
-        machine.save()
-
         return jsonify({"success": True}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+def claim_batch(claims):
+    """Apply a batch of claims; see get_claim for the payload format."""
+    if not isinstance(claims, list) or not claims:
+        return jsonify({"error": "No data provided"}), 404
+    if len(claims) > MAX_BATCH_CLAIMS:
+        return (
+            jsonify({"error": f"At most {MAX_BATCH_CLAIMS} claims per request"}),
+            400,
+        )
+
+    # Later claims for the same machine win
+    by_machine = {}
+    for claim in claims:
+        user_id = claim.get("user_id") if isinstance(claim, dict) else None
+        machine_id = claim.get("machine_id") if isinstance(claim, dict) else None
+        if not user_id or not machine_id:
+            return jsonify({"error": "Missing required fields"}), 404
+        by_machine[machine_id] = user_id
+
+    try:
+        matched = set(Machine.claim_many(by_machine))
+        if not matched:
+            return jsonify({"error": "No matching machines found"}), 404
+
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "claimed": len(matched),
+                    "requested": len(by_machine),
+                    "unmatched": [m for m in by_machine if m not in matched],
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/export", methods=["GET"])
+def export_machines():
+    """
+    Stream the machine table for bulk analysis.
+
+    Rows are read in fixed-size batches and encoded as they are sent, so
+    memory use does not grow with the size of the export. The output is
+    gzipped on the fly when the client accepts gzip.
+
+    Query Parameters:
+        format (optional): "ndjson" (default) or "csv"
+        location (optional): Only export machines at this location ID
+        room (optional): Only export machines in this room ID
+        since (optional): Only export machines updated at or after this time
+            (ISO 8601 or Unix epoch seconds)
+        until (optional): Only export machines updated before this time
+        fields (optional): Comma separated machine columns to export
+
+    Returns:
+        Response: Streamed export (200), or a JSON error for invalid
+            parameters (400)
+    """
+    try:
+        export_format = parse_format(request.args.get("format"))
+        fields = parse_fields(request.args.get("fields"), EXPORT_FIELDS, "fields")
+        since = parse_time(request.args.get("since"), "since")
+        until = parse_time(request.args.get("until"), "until")
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    compress = request.accept_encodings["gzip"] > 0
+    chunks = export(
+        export_format,
+        fields,
+        compress=compress,
+        location_id=request.args.get("location"),
+        room_id=request.args.get("room"),
+        since=since,
+        until=until,
+    )
+    headers = {
+        "Content-Disposition": f"attachment; filename=machines.{export_format}",
+        "Vary": "Accept-Encoding",
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    # Keep the request context (and its database connection) until the
+    # stream is finished; teardown_request then closes the connection
+    return Response(
+        stream_with_context(chunks),
+        mimetype=FORMATS[export_format],
+        headers=headers,
+    )
+
+
+@app.route("/rooms/<room_id>/next-available", methods=["GET"])
+def next_available(room_id):
+    """
+    Forecast when the next machine of each type in a room will be available.
+
+    Answered from an in-memory index of projected finish times
+    (lastUpdated + timeRemaining) that a background thread keeps up to date,
+    so the request does not query the database.
+
+    Query Parameters:
+        type (optional): Only forecast this machine type (e.g. washer)
+
+    Returns:
+        tuple: A tuple containing:
+            - JSON response with the soonest machine per type (null if no
+              machine of that type can be forecast), or an error message
+            - HTTP status code (200 for success, 404 if the room has no
+              forecast, 503 while the index is still loading)
+
+    Example Success Response:
+        {
+            "roomId": "room1",
+            "machines": {
+                "washer": {
+                    "licensePlate": "ABC123",
+                    "stickerNumber": 4,
+                    "availableAt": "2025-01-01T12:34:00+00:00",
+                    "minutesUntilAvailable": 7
+                }
+            }
+        }
+    """
+    refresher = forecast.REFRESHER
+    if not refresher.ready:
+        refresher.start()
+        response = jsonify({"error": "Forecast is loading"})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+
+    types = refresher.index.types(room_id)
+    if not types:
+        return jsonify({"error": f"No forecast for room {room_id}"}), 404
+
+    machine_type = request.args.get("type")
+    if machine_type:
+        types = [machine_type]
+    machines = {
+        name: forecast.describe(refresher.index.next_available(room_id, name))
+        for name in types
+    }
+    return jsonify({"roomId": room_id, "machines": machines}), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Expose scraper, database and request metrics from every process.
+
+    Returns:
+        Response: Metrics in the Prometheus text exposition format
+    """
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/cycles", methods=["GET"])
+def get_cycles():
+    """
+    Return the scheduler's most recent scrape cycle timing reports.
+
+    Query Parameters:
+        limit (optional): Only return the last N reports
+
+    Returns:
+        tuple: A tuple containing:
+            - JSON response with an array of cycle reports, oldest first
+            - HTTP status code (200 for success, 404 if no cycle has been
+              reported yet)
+    """
+    try:
+        reports = profiling.read_reports()
+    except FileNotFoundError:
+        return jsonify({"error": "No cycle reports available"}), 404
+
+    limit = request.args.get("limit", type=int)
+    if limit:
+        reports = reports[-limit:]
+    return jsonify(reports), 200
+
+
+def _int_arg(name):
+    raw = request.args.get(name)
+    if raw is None:
+        return None
+    try:
+        value = int(raw)
+    except ValueError:
+        raise LogQueryError(f"{name} must be an integer")
+    if value < 0:
+        raise LogQueryError(f"{name} must not be negative")
+    return value
+
+
+def serve_log(path, name):
+    """
+    Stream a log file, or part of it, as plain text.
+
+    Query Parameters:
+        tail (optional): Return only the last N lines
+        since (optional): Return only lines logged at or after this time
+            (ISO 8601 or Unix epoch seconds)
+        offset (optional): Start of a byte range page; the response carries
+            X-Log-Size and, if more data follows, X-Next-Offset
+        length (optional): Size of the byte range page
+
+    Returns:
+        Response: Streamed plain text response containing:
+            - Selected log contents on success (200)
+            - Error message for invalid parameters (400)
+            - Error message if file not found (404)
+    """
+    try:
+        since = request.args.get("since")
+        segments, headers = plan_read(
+            path,
+            tail=_int_arg("tail"),
+            since=parse_since(since) if since else None,
+            offset=_int_arg("offset"),
+            length=_int_arg("length"),
+        )
+    except LogQueryError as e:
+        return Response(str(e), status=400, mimetype="text/plain")
+    except FileNotFoundError:
+        return Response(f"{name} not found", status=404, mimetype="text/plain")
+
+    return Response(
+        stream_segments(segments),
+        mimetype="text/plain",
+        headers=headers,
+        direct_passthrough=True,
+    )
+
+
 @app.route("/logs/access", methods=["GET"])
 def access_logs():
     """
-    Fetch and return the contents of the access log file.
+    Stream the contents of the access log file. See serve_log for the
+    supported query parameters.
 
     Returns:
         Response: Plain text response containing:
             - Log file contents on success (200)
+            - Error message for invalid parameters (400)
             - Error message if file not found (404)
     """
-    try:
-        with open("logs/access.log", "r") as f:
-            content = f.read()
-        return Response(content, mimetype="text/plain")
-    except FileNotFoundError:
-        return Response("access.log not found", status=404, mimetype="text/plain")
+    return serve_log("logs/access.log", "access.log")
 
 
 @app.route("/logs/error", methods=["GET"])
 def error_logs():
     """
-    Fetch and return the contents of the error log file.
+    Stream the contents of the error log file. See serve_log for the
+    supported query parameters.
 
     Returns:
         Response: Plain text response containing:
             - Log file contents on success (200)
+            - Error message for invalid parameters (400)
             - Error message if file not found (404)
     """
-    try:
-        with open("logs/error.log", "r") as f:
-            content = f.read()
-        return Response(content, mimetype="text/plain")
-    except FileNotFoundError:
-        return Response("error.log not found", status=404, mimetype="text/plain")
+    return serve_log("logs/error.log", "error.log")
 
 
 if __name__ == "__main__":
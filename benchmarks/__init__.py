@@ -0,0 +1 @@
+"""Performance benchmarks for the CSC GO Scraper hot paths."""
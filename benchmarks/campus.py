@@ -0,0 +1,132 @@
+import json
+import random
+from typing import Dict, List
+
+from core.scraper import BASE_URL
+
+# Machines per synthetic room, roughly what real laundry rooms have
+MACHINES_PER_ROOM = 40
+
+
+def build_campus(machine_count: int, seed: int = 0) -> Dict:
+    """
+    Build a synthetic location in the shape returned by the upstream API.
+
+    Args:
+        machine_count: Total number of machines across all rooms
+        seed: Random seed, so every run sees the same campus
+
+    Returns:
+        dict: {"location": location payload, "machines": {roomId: machines payload}}
+    """
+    rng = random.Random(seed)
+    location_id = f"bench-location-{machine_count}"
+    room_count = max(1, -(-machine_count // MACHINES_PER_ROOM))
+
+    rooms = []
+    machines: Dict[str, List[Dict]] = {}
+    for room_index in range(room_count):
+        room_id = f"room-{room_index:05d}"
+        start = room_index * MACHINES_PER_ROOM
+        count = min(MACHINES_PER_ROOM, machine_count - start)
+        room_machines = [
+            _machine(rng, location_id, room_id, start + number, number + 1)
+            for number in range(count)
+        ]
+        washers = sum(1 for m in room_machines if m["type"] == "washer")
+        machines[room_id] = room_machines
+        rooms.append(
+            {
+                "roomId": room_id,
+                "connected": True,
+                "description": f"Synthetic room {room_index}",
+                "dryerCount": count - washers,
+                "freePlay": False,
+                "label": f"Room {room_index}",
+                "locationId": location_id,
+                "machineCount": count,
+                "washerCount": washers,
+            }
+        )
+
+    washers = sum(room["washerCount"] for room in rooms)
+    location = {
+        "locationId": location_id,
+        "description": "Synthetic campus",
+        "dryerCount": machine_count - washers,
+        "label": f"Bench {machine_count}",
+        "machineCount": machine_count,
+        "washerCount": washers,
+        "rooms": rooms,
+    }
+    return {"location": location, "machines": machines}
+
+
+def _machine(rng, location_id, room_id, index, sticker):
+    machine_type = "washer" if index % 2 else "dryer"
+    busy = rng.random() < 0.4
+    return {
+        "opaqueId": f"opaque-{index:06d}",
+        "available": not busy,
+        "capability": {
+            "addTime": machine_type == "dryer",
+            "showAddTimeNotice": False,
+            "showSettings": True,
+        },
+        "controllerType": "ACA",
+        "display": None,
+        "doorClosed": True,
+        "freePlay": False,
+        "groupId": None,
+        "inService": None,
+        "licensePlate": f"LP{index:06d}",
+        "location": location_id,
+        "mode": "running" if busy else "idle",
+        "nfcId": f"nfc-{index:06d}",
+        "notAvailableReason": None,
+        "qrCodeId": f"QR{index:06d}",
+        "roomId": room_id,
+        "settings": {
+            "cycle": "normal",
+            "dryerTemp": "high" if machine_type == "dryer" else None,
+            "soil": "normal",
+            "washerTemp": "warm" if machine_type == "washer" else None,
+        },
+        "stackItems": None,
+        "stickerNumber": sticker,
+        "timeRemaining": rng.randint(1, 60) if busy else 0,
+        "type": machine_type,
+    }
+
+
+class FakeResponse:
+    """Minimal stand-in for requests.Response over pre-serialized JSON."""
+
+    def __init__(self, content: bytes, status_code: int = 200):
+        self.content = content
+        self.status_code = status_code
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeTransport:
+    """Serve a synthetic campus to scrape_location without network access."""
+
+    def __init__(self, campus: Dict):
+        location = campus["location"]
+        prefix = f"{BASE_URL}/{location['locationId']}"
+        self.responses = {prefix: json.dumps(location).encode()}
+        for room_id, machines in campus["machines"].items():
+            url = f"{prefix}/room/{room_id}/machines"
+            self.responses[url] = json.dumps(machines).encode()
+
+    def get(self, url: str) -> FakeResponse:
+        content = self.responses.get(url)
+        if content is None:
+            return FakeResponse(b"null", status_code=404)
+        return FakeResponse(content)
@@ -0,0 +1,235 @@
+"""
+Benchmark the scraper, persistence and API hot paths on synthetic campuses.
+
+Usage:
+    python -m benchmarks.run [--sizes 10,100,1000,10000] [--repeat 3]
+                             [--baseline benchmarks/baseline.json]
+                             [--threshold 0.25] [--save]
+
+Results are compared with the baseline file when it exists; the run fails if
+any benchmark is slower than the baseline by more than the threshold. Use
+--save (or run without a baseline) to record the current results as the new
+baseline. Baselines are machine specific, so record them on the machine that
+runs the comparison.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from peewee import SqliteDatabase
+
+from benchmarks.campus import FakeTransport, build_campus
+from core.database import Location, Room, Machine
+from core.records import MachineRecord
+from core.scraper import RoomDigests, flatten_dict, scrape_location
+
+MODELS = [Location, Room, Machine]
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Allowed slowdown relative to the baseline, as a fraction
+DEFAULT_THRESHOLD = 0.25
+# Differences smaller than this (seconds) are treated as noise
+MIN_DELTA = 0.002
+
+
+def best_of(func: Callable[[], None], repeat: int) -> float:
+    """Return the fastest of `repeat` timed calls, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+@contextmanager
+def bind_database() -> Iterator[SqliteDatabase]:
+    """
+    Bind the models to a fresh in-memory SQLite database within the block.
+
+    The models' previous databases are restored afterwards, so code running
+    after the benchmarks in the same process is unaffected.
+    """
+    previous = [model._meta.database for model in MODELS]
+    db = SqliteDatabase(":memory:")
+    for model in MODELS:
+        model._meta.database = db
+    db.connect()
+    try:
+        db.create_tables(MODELS)
+        yield db
+    finally:
+        db.close()
+        for model, database in zip(MODELS, previous):
+            model._meta.database = database
+
+
+def persist(location_data, rooms, machines) -> None:
+    """Upsert scraped data the same way the scheduler does."""
+    with Machine._meta.database.atomic():
+        Location.upsert(location_data)
+        for room in rooms:
+            Room.upsert(room)
+        for machine in machines:
+            Machine.upsert(machine)
+
+
+def bench_flatten(campus: Dict, repeat: int) -> Dict[str, float]:
+    payloads = [m for machines in campus["machines"].values() for m in machines]
+    return {
+        "flatten_dict": best_of(lambda: [flatten_dict(m) for m in payloads], repeat),
+        "machine_records": best_of(
+            lambda: [MachineRecord.from_api(m) for m in payloads], repeat
+        ),
+    }
+
+
+def bench_scrape(campus: Dict, repeat: int) -> Dict[str, float]:
+    transport = FakeTransport(campus)
+    location_id = campus["location"]["locationId"]
+    # An idle minute: every room's payload matches the previous cycle
+    digests = RoomDigests()
+    scrape_location(location_id, transport=transport, digests=digests)
+    digests.commit()
+
+    def scrape_unchanged():
+        scrape_location(location_id, transport=transport, digests=digests)
+        digests.commit()
+
+    return {
+        "scrape_location": best_of(
+            lambda: scrape_location(location_id, transport=transport), repeat
+        ),
+        "scrape_location_unchanged": best_of(scrape_unchanged, repeat),
+    }
+
+
+def bench_upsert(campus: Dict, repeat: int) -> Dict[str, float]:
+    transport = FakeTransport(campus)
+    location_id = campus["location"]["locationId"]
+    location_data, rooms, machines = scrape_location(location_id, transport=transport)
+
+    insert_timings, update_timings = [], []
+    for _ in range(repeat):
+        with bind_database():
+            start = time.perf_counter()
+            persist(
+                dict(location_data),
+                [dict(r) for r in rooms],
+                [dict(m) for m in machines],
+            )
+            insert_timings.append(time.perf_counter() - start)
+
+            # A typical minute: about one machine in ten changes
+            changed = [dict(m) for m in machines]
+            for machine in changed[::10]:
+                machine["timeRemaining"] += 1
+            start = time.perf_counter()
+            persist(dict(location_data), [dict(r) for r in rooms], changed)
+            update_timings.append(time.perf_counter() - start)
+
+    return {"upsert_insert": min(insert_timings), "upsert_update": min(update_timings)}
+
+
+def bench_get_data(campus: Dict, repeat: int) -> Dict[str, float]:
+    from app import app
+
+    transport = FakeTransport(campus)
+    location_id = campus["location"]["locationId"]
+    room_id = campus["location"]["rooms"][-1]["roomId"]
+    plate = campus["machines"][room_id][-1]["licensePlate"]
+    results = {}
+    with bind_database(), app.test_client() as client:
+        persist(*scrape_location(location_id, transport=transport))
+        for name, url in (
+            ("get_data", "/"),
+            ("get_data_room", f"/?room={room_id}"),
+            ("get_data_machine", f"/?machine={plate}"),
+        ):
+
+            def request(url=url):
+                response = client.get(url)
+                assert response.status_code == 200, response.data
+
+            results[name] = best_of(request, repeat)
+    return results
+
+
+BENCHMARKS = (bench_flatten, bench_scrape, bench_upsert, bench_get_data)
+
+
+def run(sizes: Sequence[int], repeat: int) -> Dict[str, float]:
+    """Run every benchmark for every campus size."""
+    results = {}
+    for size in sizes:
+        campus = build_campus(size)
+        for benchmark in BENCHMARKS:
+            for name, seconds in benchmark(campus, repeat).items():
+                results[f"{name}[{size}]"] = seconds
+    return results
+
+
+def compare(
+    results: Dict[str, float], baseline: Dict[str, float], threshold: float
+) -> List[Tuple[str, float, float]]:
+    """Return (name, baseline, current) for every benchmark that regressed."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current > previous * (1 + threshold) and current - previous > MIN_DELTA:
+            regressions.append((name, previous, current))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, DEFAULT_SIZES)),
+        help="Comma separated campus sizes (machines)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument(
+        "--save", action="store_true", help="Record results as the new baseline"
+    )
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run(sizes, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    for name, seconds in results.items():
+        previous = baseline.get(name)
+        change = f" ({seconds / previous - 1:+.1%})" if previous else ""
+        print(f"{name:32} {seconds * 1000:10.3f} ms{change}")
+
+    if args.save or not baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, previous, current in regressions:
+        print(
+            f"REGRESSION {name}: {previous * 1000:.3f} ms -> {current * 1000:.3f} ms",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+from dotenv import load_dotenv
+
+# Load environment variables from the .env file before any core module reads
+# its settings at import time
+load_dotenv()
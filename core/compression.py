@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # In requirements.txt, but gzip alone still works
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_SIZE = 512
+# Number of compressed bodies kept per process
+CACHE_SIZE = 32
+
+
+def _gzip(body: bytes) -> bytes:
+    # mtime=0 keeps the output deterministic for identical bodies
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def _brotli(body: bytes) -> bytes:
+    return brotli.compress(body, quality=5)
+
+
+ENCODERS = {"gzip": _gzip}
+if brotli is not None:
+    ENCODERS["br"] = _brotli
+
+# Server preference when the client accepts several encodings equally
+PREFERRED = tuple(name for name in ("br", "gzip") if name in ENCODERS)
+
+
+def negotiate(accept_encodings) -> Optional[str]:
+    """
+    Pick the content encoding to use for a response.
+
+    Args:
+        accept_encodings: The request's parsed Accept-Encoding header
+            (werkzeug Accept object)
+
+    Returns:
+        str or None: Name of the chosen encoding, or None to send identity
+    """
+    return accept_encodings.best_match(PREFERRED)
+
+
+class CompressionCache:
+    """
+    LRU cache of compressed response bodies.
+
+    Entries are keyed by a digest of the uncompressed body, so every distinct
+    body (i.e. every data version of a response) is compressed once per
+    encoding and repeat requests reuse the stored bytes.
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[bytes, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        """
+        Return `body` compressed with `encoding`, compressing only on a miss.
+
+        Raises:
+            KeyError: If the encoding is not supported
+        """
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+
+        compressed = ENCODERS[encoding](body)
+
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = compressed
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compressed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -1,7 +1,12 @@
 import os
+import random
+import threading
+import time
 import datetime
-from dotenv import load_dotenv
+from contextlib import contextmanager
 from peewee import (
+    DatabaseProxy,
+    SelectBase,
     MySQLDatabase,
     Model,
     CharField,
@@ -10,15 +15,35 @@ from peewee import (
     BooleanField,
     DateTimeField,
     ForeignKeyField,
+    Case,
+    IntegrityError,
+    ProgrammingError,
+    SqliteDatabase,
+    SQL,
+    fn,
 )
+from playhouse.migrate import SchemaMigrator, migrate
 import pymysql
-from typing import Dict, Any
+from pymysql.constants import CLIENT
+from typing import Callable, Dict, Any, Iterator, List, Mapping, Optional, Sequence
+from core import metrics, profiling
+from core.records import Record
 
-# Load environment variables from .env file
-load_dotenv()
 
+class QueryMetricsMixin:
+    """Record the count and latency of every query in core.metrics."""
 
-class AutoConnectingMySQLDatabase(MySQLDatabase):
+    def execute_sql(self, sql, params=None, commit=None):
+        start = time.perf_counter()
+        try:
+            return super().execute_sql(sql, params, commit)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe_query(elapsed)
+            profiling.record_query(elapsed)
+
+
+class AutoConnectingMySQLDatabase(QueryMetricsMixin, MySQLDatabase):
     def execute_sql(self, sql, params=None, commit=True):
         # Ensure a connection is open
         self.connect(reuse_if_open=True)
@@ -35,26 +60,276 @@ class AutoConnectingMySQLDatabase(MySQLDatabase):
         return super().execute_sql(sql, params, commit)
 
 
-# Initialize db as None - will be set based on environment
-if os.getenv("TESTING"):
-    db = None  # Will be set by tests
-else:
+def mysql_from_env(
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    connect_timeout: float = 28800,
+    read_timeout: float = 28800,
+) -> AutoConnectingMySQLDatabase:
+    """
+    Build the MySQL database from environment variables.
+
+    No connection is made here; each thread connects on its first query.
+
+    Args:
+        host: Server to connect to instead of MYSQL_HOST (e.g. a replica)
+        port: Port to use instead of MYSQL_PORT
+        connect_timeout: Seconds to wait for a connection
+        read_timeout: Seconds to wait for a query result (and write timeout)
+
+    Raises:
+        Exception: If MYSQL_HOST is not set
+    """
     if os.getenv("MYSQL_HOST") is None:
         raise Exception("MYSQL_HOST is not set")
 
-    # Establish a connection to the MySQL database using environment variables
-    db = AutoConnectingMySQLDatabase(
+    return AutoConnectingMySQLDatabase(
         os.getenv("MYSQL_DATABASE"),
         user=os.getenv("MYSQL_USER"),
         password=os.getenv("MYSQL_PASSWORD"),
-        host=os.getenv("MYSQL_HOST"),
-        port=int(os.getenv("MYSQL_PORT")),
-        connect_timeout=28800,
-        read_timeout=28800,
-        write_timeout=28800,
+        host=host or os.getenv("MYSQL_HOST"),
+        port=port or int(os.getenv("MYSQL_PORT")),
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        write_timeout=read_timeout,
+        # Report matched rather than changed rows, so conditional updates that
+        # leave a value unchanged (e.g. a repeated claim) still count as hits
+        client_flag=CLIENT.FOUND_ROWS,
     )
-    # Connect only if not in testing mode
-    db.connect()
+
+
+def replicas_from_env() -> List[AutoConnectingMySQLDatabase]:
+    """
+    Build read replicas from MYSQL_REPLICA_HOSTS ("host[:port],...").
+
+    Replicas share the primary's database name and credentials. They use
+    short timeouts, as they are probed and read from on request threads: an
+    unreachable replica must fail fast so reads fall back to the primary.
+    """
+    replicas = []
+    for entry in os.getenv("MYSQL_REPLICA_HOSTS", "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, port = entry.partition(":")
+        replicas.append(
+            mysql_from_env(
+                host,
+                int(port) if port else None,
+                connect_timeout=REPLICA_CONNECT_TIMEOUT,
+                read_timeout=REPLICA_READ_TIMEOUT,
+            )
+        )
+    return replicas
+
+
+def replica_lag(database) -> Optional[float]:
+    """
+    Return a MySQL replica's replication lag in seconds.
+
+    Returns:
+        float or None: Seconds behind the primary, or None if replication is
+            not running or the lag cannot be read
+
+    Raises:
+        OperationalError: If the replica cannot be reached
+    """
+    for statement in ("SHOW REPLICA STATUS", "SHOW SLAVE STATUS"):
+        try:
+            cursor = database.execute_sql(statement)
+        except ProgrammingError:
+            continue  # Older servers only know SHOW SLAVE STATUS
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        status = dict(zip([column[0] for column in cursor.description], row))
+        lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+        return None if lag is None else float(lag)
+    return None
+
+
+# Reads fall back to the primary while replicas lag more than this (seconds)
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+# Seconds a replica's measured lag is reused before probing again, and
+# before probing a replica again after a failed probe
+LAG_CHECK_INTERVAL = 5.0
+FAILED_CHECK_INTERVAL = 30.0
+# Timeouts (seconds) for replica connections, see replicas_from_env
+REPLICA_CONNECT_TIMEOUT = float(os.getenv("REPLICA_CONNECT_TIMEOUT", "1"))
+REPLICA_READ_TIMEOUT = float(os.getenv("REPLICA_READ_TIMEOUT", "10"))
+
+
+class ReplicaRouter:
+    """
+    Route read queries to read replicas within explicit read scopes.
+
+    Inside a read scope (see reading()), SELECT queries go to a replica
+    whose lag is within max_lag, chosen once per scope. Everything else goes
+    to the primary: queries outside read scopes, queries in a transaction,
+    SELECT ... FOR UPDATE, and every query after the scope's first write,
+    so a scope that writes reads its own writes. If no replica is healthy,
+    the scope reads from the primary.
+    """
+
+    def __init__(
+        self,
+        replicas: Sequence = (),
+        max_lag: float = REPLICA_MAX_LAG,
+        probe: Callable[[Any], Optional[float]] = replica_lag,
+        check_interval: float = LAG_CHECK_INTERVAL,
+        failed_check_interval: float = FAILED_CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.probe = probe
+        self.check_interval = check_interval
+        self.failed_check_interval = failed_check_interval
+        self.clock = clock
+        self._lags: Dict[int, tuple] = {}  # id(replica) -> (checked at, lag)
+        self._local = threading.local()
+
+    def start_reads(self) -> None:
+        """Open a read scope on this thread."""
+        self._local.reading = True
+        self._local.pinned = False
+        self._local.replica = None
+
+    def stop_reads(self) -> None:
+        """Close this thread's read scope and its replica connection."""
+        replica = getattr(self._local, "replica", None)
+        self._local.reading = False
+        self._local.replica = None
+        if replica is not None and not replica.is_closed():
+            replica.close()
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        self.start_reads()
+        try:
+            yield
+        finally:
+            self.stop_reads()
+
+    def lag(self, replica) -> Optional[float]:
+        """
+        Replication lag of `replica`, probed at most every check_interval.
+
+        A replica without a lag reading (unreachable, or not replicating) is
+        unhealthy and only probed again after failed_check_interval, so an
+        unreachable replica does not delay a request every check_interval.
+        """
+        now = self.clock()
+        checked = self._lags.get(id(replica))
+        if checked is not None:
+            interval = (
+                self.check_interval
+                if checked[1] is not None
+                else self.failed_check_interval
+            )
+            if now - checked[0] < interval:
+                return checked[1]
+        try:
+            lag = self.probe(replica)
+        except Exception:
+            lag = None
+        self._lags[id(replica)] = (now, lag)
+        return lag
+
+    def healthy(self, replica) -> bool:
+        lag = self.lag(replica)
+        return lag is not None and lag <= self.max_lag
+
+    def choose(self, primary, query):
+        """Return the database `query` should run on."""
+        local = self._local
+        if not self.replicas or not getattr(local, "reading", False):
+            return primary
+        if not isinstance(query, SelectBase) or getattr(query, "_for_update", None):
+            local.pinned = True  # Later reads in this scope see the write
+            return primary
+        if local.pinned or primary.in_transaction():
+            metrics.DB_READS.inc(target="primary")
+            return primary
+        if local.replica is None:
+            healthy = [replica for replica in self.replicas if self.healthy(replica)]
+            chosen = random.choice(healthy) if healthy else None
+            # Close the connections probing opened on the other replicas
+            for replica in self.replicas:
+                if replica is not chosen and not replica.is_closed():
+                    replica.close()
+            if chosen is None:
+                local.pinned = True
+                metrics.DB_READS.inc(target="primary")
+                return primary
+            local.replica = chosen
+        metrics.DB_READS.inc(target="replica")
+        return local.replica
+
+
+router = ReplicaRouter()
+
+
+class LazyDatabaseProxy(DatabaseProxy):
+    """
+    Database proxy that configures itself from the environment on first use.
+
+    Importing this module therefore never opens a connection; call
+    configure_db() first to use a different database (e.g. SQLite in tests).
+    Model queries are routed between the primary and read replicas by
+    `router`; everything else (transactions, raw SQL) uses the primary.
+    """
+
+    def __getattr__(self, attr):
+        if self.obj is None:
+            configure_db()
+        return getattr(self.obj, attr)
+
+    def execute(self, query, **context):
+        if self.obj is None:
+            configure_db()
+        return router.choose(self.obj, query).execute(query, **context)
+
+
+db = LazyDatabaseProxy()
+
+
+def configure_db(database=None, replicas=None):
+    """
+    Point all models at `database`, or at MySQL configured from the environment.
+
+    Args:
+        database: Primary database; defaults to MySQL from MYSQL_HOST
+        replicas: Read replicas; default to MYSQL_REPLICA_HOSTS when the
+            primary comes from the environment, otherwise none
+
+    Returns:
+        Database: The database now in use
+    """
+    if database is None:
+        database = mysql_from_env()
+        if replicas is None:
+            replicas = replicas_from_env()
+    router.replicas = list(replicas or ())
+    db.initialize(database)
+    return database
+
+
+def is_configured() -> bool:
+    return db.obj is not None
+
+
+def reset_after_fork() -> None:
+    """
+    Forget connections inherited from a parent process.
+
+    Call in a forked child (e.g. gunicorn's post_fork). The inherited sockets
+    are dropped without being closed, since closing them would also tear down
+    the parent's connections; the child reconnects on its first query.
+    """
+    for database in [db.obj, *router.replicas]:
+        if database is not None:
+            database._state.reset()
 
 
 # BaseModel to set the database for all models
@@ -66,9 +341,11 @@ class BaseModel(Model):
     def _check_updates_needed(
         cls,
         existing: Any,
-        data: Dict[str, Any],
+        data: Mapping[str, Any],
         exclude_fields: tuple = ("lastUpdated",),
     ) -> bool:
+        if isinstance(data, Record):
+            return data.differs_from(existing, exclude_fields)
         for key, new_value in data.items():
             if key in exclude_fields:
                 continue
@@ -96,17 +373,21 @@ class Location(BaseModel):
     )  # Timestamp of last update
 
     @classmethod
-    def upsert(cls, data: Dict[str, Any]) -> bool:
+    def upsert(cls, data: Mapping[str, Any]) -> bool:
         loc_id = data.get("locationId")
         existing = cls.get_or_none(cls.locationId == loc_id)
 
         if existing is None:
-            data["lastUpdated"] = datetime.datetime.now(datetime.timezone.utc)
-            cls.create(**data)
+            cls.create(
+                **{**data, "lastUpdated": datetime.datetime.now(datetime.timezone.utc)}
+            )
             return True
         elif cls._check_updates_needed(existing, data):
-            data["lastUpdated"] = datetime.datetime.now(datetime.timezone.utc)
-            cls.update(**data).where(cls.locationId == loc_id).execute()
+            values = {
+                **data,
+                "lastUpdated": datetime.datetime.now(datetime.timezone.utc),
+            }
+            cls.update(**values).where(cls.locationId == loc_id).execute()
             return True
         return False
 
@@ -129,17 +410,21 @@ class Room(BaseModel):
     )  # Timestamp of last update
 
     @classmethod
-    def upsert(cls, data: Dict[str, Any]) -> bool:
+    def upsert(cls, data: Mapping[str, Any]) -> bool:
         room_id = data.get("roomId")
         existing = cls.get_or_none(cls.roomId == room_id)
 
         if existing is None:
-            data["lastUpdated"] = datetime.datetime.now(datetime.timezone.utc)
-            cls.create(**data)
+            cls.create(
+                **{**data, "lastUpdated": datetime.datetime.now(datetime.timezone.utc)}
+            )
             return True
         elif cls._check_updates_needed(existing, data):
-            data["lastUpdated"] = datetime.datetime.now(datetime.timezone.utc)
-            cls.update(**data).where(cls.roomId == room_id).execute()
+            values = {
+                **data,
+                "lastUpdated": datetime.datetime.now(datetime.timezone.utc),
+            }
+            cls.update(**values).where(cls.roomId == room_id).execute()
             return True
         return False
 
@@ -156,7 +441,7 @@ class Machine(BaseModel):
     freePlay = BooleanField()  # Is in free play mode?
     groupId = CharField(null=True)  # Optional group ID
     inService = BooleanField(null=True)  # In service or not
-    licensePlate = CharField()  # Machine's license plate
+    licensePlate = CharField(index=True)  # Machine's license plate
     location = ForeignKeyField(
         Location, backref="machines", column_name="locationId"
     )  # FK to Location
@@ -164,7 +449,7 @@ class Machine(BaseModel):
     nfcId = CharField()  # NFC identifier
     notAvailableReason = CharField(null=True, default="")  # Reason for unavailability
     opaqueId = CharField()  # Opaque identifier
-    qrCodeId = CharField()  # QR code identifier
+    qrCodeId = CharField(index=True)  # QR code identifier
     roomId = ForeignKeyField(
         Room, backref="machines", column_name="roomId"
     )  # FK to Room
@@ -176,9 +461,9 @@ class Machine(BaseModel):
     stickerNumber = IntegerField()  # Sticker number
     timeRemaining = IntegerField()  # Time remaining in current cycle
     type = CharField()  # Machine type (e.g., washer, dryer)
-    lastUpdated = DateTimeField(
-        default=datetime.datetime.now
-    )  # Timestamp of last update
+    # Timestamp of last update; indexed for incremental forecast reloads and
+    # time-filtered exports
+    lastUpdated = DateTimeField(default=datetime.datetime.now, index=True)
     lastUser = CharField(null=True)  # Optional last user ID or name
 
     def save(self, *args, **kwargs):
@@ -193,23 +478,95 @@ class Machine(BaseModel):
         return super().create(**query)
 
     @classmethod
-    def upsert(cls, data: Dict[str, Any]) -> bool:
+    def upsert(cls, data: Mapping[str, Any]) -> bool:
         opaque_id = data.get("opaqueId")
         existing = cls.get_or_none(cls.opaqueId == opaque_id)
 
         if existing is None:
-            data["lastUpdated"] = datetime.datetime.now(datetime.timezone.utc)
-            data["lastUser"] = "Unknown"
-            cls.create(**data)
+            cls.create(
+                **{
+                    **data,
+                    "lastUpdated": datetime.datetime.now(datetime.timezone.utc),
+                    "lastUser": "Unknown",
+                }
+            )
             return True
         elif data["timeRemaining"] != existing.timeRemaining:
-            data["lastUpdated"] = datetime.datetime.now(datetime.timezone.utc)
+            values = {
+                **data,
+                "lastUpdated": datetime.datetime.now(datetime.timezone.utc),
+            }
             if data["timeRemaining"] - existing.timeRemaining > 5:
-                data["lastUser"] = "Unknown"
-            cls.update(**data).where(cls.opaqueId == opaque_id).execute()
+                values["lastUser"] = "Unknown"
+            cls.update(**values).where(cls.opaqueId == opaque_id).execute()
             return True
         return False
 
+    @classmethod
+    def claim(cls, machine_id: str, user_id: str) -> int:
+        """
+        Set lastUser on the machine with the given license plate or QR code.
+
+        Runs as a single conditional UPDATE touching only lastUser, so it does
+        not race with the full-row writes made by upsert.
+
+        Returns:
+            int: Number of machines matched (0 if the machine does not exist)
+        """
+        return cls._claim_update({machine_id: user_id}).execute()
+
+    @classmethod
+    def claim_many(cls, claims: Dict[str, str]) -> List[str]:
+        """
+        Apply many claims in one UPDATE statement.
+
+        The machines the claims matched are read back in the same transaction,
+        so callers can report which claims failed.
+
+        Args:
+            claims: Mapping of machine license plate or QR code to user ID
+
+        Returns:
+            list: The claimed license plates and QR codes that matched a machine
+        """
+        if not claims:
+            return []
+
+        with cls._meta.database.atomic():
+            cls._claim_update(claims).execute()
+            matched = set()
+            for plate, qr_code in (
+                cls.select(cls.licensePlate, cls.qrCodeId)
+                .where(cls._claim_condition(list(claims)))
+                .tuples()
+            ):
+                matched.update((plate, qr_code))
+        return [machine_id for machine_id in claims if machine_id in matched]
+
+    @classmethod
+    def _claim_condition(cls, ids: List[str]):
+        if len(ids) == 1:
+            return (cls.licensePlate == ids[0]) | (cls.qrCodeId == ids[0])
+        return cls.licensePlate.in_(ids) | cls.qrCodeId.in_(ids)
+
+    @classmethod
+    def _claim_update(cls, claims: Dict[str, str]):
+        if len(claims) == 1:
+            (last_user,) = claims.values()
+        else:
+            last_user = Case(
+                None,
+                [
+                    (
+                        (cls.licensePlate == machine_id) | (cls.qrCodeId == machine_id),
+                        user_id,
+                    )
+                    for machine_id, user_id in claims.items()
+                ],
+                cls.lastUser,
+            )
+        return cls.update(lastUser=last_user).where(cls._claim_condition(list(claims)))
+
 
 # Discord table definition
 class Discord(BaseModel):
@@ -217,6 +574,165 @@ class Discord(BaseModel):
     roomId = CharField()  # Room identifier
 
 
-# Connect to the database and create tables if they don't exist
-if not os.getenv("TESTING"):
-    db.create_tables([Location, Room, Machine, Discord], safe=True)
+def utcnow() -> datetime.datetime:
+    """Current UTC time as a naive datetime, the form stored by lease rows."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def server_time(database, seconds: float = 0.0):
+    """
+    SQL expression for the database server's UTC clock plus `seconds`.
+
+    Lease expiry and worker heartbeats are only ever compared with this
+    clock, so replicas whose own clocks drift still agree on when a lease
+    expires or a worker is gone.
+    """
+    if isinstance(getattr(database, "obj", database), SqliteDatabase):
+        return fn.strftime("%Y-%m-%d %H:%M:%f", "now", f"{seconds:+.3f} seconds")
+    return fn.TIMESTAMPADD(
+        SQL("MICROSECOND"), int(seconds * 1_000_000), fn.UTC_TIMESTAMP(6)
+    )
+
+
+# Lease table definition, used for leader election between replicas
+class Lease(BaseModel):
+    name = CharField(primary_key=True)  # What the lease guards
+    holder = CharField()  # Replica currently holding the lease
+    token = IntegerField(default=0)  # Fencing token, bumped on every takeover
+    expiresAt = DateTimeField()  # UTC time (database clock) the lease is free
+
+    @classmethod
+    def acquire(cls, name: str, holder: str, ttl: float) -> Optional[int]:
+        """
+        Acquire or renew a lease.
+
+        Renewing a live lease keeps its fencing token; taking over an expired
+        (or new) lease issues a higher token, so writes made under an older
+        token can be told apart.
+
+        Args:
+            name: Lease name
+            holder: Unique ID of the caller
+            ttl: Seconds until the lease expires unless renewed
+
+        Returns:
+            int or None: Fencing token if the caller holds the lease, else None
+        """
+        now = server_time(cls._meta.database)
+        expires = server_time(cls._meta.database, ttl)
+
+        renewed = (
+            cls.update(expiresAt=expires)
+            .where((cls.name == name) & (cls.holder == holder) & (cls.expiresAt > now))
+            .execute()
+        )
+        if not renewed:
+            taken = (
+                cls.update(holder=holder, token=cls.token + 1, expiresAt=expires)
+                .where((cls.name == name) & (cls.expiresAt <= now))
+                .execute()
+            )
+            if not taken:
+                try:
+                    cls.insert(
+                        name=name, holder=holder, token=1, expiresAt=expires
+                    ).execute()
+                except IntegrityError:
+                    return None  # Held by another replica
+
+        lease = cls.get_or_none((cls.name == name) & (cls.holder == holder))
+        return lease.token if lease else None
+
+    @classmethod
+    def fence(cls, name: str, holder: str, token: int, ttl: float) -> bool:
+        """
+        Check that the caller still holds the lease with the given token, and
+        extend it by `ttl` seconds.
+
+        Call inside a transaction before writing. On MySQL the update locks the
+        lease row until commit, which also blocks the holder's own renewals;
+        extending the lease here keeps it live for `ttl` seconds after the
+        transaction starts, so transactions must stay well within `ttl`.
+        """
+        database = cls._meta.database
+        return bool(
+            cls.update(expiresAt=server_time(database, ttl))
+            .where(
+                (cls.name == name)
+                & (cls.holder == holder)
+                & (cls.token == token)
+                & (cls.expiresAt > server_time(database))
+            )
+            .execute()
+        )
+
+    @classmethod
+    def release(cls, name: str, holder: str) -> bool:
+        """Expire the caller's lease immediately so another replica can take it."""
+        return bool(
+            cls.update(expiresAt=server_time(cls._meta.database))
+            .where((cls.name == name) & (cls.holder == holder))
+            .execute()
+        )
+
+
+# Worker table definition, the membership list for room-sharded scraping
+class Worker(BaseModel):
+    workerId = CharField(primary_key=True)  # Unique scraper worker ID
+    heartbeatAt = DateTimeField()  # UTC time (database clock) of the last heartbeat
+
+    @classmethod
+    def heartbeat(cls, worker_id: str) -> None:
+        """Register the worker or refresh its heartbeat."""
+        now = server_time(cls._meta.database)
+        if not cls.update(heartbeatAt=now).where(cls.workerId == worker_id).execute():
+            try:
+                cls.insert(workerId=worker_id, heartbeatAt=now).execute()
+            except IntegrityError:
+                pass  # Registered concurrently; that heartbeat is as good
+
+    @classmethod
+    def live(cls, ttl: float) -> list:
+        """Return the IDs of workers that sent a heartbeat in the last `ttl` seconds."""
+        cutoff = server_time(cls._meta.database, -ttl)
+        query = cls.select(cls.workerId).where(cls.heartbeatAt > cutoff)
+        return sorted(worker.workerId for worker in query)
+
+    @classmethod
+    def deregister(cls, worker_id: str) -> None:
+        """Remove the worker so its rooms are reassigned right away."""
+        cls.delete().where(cls.workerId == worker_id).execute()
+
+
+def ensure_indexes(models) -> None:
+    """
+    Create field indexes missing from existing tables.
+
+    create_tables(safe=True) skips tables that already exist, so indexes added
+    to a model after its table was created have to be migrated separately.
+    """
+    database = models[0]._meta.database
+    if isinstance(database, DatabaseProxy):
+        database.connect(reuse_if_open=True)  # Configures a lazy proxy
+        database = database.obj
+    migrator = SchemaMigrator.from_database(database)
+    for model in models:
+        table = model._meta.table_name
+        existing = {tuple(index.columns) for index in database.get_indexes(table)}
+        for field in model._meta.sorted_fields:
+            if field.index and (field.column_name,) not in existing:
+                migrate(migrator.add_index(table, (field.column_name,), field.unique))
+
+
+MODELS = [Location, Room, Machine, Discord, Lease, Worker]
+
+
+def init_db() -> None:
+    """Create missing tables and indexes. Safe to run on every start."""
+    db.create_tables(MODELS, safe=True)
+    ensure_indexes([Machine])
+
+
+if __name__ == "__main__":
+    init_db()
+    print("Database schema is up to date")
@@ -0,0 +1,231 @@
+"""
+Stream the Machine table as newline-delimited JSON or CSV.
+
+Usage:
+    python -m core.export [--format ndjson|csv] [--location ID] [--room ID]
+                          [--since TIME] [--until TIME] [--fields a,b,c]
+                          [--gzip] [--output FILE]
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import json
+import sys
+import zlib
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from core.database import Machine
+from core.logs import LogQueryError, parse_since
+from core.queries import QueryError, parse_fields
+
+# Rows fetched per query; memory use is bounded by one batch
+BATCH_SIZE = 1000
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = tuple(Machine._meta.sorted_field_names)
+
+
+def parse_time(raw: Optional[str], name: str) -> Optional[datetime.datetime]:
+    """
+    Parse a time filter (ISO 8601 or Unix epoch seconds) as naive UTC.
+
+    Raises:
+        QueryError: If the value cannot be parsed
+    """
+    if not raw:
+        return None
+    try:
+        value = parse_since(raw)
+    except LogQueryError:
+        raise QueryError(f"Invalid {name} value: {raw}")
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def parse_format(raw: Optional[str]) -> str:
+    """
+    Parse an export format, defaulting to ndjson.
+
+    Raises:
+        QueryError: If the format is not supported
+    """
+    export_format = raw or "ndjson"
+    if export_format not in FORMATS:
+        raise QueryError(
+            f"Unknown format: {export_format} (expected {' or '.join(FORMATS)})"
+        )
+    return export_format
+
+
+def export_batches(
+    fields: Sequence[str] = EXPORT_FIELDS,
+    location_id: Optional[str] = None,
+    room_id: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[List[Tuple[Any, ...]]]:
+    """
+    Yield machine rows in batches, in id order.
+
+    Each batch is its own keyset query (id > last id of the previous batch),
+    so no cursor or transaction is held open between batches and only one
+    batch is in memory at a time.
+
+    Args:
+        fields: Columns to export
+        location_id: Only export machines at this location
+        room_id: Only export machines in this room
+        since: Only export machines updated at or after this time (naive UTC)
+        until: Only export machines updated before this time (naive UTC)
+        batch_size: Rows per query
+
+    Yields:
+        list: Row tuples in the order of `fields`
+    """
+    conditions = []
+    if location_id:
+        conditions.append(Machine.location == location_id)
+    if room_id:
+        conditions.append(Machine.roomId == room_id)
+    if since:
+        conditions.append(Machine.lastUpdated >= since)
+    if until:
+        conditions.append(Machine.lastUpdated < until)
+
+    # Page on the id, selecting it as an extra last column if not requested
+    fields = list(fields)
+    columns = [getattr(Machine, field) for field in fields]
+    if "id" in fields:
+        id_index, extra = fields.index("id"), False
+    else:
+        columns.append(Machine.id)
+        id_index, extra = len(fields), True
+
+    last_id = 0
+    while True:
+        query = (
+            Machine.select(*columns)
+            .where(Machine.id > last_id, *conditions)
+            .order_by(Machine.id)
+            .limit(batch_size)
+            .tuples()
+        )
+        rows = list(query)
+        if not rows:
+            return
+        last_id = rows[-1][id_index]
+        yield [row[:-1] for row in rows] if extra else rows
+        if len(rows) < batch_size:
+            return
+
+
+def _value(value: Any) -> Any:
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def render_ndjson(
+    fields: Sequence[str], batches: Iterable[List[Tuple[Any, ...]]]
+) -> Iterator[bytes]:
+    """Encode each batch as one chunk of JSON lines."""
+    for batch in batches:
+        yield "".join(
+            json.dumps(
+                {field: _value(value) for field, value in zip(fields, row)},
+                separators=(",", ":"),
+            )
+            + "\n"
+            for row in batch
+        ).encode()
+
+
+def render_csv(
+    fields: Sequence[str], batches: Iterable[List[Tuple[Any, ...]]]
+) -> Iterator[bytes]:
+    """Encode a header row, then each batch as one chunk of CSV rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in batches:
+        writer.writerows([_value(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()  # Header of an empty export
+
+
+RENDERERS = {"ndjson": render_ndjson, "csv": render_csv}
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a stream of chunks into a single gzip member as they arrive."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export(
+    export_format: str = "ndjson",
+    fields: Sequence[str] = EXPORT_FIELDS,
+    compress: bool = False,
+    **filters: Any,
+) -> Iterator[bytes]:
+    """
+    Stream the machine export as encoded (and optionally gzipped) chunks.
+
+    Args:
+        export_format: "ndjson" or "csv"
+        fields: Columns to export
+        compress: Gzip the output
+        **filters: Filters passed to export_batches
+
+    Returns:
+        Iterator of bytes chunks; the database is only queried while iterating
+    """
+    chunks = RENDERERS[export_format](fields, export_batches(fields, **filters))
+    return gzip_stream(chunks) if compress else chunks
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--format", default="ndjson", choices=sorted(FORMATS))
+    parser.add_argument("--location", help="Only export this location")
+    parser.add_argument("--room", help="Only export this room")
+    parser.add_argument("--since", help="Updated at or after (ISO 8601 or epoch)")
+    parser.add_argument("--until", help="Updated before (ISO 8601 or epoch)")
+    parser.add_argument("--fields", help="Comma separated columns to export")
+    parser.add_argument("--gzip", action="store_true", help="Gzip the output")
+    parser.add_argument("--output", "-o", help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        chunks = export(
+            args.format,
+            parse_fields(args.fields, EXPORT_FIELDS, "fields"),
+            compress=args.gzip,
+            location_id=args.location,
+            room_id=args.room,
+            since=parse_time(args.since, "since"),
+            until=parse_time(args.until, "until"),
+        )
+    except QueryError as e:
+        parser.error(str(e))
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
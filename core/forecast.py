@@ -0,0 +1,236 @@
+import datetime
+import heapq
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.database import Machine, db, is_configured, router, utcnow
+
+logger = logging.getLogger(__name__)
+
+# Unit of the upstream timeRemaining field
+TIME_REMAINING_SECONDS = 60
+# Seconds between incremental reloads of changed machines
+REFRESH_INTERVAL = float(os.getenv("FORECAST_REFRESH", "5"))
+# Rows updated this long before the last reload are read again, covering
+# scrape transactions that commit after the lastUpdated they write
+REFRESH_OVERLAP = 120
+# Rebuild a heap once stale entries outnumber live ones by this factor
+COMPACT_FACTOR = 2
+
+# (finish timestamp, sequence number, machine id)
+HeapEntry = Tuple[float, int, int]
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    """Convert a lastUpdated value (naive UTC, aware or ISO text) to epoch seconds."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+def projected_finish(row: Dict[str, Any]) -> Optional[float]:
+    """
+    Project when a machine will be available, as epoch seconds.
+
+    Available machines are free since their last update; running machines
+    finish timeRemaining after it. Machines that are neither (e.g. finished
+    but not unloaded) cannot be forecast and return None.
+    """
+    updated = _timestamp(row["lastUpdated"])
+    if updated is None:
+        return None
+    if row["available"]:
+        return updated
+    if row["timeRemaining"] and row["timeRemaining"] > 0:
+        return updated + row["timeRemaining"] * TIME_REMAINING_SECONDS
+    return None
+
+
+class ForecastIndex:
+    """
+    Per-room, per-machine-type min-heaps of projected finish times.
+
+    Updates push a new heap entry and record it as the machine's current one;
+    superseded entries are skipped (and dropped) when they reach the top of
+    their heap, so both updates and lookups take O(log n).
+    """
+
+    def __init__(self):
+        self._heaps: Dict[Tuple[str, str], List[HeapEntry]] = {}
+        # Machine id -> (heap key, current entry, machine details)
+        self._current: Dict[int, Tuple[Tuple[str, str], HeapEntry, Dict[str, Any]]] = {}
+        # Room id -> machine type -> number of machines with a forecast
+        self._live: Dict[str, Dict[str, int]] = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._current)
+
+    def update(self, row: Dict[str, Any]) -> None:
+        """
+        Index a machine row with id, roomId, type, licensePlate, stickerNumber,
+        available, timeRemaining and lastUpdated.
+        """
+        finish = projected_finish(row)
+        key = (row["roomId"], row["type"])
+        details = {
+            "licensePlate": row["licensePlate"],
+            "stickerNumber": row["stickerNumber"],
+        }
+        with self._lock:
+            previous = self._current.pop(row["id"], None)
+            if previous is not None:
+                room_id, machine_type = previous[0]
+                self._live[room_id][machine_type] -= 1
+            if finish is None:
+                return
+            self._sequence += 1
+            entry = (finish, self._sequence, row["id"])
+            heap = self._heaps.setdefault(key, [])
+            heapq.heappush(heap, entry)
+            self._current[row["id"]] = (key, entry, details)
+            live = self._live.setdefault(key[0], {})
+            live[key[1]] = live.get(key[1], 0) + 1
+            if len(heap) > COMPACT_FACTOR * live[key[1]] + 16:
+                self._compact(key)
+
+    def _compact(self, key: Tuple[str, str]) -> None:
+        heap = [entry for entry in self._heaps[key] if self._is_current(entry)]
+        heapq.heapify(heap)
+        self._heaps[key] = heap
+
+    def _is_current(self, entry: HeapEntry) -> bool:
+        current = self._current.get(entry[2])
+        return current is not None and current[1] == entry
+
+    def next_available(
+        self, room_id: str, machine_type: str
+    ) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """
+        Return (projected finish, machine details) of the machine of the given
+        type in the room that is available soonest, or None.
+        """
+        with self._lock:
+            heap = self._heaps.get((room_id, machine_type))
+            while heap:
+                if self._is_current(heap[0]):
+                    entry = heap[0]
+                    return entry[0], self._current[entry[2]][2]
+                heapq.heappop(heap)
+            return None
+
+    def types(self, room_id: str) -> List[str]:
+        """Machine types with a forecast in the room."""
+        with self._lock:
+            live = self._live.get(room_id, {})
+            return sorted(machine_type for machine_type, count in live.items() if count)
+
+
+class ForecastRefresher:
+    """
+    Keep a ForecastIndex up to date from the Machine table.
+
+    The first refresh loads every machine; later ones only read machines
+    updated since the previous refresh (less REFRESH_OVERLAP), so each poll
+    costs about one scrape cycle's worth of changed rows.
+    """
+
+    def __init__(
+        self,
+        index: ForecastIndex,
+        interval: float = REFRESH_INTERVAL,
+        clock: Callable[[], datetime.datetime] = utcnow,
+    ):
+        self.index = index
+        self.interval = interval
+        self.clock = clock
+        self.ready = False
+        self._watermark: Optional[datetime.datetime] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """
+        Apply machines changed since the last refresh to the index.
+
+        Returns:
+            int: Number of machine rows read
+        """
+        started = self.clock()
+        query = Machine.select(
+            Machine.id,
+            Machine.roomId,
+            Machine.type,
+            Machine.licensePlate,
+            Machine.stickerNumber,
+            Machine.available,
+            Machine.timeRemaining,
+            Machine.lastUpdated,
+        )
+        if self._watermark is not None:
+            since = self._watermark - datetime.timedelta(seconds=REFRESH_OVERLAP)
+            query = query.where(Machine.lastUpdated >= since)
+
+        count = 0
+        for row in query.dicts().iterator():
+            self.index.update(row)
+            count += 1
+        self._watermark = started
+        self.ready = True
+        return count
+
+    def _run(self) -> None:
+        while True:
+            try:
+                # Replica lag is far below REFRESH_OVERLAP, so reading from a
+                # replica does not miss updates
+                with router.reading():
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"Forecast refresh failed: {str(e)}")
+            finally:
+                if is_configured() and not db.is_closed():
+                    db.close()
+            time.sleep(self.interval)
+
+    def start(self) -> None:
+        """Start refreshing in a background thread, if not already running."""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="forecast-refresh", daemon=True
+                )
+                self._thread.start()
+
+
+def minutes_until(finish: float, now: Optional[float] = None) -> int:
+    """Whole minutes until `finish`, rounded up; 0 if it has passed."""
+    remaining = finish - (time.time() if now is None else now)
+    return max(0, -(-int(remaining) // 60))
+
+
+def describe(
+    forecast: Optional[Tuple[float, Dict[str, Any]]], now: Optional[float] = None
+) -> Optional[Dict[str, Any]]:
+    """Format a next_available result for the API."""
+    if forecast is None:
+        return None
+    finish, details = forecast
+    return {
+        **details,
+        "availableAt": datetime.datetime.fromtimestamp(
+            finish, datetime.timezone.utc
+        ).isoformat(),
+        "minutesUntilAvailable": minutes_until(finish, now),
+    }
+
+
+REFRESHER = ForecastRefresher(ForecastIndex())
@@ -0,0 +1,330 @@
+import datetime
+import os
+import re
+import threading
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+# Size of the blocks read from disk and sent to the client
+CHUNK_SIZE = 64 * 1024
+# Once a binary search window is this small the rest is scanned linearly
+PROBE_SPAN = 64 * 1024
+# Upper bound on cached probes per log file
+MAX_PROBES = 4096
+# Default and maximum page size for offset paging
+DEFAULT_LENGTH = 1024 * 1024
+MAX_LENGTH = 16 * 1024 * 1024
+
+# [2025-01-31 12:00:00 +0000] [42] [INFO] ... (gunicorn error log)
+ERROR_TIMESTAMP = re.compile(rb"\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [+-]\d{4})\]")
+# 127.0.0.1 - - [31/Jan/2025:12:00:00 +0000] "GET / HTTP/1.1" ... (access log)
+ACCESS_TIMESTAMP = re.compile(
+    rb"\[(\d{2}/[A-Za-z]{3}/\d{4}:\d{2}:\d{2}:\d{2} [+-]\d{4})\]"
+)
+
+# (file, start offset, end offset or None for end of file)
+Segment = Tuple[BinaryIO, int, Optional[int]]
+
+
+class LogQueryError(ValueError):
+    """Raised when log query parameters are invalid."""
+
+
+def parse_timestamp(line: bytes) -> Optional[datetime.datetime]:
+    """
+    Extract the timestamp from a gunicorn access or error log line.
+
+    Returns:
+        datetime or None: Timezone-aware timestamp, or None for lines without
+            one (e.g. traceback continuation lines)
+    """
+    match = ERROR_TIMESTAMP.match(line)
+    if match:
+        return datetime.datetime.strptime(
+            match.group(1).decode(), "%Y-%m-%d %H:%M:%S %z"
+        )
+    match = ACCESS_TIMESTAMP.search(line, 0, 128)
+    if match:
+        return datetime.datetime.strptime(
+            match.group(1).decode(), "%d/%b/%Y:%H:%M:%S %z"
+        )
+    return None
+
+
+def parse_since(raw: str) -> datetime.datetime:
+    """
+    Parse a `since` parameter given as ISO 8601 or Unix epoch seconds.
+
+    Naive values are interpreted as UTC.
+
+    Raises:
+        LogQueryError: If the value cannot be parsed
+    """
+    try:
+        return datetime.datetime.fromtimestamp(float(raw), datetime.timezone.utc)
+    except ValueError:
+        pass
+    try:
+        since = datetime.datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        raise LogQueryError(f"Invalid since value: {raw}")
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    return since
+
+
+def tail_offset(f: BinaryIO, size: int, lines: int) -> Tuple[int, int]:
+    """
+    Find where the last `lines` lines of a file start by reading backwards.
+
+    Args:
+        f: File opened in binary mode
+        size: Number of bytes of the file to consider
+        lines: Number of lines wanted
+
+    Returns:
+        tuple: Offset of the first returned line and the number of lines
+            found (less than `lines` if the file is shorter)
+    """
+    if size == 0 or lines <= 0:
+        return size, 0
+
+    found = 0
+    pos = size
+    first_block = True
+    while pos > 0:
+        read = min(CHUNK_SIZE, pos)
+        pos -= read
+        f.seek(pos)
+        block = f.read(read)
+        end = len(block)
+        if first_block:
+            first_block = False
+            # The newline terminating the last line does not start a new one
+            if block.endswith(b"\n"):
+                end -= 1
+        while True:
+            index = block.rfind(b"\n", 0, end)
+            if index < 0:
+                break
+            found += 1
+            if found == lines:
+                return pos + index + 1, found
+            end = index
+    return 0, found + 1
+
+
+class OffsetIndex:
+    """
+    Sparse cache of byte offset -> timestamp probes for one log file.
+
+    Lookups binary search the file, reading only a few lines per probe, and
+    remember each probe so repeated `since` queries touch the disk less. The
+    cache is dropped when the file is rotated (new inode) or truncated.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._identity: Optional[Tuple[int, int]] = None
+        self._size = 0
+        self._probes: Dict[int, Tuple[int, Optional[datetime.datetime]]] = {}
+
+    def validate(self, stat: os.stat_result) -> None:
+        identity = (stat.st_dev, stat.st_ino)
+        if identity != self._identity or stat.st_size < self._size:
+            self._identity = identity
+            self._probes.clear()
+        self._size = stat.st_size
+
+    def _probe(
+        self, f: BinaryIO, offset: int, limit: int
+    ) -> Tuple[int, Optional[datetime.datetime]]:
+        """Find the first timestamped line starting at or after `offset`."""
+        cached = self._probes.get(offset)
+        if cached is not None and (cached[1] is not None or cached[0] >= limit):
+            return cached
+
+        f.seek(offset)
+        if offset:
+            f.readline()  # Skip the partial line we landed in
+        pos = f.tell()
+        result: Tuple[int, Optional[datetime.datetime]] = (limit, None)
+        while pos < limit:
+            line = f.readline()
+            if not line:
+                break
+            timestamp = parse_timestamp(line)
+            if timestamp is not None:
+                result = (pos, timestamp)
+                break
+            pos += len(line)
+
+        if len(self._probes) >= MAX_PROBES:
+            self._probes.clear()
+        self._probes[offset] = result
+        return result
+
+    def first_timestamp(self, f: BinaryIO, size: int) -> Optional[datetime.datetime]:
+        return self._probe(f, 0, size)[1]
+
+    def find(self, f: BinaryIO, size: int, since: datetime.datetime) -> int:
+        """
+        Return the offset of the first line logged at or after `since`.
+
+        Assumes timestamps are non-decreasing through the file, which holds
+        for gunicorn's append-only logs.
+        """
+        low, high = 0, size
+        while high - low > PROBE_SPAN:
+            middle = (low + high) // 2
+            line_offset, timestamp = self._probe(f, middle, high)
+            if timestamp is None or timestamp >= since:
+                high = middle
+            else:
+                low = line_offset
+
+        f.seek(low)
+        pos = low
+        while pos < size:
+            line = f.readline()
+            if not line:
+                break
+            timestamp = parse_timestamp(line)
+            if timestamp is not None and timestamp >= since:
+                return pos
+            pos += len(line)
+        return size
+
+
+_indexes: Dict[str, OffsetIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_for(path: str) -> OffsetIndex:
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = OffsetIndex()
+        return index
+
+
+def _open_with_size(path: str) -> Tuple[BinaryIO, int]:
+    f = open(path, "rb")
+    try:
+        # The size is fixed here so a growing log does not stream forever
+        return f, os.fstat(f.fileno()).st_size
+    except Exception:
+        f.close()
+        raise
+
+
+def _open_rotated(path: str) -> Optional[Tuple[BinaryIO, int]]:
+    try:
+        return _open_with_size(f"{path}.1")
+    except FileNotFoundError:
+        return None
+
+
+def _find_since(f: BinaryIO, path: str, size: int, since) -> Tuple[int, bool]:
+    """Return the start offset and whether the file starts after `since`."""
+    index = _index_for(path)
+    with index.lock:
+        index.validate(os.fstat(f.fileno()))
+        offset = index.find(f, size, since)
+        first = index.first_timestamp(f, size) if offset == 0 else None
+    return offset, first is not None and first > since
+
+
+def plan_read(
+    path: str,
+    tail: Optional[int] = None,
+    since: Optional[datetime.datetime] = None,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+) -> Tuple[List[Segment], Dict[str, str]]:
+    """
+    Open a log file and work out which byte ranges a request should stream.
+
+    `tail` and `since` also read from the rotated predecessor (`<path>.1`)
+    when the current file alone does not cover the request. Offset paging
+    applies to the current file only.
+
+    Args:
+        path: Path of the log file
+        tail: Return only the last N lines
+        since: Return only lines logged at or after this time
+        offset: Start of a byte range page
+        length: Size of a byte range page
+
+    Returns:
+        tuple: Segments for stream_segments and extra response headers
+
+    Raises:
+        FileNotFoundError: If the log file does not exist
+        LogQueryError: If more than one selection mode is requested
+    """
+    modes = sum(value is not None for value in (tail, since, offset))
+    if modes > 1:
+        raise LogQueryError("Only one of tail, since and offset may be given")
+
+    if modes == 0 and length is None:
+        # Plain full read, streamed in chunks
+        return [(open(path, "rb"), 0, None)], {}
+
+    f, size = _open_with_size(path)
+    segments: List[Segment] = []
+    headers: Dict[str, str] = {}
+
+    try:
+        if tail is not None:
+            start, found = tail_offset(f, size, tail)
+            if found < tail:
+                rotated = _open_rotated(path)
+                if rotated:
+                    old, old_size = rotated
+                    old_start, _ = tail_offset(old, old_size, tail - found)
+                    segments.append((old, old_start, old_size))
+            segments.append((f, start, size))
+        elif since is not None:
+            start, starts_after = _find_since(f, path, size, since)
+            if starts_after:
+                rotated = _open_rotated(path)
+                if rotated:
+                    old, old_size = rotated
+                    old_start, _ = _find_since(old, f"{path}.1", old_size, since)
+                    segments.append((old, old_start, old_size))
+            segments.append((f, start, size))
+        else:
+            start = min(offset or 0, size)
+            end = min(size, start + min(length or DEFAULT_LENGTH, MAX_LENGTH))
+            segments.append((f, start, end))
+            headers["X-Log-Size"] = str(size)
+            if end < size:
+                headers["X-Next-Offset"] = str(end)
+    except Exception:
+        for segment in segments:
+            segment[0].close()
+        f.close()
+        raise
+
+    return segments, headers
+
+
+def stream_segments(segments: List[Segment]) -> Iterator[bytes]:
+    """Yield the planned byte ranges in CHUNK_SIZE pieces, closing each file."""
+    try:
+        for f, start, end in segments:
+            if end is not None:
+                f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(
+                    CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                )
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+    finally:
+        for f, _, _ in segments:
+            f.close()
@@ -0,0 +1,369 @@
+"""
+Minimal Prometheus-style metrics shared by the API workers and the scheduler.
+
+Each process keeps its metrics in memory and, when METRICS_DIR is set, writes
+a snapshot of them to METRICS_DIR/<pid>.json. Rendering merges the snapshots
+of every process with the live metrics of the current one, so /metrics on any
+gunicorn worker reports totals for all workers and the scheduler. Snapshots of
+processes that have exited (e.g. recycled gunicorn workers) are merged into
+METRICS_DIR/archived.json when rendering, so totals never go down when a
+worker is replaced; pids are only meaningful within one host or container.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+# Minimum seconds between snapshot writes from maybe_flush
+FLUSH_INTERVAL = 1.0
+# Merged metrics of exited processes, and the lock taken while updating it
+ARCHIVE_FILENAME = "archived.json"
+LOCK_FILENAME = ".lock"
+
+LabelValues = Tuple[str, ...]
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dump(self) -> Dict:
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {
+            "kind": self.kind,
+            "help": self.documentation,
+            "labels": list(self.labelnames),
+            "values": values,
+        }
+
+
+class Histogram(Counter):
+    """Distribution of observed values in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., sum, count]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def dump(self) -> Dict:
+        with self._lock:
+            values = [[list(key), list(series)] for key, series in self._series.items()]
+        return {
+            "kind": self.kind,
+            "help": self.documentation,
+            "labels": list(self.labelnames),
+            "buckets": list(self.buckets),
+            "values": values,
+        }
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OverflowError):
+        return True  # Exists but owned by another user / not a real pid
+    return True
+
+
+class Registry:
+    """Collection of metrics with multi-process snapshot support."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self._metrics: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def _register(self, metric: Counter) -> Counter:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def dump(self) -> Dict[str, Dict]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.dump() for metric in metrics}
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def flush(self) -> None:
+        """Write this process's metrics to the shared directory, atomically."""
+        if not self.directory:
+            return
+        self._last_flush = time.monotonic()
+        path = self._snapshot_path(os.getpid())
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.dump(), f, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    def maybe_flush(self) -> None:
+        """Flush at most once every FLUSH_INTERVAL seconds."""
+        if self.directory and time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    @contextmanager
+    def _directory_lock(self) -> Iterator[None]:
+        """Serialize archiving across the processes sharing the directory."""
+        with open(os.path.join(self.directory, LOCK_FILENAME), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _archive(self, paths: List[str]) -> None:
+        """Merge snapshots of exited processes into the archive and remove them."""
+        archive_path = os.path.join(self.directory, ARCHIVE_FILENAME)
+        snapshots = []
+        for path in [archive_path] + paths:
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # No archive yet, or removed meanwhile
+        temp_path = f"{archive_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(merge_snapshots(snapshots), f, separators=(",", ":"))
+        os.replace(temp_path, archive_path)
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _snapshots(self) -> List[Dict[str, Dict]]:
+        snapshots = [self.dump()]
+        if not self.directory or not os.path.isdir(self.directory):
+            return snapshots
+
+        own = os.path.basename(self._snapshot_path(os.getpid()))
+        # Archiving and reading under one lock, so a render never sees a dead
+        # process's metrics both archived and in their own file, or in neither
+        with self._directory_lock():
+            dead = []
+            for filename in os.listdir(self.directory):
+                pid = filename[: -len(".json")]
+                if filename.endswith(".json") and pid.isdigit():
+                    if not _process_alive(int(pid)):
+                        dead.append(os.path.join(self.directory, filename))
+            if dead:
+                self._archive(dead)
+
+            for filename in sorted(os.listdir(self.directory)):
+                if not filename.endswith(".json") or filename == own:
+                    continue
+                try:
+                    with open(os.path.join(self.directory, filename)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # Partially written or removed meanwhile
+        return snapshots
+
+    def render(self) -> str:
+        """Render all processes' metrics in the Prometheus text format."""
+        merged = merge_snapshots(self._snapshots())
+
+        lines = []
+        for name in sorted(merged):
+            data = merged[name]
+            lines.append(f"# HELP {name} {data['help']}")
+            lines.append(f"# TYPE {name} {data['kind']}")
+            labelnames = data["labels"]
+            series = {tuple(labels): value for labels, value in data["values"]}
+            for key in sorted(series):
+                value = series[key]
+                pairs = list(zip(labelnames, key))
+                if data["kind"] != "histogram":
+                    lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(data["buckets"], value):
+                    cumulative += count
+                    bucket = pairs + [("le", _number(bound))]
+                    lines.append(
+                        f"{name}_bucket{_labels(bucket)} {_number(cumulative)}"
+                    )
+                bucket = pairs + [("le", "+Inf")]
+                lines.append(f"{name}_bucket{_labels(bucket)} {_number(value[-1])}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(pairs)} {_number(value[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def merge_snapshots(snapshots: List[Dict[str, Dict]]) -> Dict[str, Dict]:
+    """Add up the values of metric dumps, returning a dump of the totals."""
+    merged: Dict[str, Dict] = {}
+    series: Dict[str, Dict[LabelValues, object]] = {}
+    for snapshot in snapshots:
+        for name, data in snapshot.items():
+            merged.setdefault(name, data)
+            target = series.setdefault(name, {})
+            for labels, value in data["values"]:
+                key = tuple(labels)
+                if data["kind"] == "histogram":
+                    current = target.get(key)
+                    if current is None or len(current) != len(value):
+                        target[key] = list(value)
+                    else:
+                        target[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    target[key] = target.get(key, 0) + value
+    return {
+        name: {
+            **data,
+            "values": [[list(key), value] for key, value in series[name].items()],
+        }
+        for name, data in merged.items()
+    }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry(os.getenv("METRICS_DIR") or None)
+
+# Scraper
+ROOM_FETCH_SECONDS = REGISTRY.histogram(
+    "cscgo_room_fetch_seconds", "Latency of fetching one room's machines"
+)
+FLATTEN_SECONDS = REGISTRY.histogram(
+    "cscgo_flatten_seconds", "Time spent flattening machine data per scrape"
+)
+SCRAPE_CYCLE_SECONDS = REGISTRY.histogram(
+    "cscgo_scrape_cycle_seconds", "Duration of a full scrape and persist cycle"
+)
+ROOM_DIGESTS = REGISTRY.counter(
+    "cscgo_room_digest_total",
+    "Rooms whose machines payload was unchanged (hit) or changed (miss)",
+    ("result",),
+)
+UPSERT_SECONDS = REGISTRY.histogram(
+    "cscgo_upsert_seconds", "Latency of a single model upsert", ("model",)
+)
+UPSERT_ROWS_CHANGED = REGISTRY.counter(
+    "cscgo_upsert_rows_changed_total", "Rows inserted or updated by upserts", ("model",)
+)
+
+# API and database
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "cscgo_http_request_seconds",
+    "HTTP request latency",
+    ("route", "method", "status"),
+)
+DB_QUERIES = REGISTRY.counter(
+    "cscgo_db_queries_total", "Database queries executed", ("route",)
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "cscgo_db_query_seconds", "Database query latency", ("route",)
+)
+DB_READS = REGISTRY.counter(
+    "cscgo_db_reads_total",
+    "Reads in read-replica scopes, by the database that served them",
+    ("target",),
+)
+
+_context = threading.local()
+
+
+def set_route(route: Optional[str]) -> None:
+    """Attribute database queries made by this thread to `route`."""
+    _context.route = route
+
+
+def current_route() -> str:
+    return getattr(_context, "route", None) or "none"
+
+
+def observe_query(seconds: float) -> None:
+    route = current_route()
+    DB_QUERIES.inc(route=route)
+    DB_QUERY_SECONDS.observe(seconds, route=route)
@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Tuple
+
+import requests
+
+from core import metrics
+from core.database import Discord
+
+logger = logging.getLogger(__name__)
+
+# Deliveries (one per subscriber) allowed per second, and the burst allowed
+# after a quiet period
+RATE = 20.0
+BURST = 100
+# Notifications handed to the sink per send() call
+BATCH_SIZE = 50
+
+NOTIFICATIONS = metrics.REGISTRY.counter(
+    "cscgo_notifications_total",
+    "Subscriber notifications delivered (sent) or lost to sink errors (dropped)",
+    ("result",),
+)
+
+
+class MachineEvent(NamedTuple):
+    """A change in a machine's state between two scrape cycles."""
+
+    roomId: str
+    licensePlate: str
+    type: str
+    stickerNumber: int
+    # "available" or "unavailable" when `available` flipped, otherwise
+    # "finished" when timeRemaining reached 0
+    kind: str
+
+
+class Notification(NamedTuple):
+    subscriberId: str
+    events: Tuple[MachineEvent, ...]
+
+
+class MachineStateTracker:
+    """
+    Remember each machine's state and report what changed since the last cycle.
+
+    Machines seen for the first time only set the baseline. Machines missing
+    from a cycle (e.g. in a room whose payload did not change) keep their
+    previous state.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, Tuple[int, bool]] = {}
+
+    def diff(self, machines: Iterable) -> List[MachineEvent]:
+        """
+        Update the tracked states and return the events they raise.
+
+        Args:
+            machines: Machine records (or dicts) from scrape_location
+        """
+        events = []
+        for machine in machines:
+            state = (machine["timeRemaining"], machine["available"])
+            previous = self._states.get(machine["opaqueId"])
+            self._states[machine["opaqueId"]] = state
+            if previous is None or previous == state:
+                continue
+
+            if previous[1] != state[1]:
+                kind = "available" if state[1] else "unavailable"
+            elif previous[0] > 0 and state[0] == 0:
+                kind = "finished"
+            else:
+                continue
+            events.append(
+                MachineEvent(
+                    machine["roomId"],
+                    machine["licensePlate"],
+                    machine["type"],
+                    machine["stickerNumber"],
+                    kind,
+                )
+            )
+        return events
+
+
+class SubscriberIndex:
+    """In-memory room ID -> subscriber IDs index over the Discord table."""
+
+    def __init__(self):
+        self._rooms: Dict[str, FrozenSet[str]] = {}
+
+    def load(self) -> int:
+        """
+        Rebuild the index from the Discord table in one query.
+
+        Returns:
+            int: Number of subscribers
+        """
+        rooms = defaultdict(set)
+        count = 0
+        for discord_id, room_id in Discord.select(
+            Discord.discordId, Discord.roomId
+        ).tuples():
+            rooms[room_id].add(discord_id)
+            count += 1
+        # Swap in the new index in one assignment for concurrent readers
+        self._rooms = {room_id: frozenset(ids) for room_id, ids in rooms.items()}
+        return count
+
+    def subscribers(self, room_id: str) -> FrozenSet[str]:
+        return self._rooms.get(room_id, frozenset())
+
+
+class LogSink:
+    """Sink that only logs notifications."""
+
+    def send(self, notifications: List[Notification]) -> None:
+        for notification in notifications:
+            logger.info(
+                f"Notify {notification.subscriberId}: "
+                + ", ".join(
+                    f"{event.licensePlate} {event.kind}"
+                    for event in notification.events
+                )
+            )
+
+
+class WebhookSink:
+    """Sink that POSTs each batch of notifications as JSON to the bot."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, notifications: List[Notification]) -> None:
+        payload = {
+            "notifications": [
+                {
+                    "subscriberId": notification.subscriberId,
+                    "events": [event._asdict() for event in notification.events],
+                }
+                for notification in notifications
+            ]
+        }
+        response = requests.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class Notifier:
+    """
+    Fan machine events out to room subscribers through a rate-limited sink.
+
+    Events are grouped per subscriber, so a subscriber gets one notification
+    per flush however many of their room's machines changed. Notifications
+    beyond the rate limit stay queued, merged with any later events for the
+    same subscriber, until a later flush().
+    """
+
+    def __init__(
+        self,
+        index: SubscriberIndex,
+        sink,
+        rate: float = RATE,
+        burst: int = BURST,
+        batch_size: int = BATCH_SIZE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.index = index
+        self.sink = sink
+        self.rate = rate
+        self.burst = burst
+        self.batch_size = batch_size
+        self.clock = clock
+        self._tokens = float(burst)
+        self._refilled = clock()
+        self._pending: "OrderedDict[str, List[MachineEvent]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def dispatch(self, events: Iterable[MachineEvent]) -> int:
+        """
+        Queue notifications for the subscribers of each event's room and flush.
+
+        Returns:
+            int: Number of notifications sent
+        """
+        with self._lock:
+            for event in events:
+                for subscriber in self.index.subscribers(event.roomId):
+                    self._pending.setdefault(subscriber, []).append(event)
+        return self.flush()
+
+    def flush(self) -> int:
+        """
+        Send as many queued notifications as the rate limit allows.
+
+        Returns:
+            int: Number of notifications sent
+        """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._refilled) * self.rate
+            )
+            self._refilled = now
+            count = min(int(self._tokens), len(self._pending))
+            self._tokens -= count
+            ready = [
+                Notification(subscriber, tuple(events))
+                for subscriber, events in (
+                    self._pending.popitem(last=False) for _ in range(count)
+                )
+            ]
+
+        sent = 0
+        for start in range(0, len(ready), self.batch_size):
+            batch = ready[start : start + self.batch_size]
+            try:
+                self.sink.send(batch)
+            except Exception as e:
+                NOTIFICATIONS.inc(len(batch), result="dropped")
+                logger.error(f"Could not deliver {len(batch)} notifications: {str(e)}")
+                continue
+            NOTIFICATIONS.inc(len(batch), result="sent")
+            sent += len(batch)
+        return sent
@@ -0,0 +1,248 @@
+import cProfile
+import datetime
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Where cycle reports and pstats dumps are written
+PROFILE_DIR = os.getenv("PROFILE_DIR") or "logs"
+# Name of the ring buffer file read by the API
+REPORTS_FILE = "cycles.json"
+# Writing a number K to this file in PROFILE_DIR profiles the next K cycles
+TRIGGER_FILE = "profile_cycles"
+# Number of slowest room fetches listed in a report
+SLOWEST_ROOMS = 5
+
+
+def _reset_peak_rss() -> bool:
+    """
+    Reset the process's peak resident set size (Linux >= 4.0).
+
+    Returns:
+        bool: True if the next _peak_rss_kb() only covers the time since
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _peak_rss_kb() -> int:
+    """Peak resident set size in KiB since the last reset (or process start)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    # Peak over the whole process lifetime (KiB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class CycleProfile:
+    """Timings collected during one scrape cycle."""
+
+    def __init__(self):
+        # Whether the peak RSS was reset, so it can be reported for the cycle
+        self.peak_rss_reset = _reset_peak_rss()
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.thread_id = threading.get_ident()
+        self.phases: Dict[str, float] = {}
+        self.room_fetches: List[tuple] = []
+        self.db_round_trips = 0
+        self.db_seconds = 0.0
+        self.extra: Dict[str, Any] = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def record_room_fetch(self, room_id: str, seconds: float) -> None:
+        with self._lock:
+            self.room_fetches.append((room_id, seconds))
+
+    def record_query(self, seconds: float) -> None:
+        # Only count queries made by the cycle itself, not concurrent jobs
+        if threading.get_ident() == self.thread_id:
+            self.db_round_trips += 1
+            self.db_seconds += seconds
+
+    def report(self) -> Dict[str, Any]:
+        slowest = sorted(self.room_fetches, key=lambda fetch: fetch[1], reverse=True)
+        return {
+            "startedAt": self.started_at.isoformat(),
+            "duration": round(time.perf_counter() - self._start, 6),
+            "phases": {name: round(value, 6) for name, value in self.phases.items()},
+            "roomFetches": len(self.room_fetches),
+            "slowestRooms": [
+                {"roomId": room_id, "seconds": round(seconds, 6)}
+                for room_id, seconds in slowest[:SLOWEST_ROOMS]
+            ],
+            "dbRoundTrips": self.db_round_trips,
+            "dbSeconds": round(self.db_seconds, 6),
+            # Peak resident set size (KiB) of the scheduler process during
+            # the cycle, where it can be measured; CycleProfiler adds the
+            # process's peak as processPeakRssKb
+            "cyclePeakRssKb": _peak_rss_kb() if self.peak_rss_reset else None,
+            **self.extra,
+        }
+
+
+_active: Optional[CycleProfile] = None
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time a block as a named phase of the active cycle, if there is one."""
+    profile = _active
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(name, time.perf_counter() - start)
+
+
+def add_phase(name: str, seconds: float) -> None:
+    if _active is not None:
+        _active.add_phase(name, seconds)
+
+
+def record_room_fetch(room_id: str, seconds: float) -> None:
+    if _active is not None:
+        _active.record_room_fetch(room_id, seconds)
+
+
+def record_query(seconds: float) -> None:
+    if _active is not None:
+        _active.record_query(seconds)
+
+
+def annotate(**values: Any) -> None:
+    """Attach extra values (e.g. update counts) to the active cycle's report."""
+    if _active is not None:
+        _active.extra.update(values)
+
+
+class CycleProfiler:
+    """
+    Produce a timing report for every scrape cycle.
+
+    Reports are logged as one JSON line each, kept in a ring buffer and
+    written to PROFILE_DIR/cycles.json for the API to serve. When armed (via
+    PROFILE_CYCLES or the trigger file), the cycle is also run under cProfile
+    and its stats dumped to PROFILE_DIR/cycle-<timestamp>.pstats.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = PROFILE_DIR,
+        history: int = 60,
+        cprofile_cycles: int = 0,
+    ):
+        self.directory = directory
+        self.reports: deque = deque(maxlen=history)
+        self.cprofile_cycles = cprofile_cycles
+        # Resetting the peak RSS for each cycle also resets the kernel's
+        # lifetime peak (VmHWM and ru_maxrss), so the process's peak is kept
+        # here as the maximum of the peaks read before every reset
+        self.peak_rss_kb = _peak_rss_kb()
+
+    def _update_peak_rss(self) -> int:
+        self.peak_rss_kb = max(self.peak_rss_kb, _peak_rss_kb())
+        return self.peak_rss_kb
+
+    def _check_trigger(self) -> None:
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, TRIGGER_FILE)
+        try:
+            with open(path) as f:
+                cycles = int(f.read().strip() or 1)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring invalid profile trigger {path}: {str(e)}")
+            return
+        self.cprofile_cycles += cycles
+        logger.info(f"Profiling the next {self.cprofile_cycles} cycle(s)")
+
+    @contextmanager
+    def cycle(self) -> Iterator[CycleProfile]:
+        """Profile the cycle run inside the block."""
+        global _active
+        self._check_trigger()
+        self._update_peak_rss()  # Covers the time since the last cycle
+        profile = CycleProfile()
+        profiler = None
+        if self.cprofile_cycles > 0 and self.directory:
+            self.cprofile_cycles -= 1
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        _active = profile
+        try:
+            yield profile
+        except Exception as e:
+            profile.extra["error"] = str(e)
+            raise
+        finally:
+            _active = None
+            if profiler is not None:
+                profiler.disable()
+                self._dump_stats(profiler, profile)
+            report = profile.report()
+            report["processPeakRssKb"] = self._update_peak_rss()
+            self._publish(report)
+
+    def _dump_stats(self, profiler: cProfile.Profile, profile: CycleProfile) -> None:
+        stamp = profile.started_at.strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(self.directory, f"cycle-{stamp}.pstats")
+        try:
+            profiler.dump_stats(path)
+            logger.info(f"Wrote cycle profile to {path}")
+        except OSError as e:
+            logger.warning(f"Could not write cycle profile: {str(e)}")
+
+    def _publish(self, report: Dict[str, Any]) -> None:
+        self.reports.append(report)
+        logger.info(json.dumps({"cycleReport": report}, separators=(",", ":")))
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, REPORTS_FILE)
+        try:
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(list(self.reports), f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not write cycle reports: {str(e)}")
+
+
+def read_reports(directory: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Read the ring buffer of cycle reports written by the scheduler.
+
+    Args:
+        directory: Directory holding the reports (defaults to PROFILE_DIR)
+
+    Raises:
+        FileNotFoundError: If no cycle has been reported yet
+    """
+    with open(os.path.join(directory or PROFILE_DIR, REPORTS_FILE)) as f:
+        return json.load(f)
@@ -0,0 +1,310 @@
+import base64
+import binascii
+import json
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from peewee import JOIN
+
+from core.database import Location, Room, Machine
+
+# Fields exposed by the read API at each level of the location tree
+LOCATION_FIELDS = (
+    "locationId",
+    "description",
+    "label",
+    "dryerCount",
+    "washerCount",
+    "machineCount",
+    "lastUpdated",
+)
+ROOM_FIELDS = (
+    "roomId",
+    "connected",
+    "description",
+    "label",
+    "dryerCount",
+    "washerCount",
+    "machineCount",
+    "freePlay",
+    "lastUpdated",
+)
+MACHINE_FIELDS = (
+    "licensePlate",
+    "qrCodeId",
+    "lastUser",
+    "available",
+    "type",
+    "timeRemaining",
+    "mode",
+    "lastUpdated",
+)
+
+
+# Key of an empty room in the (roomId, machine id) page order: before any
+# machine id, so an empty room takes one slot of a page, like a machine
+EMPTY_ROOM_PK = 0
+
+
+class QueryError(ValueError):
+    """Raised when projection or pagination parameters are invalid."""
+
+
+def parse_fields(
+    raw: Optional[str], allowed: Sequence[str], name: str
+) -> Tuple[str, ...]:
+    """
+    Parse a comma separated field projection.
+
+    Args:
+        raw: Raw query parameter value (None or empty selects every field)
+        allowed: Fields that may be requested
+        name: Parameter name, used in error messages
+
+    Returns:
+        tuple: Requested fields in the order given, without duplicates
+
+    Raises:
+        QueryError: If an unknown field is requested
+    """
+    if not raw:
+        return tuple(allowed)
+
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise QueryError(f"Unknown {name}: {', '.join(unknown)}")
+    return fields or tuple(allowed)
+
+
+def parse_limit(raw: Optional[str]) -> Optional[int]:
+    """Parse the page size parameter; None means no pagination."""
+    if raw is None or raw == "":
+        return None
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    if limit <= 0:
+        raise QueryError("limit must be positive")
+    return limit
+
+
+def encode_cursor(room_id: str, machine_pk: int) -> str:
+    """Encode the position of the last returned machine as an opaque cursor."""
+    payload = json.dumps([room_id, machine_pk], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        QueryError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        room_id, machine_pk = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise QueryError("Invalid cursor")
+    if not isinstance(room_id, str) or not isinstance(machine_pk, int):
+        raise QueryError("Invalid cursor")
+    return room_id, machine_pk
+
+
+def _columns(model, fields: Iterable[str], *required: str) -> List[Any]:
+    names = dict.fromkeys(required)
+    names.update(dict.fromkeys(fields))
+    return [getattr(model, name) for name in names]
+
+
+def fetch_locations(
+    room_id: Optional[str] = None,
+    machine_id: Optional[str] = None,
+    location_fields: Sequence[str] = LOCATION_FIELDS,
+    room_fields: Sequence[str] = ROOM_FIELDS,
+    machine_fields: Sequence[str] = MACHINE_FIELDS,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetch the location tree, selecting only the requested columns.
+
+    Machines are paginated in (roomId, id) order. A page holds at most `limit`
+    entries, each a machine or a room without machines, and only the rooms
+    and locations of those entries, so a room may be split across
+    consecutive pages. Paging through every page thus returns every room the
+    unpaginated response does; rooms without machines are left out when
+    filtering by machine.
+
+    Args:
+        room_id: Only include this room
+        machine_id: Only include the machine with this license plate or QR code
+        location_fields: Location fields to return
+        room_fields: Room fields to return
+        machine_fields: Machine fields to return
+        limit: Maximum number of machines in the page
+        cursor: Cursor returned with the previous page
+
+    Returns:
+        tuple: A tuple containing:
+            - list: Location objects with nested rooms and machines
+            - str or None: Cursor for the next page, if there is one
+    """
+    locations = (
+        Location.select(*_columns(Location, location_fields, "locationId"))
+        .order_by(Location.locationId)
+        .dicts()
+    )
+
+    rooms = Room.select(*_columns(Room, room_fields, "roomId", "locationId")).order_by(
+        Room.roomId
+    )
+    machines = Machine.select(
+        *_columns(Machine, machine_fields, "id", "roomId")
+    ).order_by(Machine.roomId, Machine.id)
+
+    if room_id:
+        rooms = rooms.where(Room.roomId == room_id)
+        machines = machines.where(Machine.roomId == room_id)
+    if machine_id:
+        machines = machines.where(
+            (Machine.licensePlate == machine_id) | (Machine.qrCodeId == machine_id)
+        )
+    if cursor:
+        after_room, after_pk = decode_cursor(cursor)
+        machines = machines.where(
+            (Machine.roomId > after_room)
+            | ((Machine.roomId == after_room) & (Machine.id > after_pk))
+        )
+    if limit:
+        machines = machines.limit(limit + 1)
+
+    machine_rows = list(machines.dicts())
+    if (limit or cursor) and not machine_id:
+        empty_rooms = (
+            Room.select(Room.roomId)
+            .join(Machine, JOIN.LEFT_OUTER)
+            .where(Machine.id.is_null())
+            .order_by(Room.roomId)
+        )
+        if room_id:
+            empty_rooms = empty_rooms.where(Room.roomId == room_id)
+        if cursor:
+            empty_rooms = empty_rooms.where(Room.roomId > after_room)
+        if limit:
+            empty_rooms = empty_rooms.limit(limit + 1)
+        machine_rows = with_empty_rooms(
+            machine_rows, [room.roomId for room in empty_rooms], limit
+        )
+
+    machine_rows, next_cursor = paginate(machine_rows, limit)
+    result = build_tree(
+        locations,
+        rooms.dicts(),
+        machine_rows,
+        location_fields,
+        room_fields,
+        machine_fields,
+        room_filtered=bool(room_id),
+        machines_narrowed=bool(machine_id or limit or cursor),
+    )
+    return result, next_cursor
+
+
+def with_empty_rooms(
+    machine_rows: List[Dict[str, Any]],
+    empty_room_ids: Iterable[str],
+    limit: Optional[int],
+) -> List[Dict[str, Any]]:
+    """
+    Merge rooms without machines into machine rows in (roomId, id) order.
+
+    Each empty room becomes a row keyed (roomId, EMPTY_ROOM_PK), which
+    build_tree turns into a room with no machines. Both inputs hold at most
+    limit + 1 rows in order, and so does the result.
+    """
+    rows = machine_rows + [
+        {"roomId": room_id, "id": EMPTY_ROOM_PK} for room_id in empty_room_ids
+    ]
+    rows.sort(key=lambda row: (row["roomId"], row["id"]))
+    return rows[: limit + 1] if limit else rows
+
+
+def paginate(
+    machine_rows: List[Dict[str, Any]], limit: Optional[int]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Cut up to limit + 1 machine (or empty room) rows in (roomId, id) order
+    down to one page.
+
+    Returns:
+        tuple: The page's rows, and the cursor for the next page if there is one
+    """
+    if limit and len(machine_rows) > limit:
+        machine_rows = machine_rows[:limit]
+        last = machine_rows[-1]
+        return machine_rows, encode_cursor(last["roomId"], last["id"])
+    return machine_rows, None
+
+
+def build_tree(
+    locations: Iterable[Mapping[str, Any]],
+    rooms: Iterable[Mapping[str, Any]],
+    machine_rows: Iterable[Mapping[str, Any]],
+    location_fields: Sequence[str],
+    room_fields: Sequence[str],
+    machine_fields: Sequence[str],
+    room_filtered: bool = False,
+    machines_narrowed: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Nest machine rows under their rooms and rooms under their locations.
+
+    Rows may hold more columns than requested; only the requested fields are
+    copied into the result.
+
+    Args:
+        locations: Location rows in locationId order
+        rooms: Room rows (with locationId) in roomId order
+        machine_rows: Machine rows (with roomId) in (roomId, id) order, and
+            rows from with_empty_rooms for rooms without machines
+        location_fields: Location fields to return
+        room_fields: Room fields to return
+        machine_fields: Machine fields to return
+        room_filtered: Rooms were filtered, so locations without rooms are dropped
+        machines_narrowed: Machines were filtered or paginated, so rooms not in
+            machine_rows are dropped too
+    """
+    machines_by_room: Dict[str, List[Dict[str, Any]]] = {}
+    for machine in machine_rows:
+        room_machines = machines_by_room.setdefault(machine["roomId"], [])
+        if machine.get("id") != EMPTY_ROOM_PK:
+            room_machines.append({field: machine[field] for field in machine_fields})
+
+    rooms_by_location: Dict[str, List[Mapping[str, Any]]] = {}
+    for room in rooms:
+        rooms_by_location.setdefault(room["locationId"], []).append(room)
+
+    filtered = room_filtered or machines_narrowed
+
+    result = []
+    for location in locations:
+        loc_data = {field: location[field] for field in location_fields}
+        loc_data["rooms"] = {}
+
+        for room in rooms_by_location.get(location["locationId"], ()):
+            room_machines = machines_by_room.get(room["roomId"])
+            if room_machines is None:
+                if machines_narrowed:
+                    continue
+                room_machines = []
+
+            room_data = {field: room[field] for field in room_fields}
+            room_data["machines"] = room_machines
+            loc_data["rooms"][room["roomId"]] = room_data
+
+        if not filtered or loc_data["rooms"]:
+            result.append(loc_data)
+
+    return result
@@ -0,0 +1,194 @@
+from typing import Any, Dict, Iterator, List, Mapping, Tuple
+
+
+class Record:
+    """
+    Fixed-field record built from an upstream API payload.
+
+    Subclasses list their columns in FIELDS and use them as __slots__, so a
+    record stores one pointer per field instead of a dict with its own keys.
+    Values nested one level down in the payload are addressed by joining the
+    keys with "_" (e.g. "capability_addTime"), matching the model columns. A dict view
+    (record["field"], get, keys, items, `**record`) is kept for code that
+    treats scraped data as dicts.
+    """
+
+    __slots__ = ()
+    FIELDS: Tuple[str, ...] = ()
+    # Top-level payload keys, and (object key, ((field, key), ...)) for the
+    # fields nested one level down
+    _FLAT: Tuple[str, ...] = ()
+    _NESTED: Tuple[Tuple[str, Tuple[Tuple[str, str], ...]], ...] = ()
+    _FIELD_SET: frozenset = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        nested: Dict[str, List[Tuple[str, str]]] = {}
+        for name in cls.FIELDS:
+            if "_" in name:
+                parent, key = name.split("_", 1)
+                nested.setdefault(parent, []).append((name, key))
+        cls._FLAT = tuple(name for name in cls.FIELDS if "_" not in name)
+        cls._NESTED = tuple((parent, tuple(keys)) for parent, keys in nested.items())
+        cls._FIELD_SET = frozenset(cls.FIELDS)
+
+    def __init__(self, **values: Any):
+        for name in self.FIELDS:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def from_api(cls, payload: Mapping[str, Any]) -> "Record":
+        """
+        Build a record from an API payload, ignoring keys without a field.
+
+        Fields missing from the payload (or below a null object) are None.
+        """
+        record = cls.__new__(cls)
+        get = payload.get
+        for name in cls._FLAT:
+            setattr(record, name, get(name))
+        for parent, keys in cls._NESTED:
+            child = get(parent)
+            if isinstance(child, dict):
+                for name, key in keys:
+                    setattr(record, name, child.get(key))
+            else:
+                for name, _ in keys:
+                    setattr(record, name, None)
+        return record
+
+    def values(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    def _diff(self, existing: Any, exclude: Tuple[str, ...]) -> Iterator[str]:
+        old = getattr(existing, "__data__", None)
+        for name in self.FIELDS:
+            if name in exclude:
+                continue
+            if old is not None:
+                old_value = old.get(name)
+            else:
+                old_value = getattr(existing, name, None)
+            if getattr(self, name) != old_value:
+                yield name
+
+    def changed_fields(self, existing: Any, exclude: Tuple[str, ...] = ()) -> List[str]:
+        """
+        List the fields whose value differs from `existing`.
+
+        Args:
+            existing: Another record, or a model instance; model instances are
+                compared on their raw column values, so foreign keys are
+                compared by ID without loading the related row
+            exclude: Fields to ignore
+        """
+        return list(self._diff(existing, exclude))
+
+    def differs_from(self, existing: Any, exclude: Tuple[str, ...] = ()) -> bool:
+        """Return True if any field differs from `existing`; see changed_fields."""
+        return next(self._diff(existing, exclude), None) is not None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    # Dict view
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self._FIELD_SET:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in self._FIELD_SET:
+            return default
+        return getattr(self, key)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.FIELDS
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return ((name, getattr(self, name)) for name in self.FIELDS)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._FIELD_SET
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.FIELDS)
+
+    def __len__(self) -> int:
+        return len(self.FIELDS)
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.values() == other.values()
+
+    __hash__ = None  # Mutable through the dict view
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={value!r}" for name, value in self.items())
+        return f"{type(self).__name__}({fields})"
+
+
+class LocationRecord(Record):
+    FIELDS = (
+        "locationId",
+        "description",
+        "dryerCount",
+        "label",
+        "machineCount",
+        "washerCount",
+    )
+    __slots__ = FIELDS
+
+
+class RoomRecord(Record):
+    FIELDS = (
+        "roomId",
+        "connected",
+        "description",
+        "dryerCount",
+        "freePlay",
+        "label",
+        "locationId",
+        "machineCount",
+        "washerCount",
+    )
+    __slots__ = FIELDS
+
+
+class MachineRecord(Record):
+    FIELDS = (
+        "opaqueId",
+        "available",
+        "capability_addTime",
+        "capability_showAddTimeNotice",
+        "capability_showSettings",
+        "controllerType",
+        "display",
+        "doorClosed",
+        "freePlay",
+        "groupId",
+        "inService",
+        "licensePlate",
+        "location",
+        "mode",
+        "nfcId",
+        "notAvailableReason",
+        "qrCodeId",
+        "roomId",
+        "settings_cycle",
+        "settings_dryerTemp",
+        "settings_soil",
+        "settings_washerTemp",
+        "stackItems",
+        "stickerNumber",
+        "timeRemaining",
+        "type",
+    )
+    __slots__ = FIELDS
@@ -0,0 +1,217 @@
+import glob
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, Optional, Tuple
+
+import requests
+
+# Start a new segment file after this many seconds of recording
+SEGMENT_SECONDS = 3600
+SEGMENT_PATTERN = "segment-*.rec.gz"
+# How far past the virtual time a replay may look for a url it has not served
+# yet, in recorded seconds; about one scrape interval
+LOOKAHEAD_SECONDS = 60
+
+# (timestamp, url, status code, raw body)
+Record = Tuple[float, str, int, bytes]
+
+
+class RecordedResponse:
+    """Replayed upstream response with the parts of requests.Response we use."""
+
+    def __init__(self, url: str, status_code: int, content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(
+                f"{self.status_code} Error for url: {self.url}", response=self
+            )
+
+
+class RecordingTransport:
+    """
+    Transport that records every upstream response while passing it through.
+
+    Records are appended to gzip-compressed segment files in `directory`,
+    one new segment every `segment_seconds`. Each record is a JSON header line
+    ({"t": timestamp, "url": ..., "status": ..., "size": n}) followed by the n
+    raw body bytes and a newline.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        inner=None,
+        segment_seconds: float = SEGMENT_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.directory = directory
+        self.inner = inner
+        self.segment_seconds = segment_seconds
+        self.clock = clock
+        self._file = None
+        self._segment_started = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url: str):
+        response = (self.inner or requests).get(url)
+        self.record(url, response.status_code, response.content)
+        return response
+
+    def record(self, url: str, status_code: int, content: bytes) -> None:
+        now = self.clock()
+        header = json.dumps(
+            {"t": now, "url": url, "status": status_code, "size": len(content)},
+            separators=(",", ":"),
+        ).encode()
+        with self._lock:
+            if (
+                self._file is None
+                or now - self._segment_started >= self.segment_seconds
+            ):
+                self._rotate(now)
+            self._file.write(header + b"\n" + content + b"\n")
+
+    def _rotate(self, now: float) -> None:
+        if self._file is not None:
+            self._file.close()
+        path = os.path.join(self.directory, f"segment-{int(now * 1000):015d}.rec.gz")
+        self._file = gzip.open(path, "ab", compresslevel=6)
+        self._segment_started = now
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_records(directory: str) -> Iterator[Record]:
+    """Yield recorded responses from all segments in time order."""
+    for path in sorted(glob.glob(os.path.join(directory, SEGMENT_PATTERN))):
+        try:
+            with gzip.open(path, "rb") as f:
+                while True:
+                    line = f.readline()
+                    if not line:
+                        break
+                    header = json.loads(line)
+                    content = f.read(header["size"])
+                    f.read(1)  # Record separator
+                    if len(content) < header["size"]:
+                        break  # Truncated by an unclean shutdown
+                    yield header["t"], header["url"], header["status"], content
+        except (EOFError, OSError, ValueError):
+            continue  # Unfinished gzip stream; keep the records read so far
+
+
+class ReplayTransport:
+    """
+    Transport that serves recorded responses on a virtual clock.
+
+    The virtual clock starts at the first recording and advances `speed`
+    times faster than real time. get(url) returns the latest response for the
+    url recorded at or before the virtual time, so scrape_location sees the
+    data the way it looked at that moment. Records are streamed from disk and
+    only the latest response per url is kept in memory.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        speed: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.speed = speed
+        self.clock = clock
+        self._records = read_records(directory)
+        # Records read from disk that are not yet due, in time order
+        self._pending: Deque[Record] = deque()
+        self._read_all = False
+        self._latest: Dict[str, Record] = {}
+        self._started: Optional[Tuple[float, float]] = None
+        self._lock = threading.Lock()
+        self.exhausted = False
+        self._read()
+
+    def _read(self) -> bool:
+        """Read the next record from disk into _pending; False at the end."""
+        record = next(self._records, None)
+        if record is None:
+            self._read_all = True
+            return False
+        self._pending.append(record)
+        return True
+
+    def _lookahead(self, url: str, until: float) -> Optional[Record]:
+        """
+        Find the first pending record for `url` up to `until` without applying
+        it or any other record, so other urls keep serving current data.
+        """
+        index = 0
+        while True:
+            if index == len(self._pending) and (self._read_all or not self._read()):
+                return None
+            record = self._pending[index]
+            if record[0] > until:
+                return None
+            if record[1] == url:
+                return record
+            index += 1
+
+    def virtual_time(self) -> Optional[float]:
+        """Recording time the replay has reached, or None before the first get."""
+        if self._started is None:
+            return None
+        real_start, virtual_start = self._started
+        return virtual_start + (self.clock() - real_start) * self.speed
+
+    def get(self, url: str) -> RecordedResponse:
+        with self._lock:
+            if self._started is None and self._pending:
+                self._started = (self.clock(), self._pending[0][0])
+
+            now = self.virtual_time()
+            while self._pending and self._pending[0][0] <= now:
+                record = self._pending.popleft()
+                self._latest[record[1]] = record
+                if not self._pending:
+                    self._read()
+            self.exhausted = self._read_all and not self._pending
+
+            record = self._latest.get(url)
+            # A url first recorded just after the virtual time (e.g. a room
+            # fetched after its location) is served from its next record
+            if record is None and now is not None:
+                record = self._lookahead(url, now + LOOKAHEAD_SECONDS)
+        if record is None:
+            return RecordedResponse(url, 404, b"null")
+        return RecordedResponse(url, record[2], record[3])
+
+
+def summarize(directory: str) -> Dict:
+    """Count records and distinct urls, and find the recorded time span."""
+    count, first, last, urls = 0, None, None, set()
+    for timestamp, url, _, _ in read_records(directory):
+        count += 1
+        first = timestamp if first is None else first
+        last = timestamp
+        urls.add(url)
+    return {"records": count, "urls": len(urls), "start": first, "end": last}
+
+
+if __name__ == "__main__":
+    summary = summarize(sys.argv[1] if len(sys.argv) > 1 else ".")
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,184 @@
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LAG_SECONDS = metrics.REGISTRY.histogram(
+    "cscgo_scheduler_lag_seconds",
+    "Delay between a job's scheduled tick and its start",
+    ("job",),
+)
+SCHEDULER_MISSED_TICKS = metrics.REGISTRY.counter(
+    "cscgo_scheduler_missed_ticks_total",
+    "Ticks skipped because the previous run was still in progress or late",
+    ("job",),
+)
+
+
+class Job:
+    """A function run on fixed ticks at `start + k * interval`."""
+
+    def __init__(
+        self,
+        func: Callable[..., Any],
+        interval: float,
+        name: str,
+        args: tuple,
+        next_tick: float,
+    ):
+        self.func = func
+        self.interval = interval
+        self.name = name
+        self.args = args
+        self.next_tick = next_tick
+        self.future: Optional[Future] = None
+        self.runs = 0
+        self.missed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_duration: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self.future is not None and not self.future.done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "runs": self.runs,
+            "missed": self.missed,
+            "lastLag": self.last_lag,
+            "maxLag": self.max_lag,
+            "lastDuration": self.last_duration,
+            "running": self.running,
+            "nextTick": self.next_tick,
+        }
+
+
+class FixedRateScheduler:
+    """
+    Run jobs on fixed wall-clock ticks using a worker pool.
+
+    Unlike rescheduling at the end of each run, tick times do not depend on how
+    long a run takes, so the cadence does not drift. A tick that arrives while
+    the job's previous run is still in progress is skipped, and ticks that pass
+    entirely while the scheduler is late are coalesced into one run. Both are
+    counted as missed.
+    """
+
+    def __init__(
+        self, max_workers: int = 4, clock: Callable[[], float] = time.time
+    ) -> None:
+        self.clock = clock
+        self.jobs: List[Job] = []
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="scheduler"
+        )
+        self._stop = threading.Event()
+
+    def add_job(
+        self,
+        func: Callable[..., Any],
+        interval: float,
+        name: Optional[str] = None,
+        args: tuple = (),
+        align: bool = False,
+    ) -> Job:
+        """
+        Register a job.
+
+        Args:
+            func: Function to run
+            interval: Seconds between ticks
+            name: Name used in logs and metrics (defaults to the function name)
+            args: Positional arguments for func
+            align: Start on the next multiple of interval since the epoch
+                instead of immediately
+
+        Returns:
+            Job: The registered job
+        """
+        now = self.clock()
+        first_tick = math.ceil(now / interval) * interval if align else now
+        job = Job(func, interval, name or func.__name__, args, first_tick)
+        self.jobs.append(job)
+        return job
+
+    def tick(self) -> Optional[float]:
+        """
+        Start every job whose tick is due.
+
+        Returns:
+            float or None: Seconds until the next tick, or None without jobs
+        """
+        now = self.clock()
+        for job in self.jobs:
+            if job.next_tick > now + job.interval:
+                # Wall clock moved backwards; restart the sequence from now
+                job.next_tick = now
+            if job.next_tick > now:
+                continue
+
+            lag = now - job.next_tick
+            # Ticks that passed entirely while we were late are coalesced
+            late_ticks = int(lag // job.interval)
+            job.next_tick += (late_ticks + 1) * job.interval
+
+            if job.running:
+                self._miss(job, late_ticks + 1, "previous run still in progress")
+                continue
+            if late_ticks:
+                self._miss(job, late_ticks, f"scheduler {lag:.2f}s late")
+
+            job.last_lag = lag
+            job.max_lag = max(job.max_lag, lag)
+            SCHEDULER_LAG_SECONDS.observe(lag, job=job.name)
+            job.future = self._executor.submit(self._run, job)
+
+        if not self.jobs:
+            return None
+        return max(0.0, min(job.next_tick for job in self.jobs) - self.clock())
+
+    def _miss(self, job: Job, count: int, reason: str) -> None:
+        job.missed += count
+        SCHEDULER_MISSED_TICKS.inc(count, job=job.name)
+        logger.warning(
+            f"Skipped {count} tick(s) of job {job.name}: {reason} "
+            f"(missed {job.missed} in total)"
+        )
+
+    def _run(self, job: Job) -> None:
+        start = time.perf_counter()
+        try:
+            job.func(*job.args)
+        except Exception as e:
+            logger.error(f"Job {job.name} failed: {str(e)}", exc_info=True)
+        finally:
+            job.runs += 1
+            job.last_duration = time.perf_counter() - start
+            if job.last_duration > job.interval:
+                logger.warning(
+                    f"Job {job.name} took {job.last_duration:.2f}s, "
+                    f"longer than its {job.interval}s interval"
+                )
+
+    def run(self) -> None:
+        """Run the scheduler loop until stop() is called."""
+        while not self._stop.is_set():
+            delay = self.tick()
+            self._stop.wait(delay if delay is not None else 1.0)
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop the loop and shut down the worker pool."""
+        self._stop.set()
+        self._executor.shutdown(wait=wait)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [job.stats() for job in self.jobs]
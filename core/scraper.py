@@ -1,5 +1,13 @@
+import hashlib
+import json
+import threading
+import time
 import requests
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from operator import attrgetter
+from core import profiling
+from core.metrics import FLATTEN_SECONDS, ROOM_DIGESTS, ROOM_FETCH_SECONDS
+from core.records import LocationRecord, MachineRecord, RoomRecord
 
 BASE_URL = "https://mycscgo.com/api/v3/location"
 LOCATION_ID = "07cfb089-a19f-40c6-a6a7-5874aeb64d1b"
@@ -31,12 +39,79 @@ def flatten_dict(d, parent_key="", sep="_"):
     return dict(items)
 
 
-def get_location_data(location_id):
+def response_digest(response):
+    """
+    Digest a response body, so identical payloads can be recognized cheaply.
+
+    The raw body bytes are hashed when available; otherwise the parsed JSON is
+    hashed in canonical form.
+    """
+    content = getattr(response, "content", None)
+    if not isinstance(content, bytes):
+        content = json.dumps(
+            response.json(), sort_keys=True, separators=(",", ":")
+        ).encode()
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+class RoomDigests:
+    """
+    Digests of each room's machines payload as of the last persisted cycle.
+
+    During a scrape every room's new digest is recorded as pending and
+    compared with the committed one; rooms whose payload is unchanged skip
+    parsing, flattening and persistence. Call commit() once the cycle's data
+    is persisted, or discard() if it may not have been.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._committed = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def check(self, room_id, digest):
+        """Record a room's digest for this cycle; return True if it is unchanged."""
+        with self._lock:
+            self._pending[room_id] = digest
+            unchanged = self._committed.get(room_id) == digest
+            if unchanged:
+                self.hits += 1
+            else:
+                self.misses += 1
+        ROOM_DIGESTS.inc(result="hit" if unchanged else "miss")
+        return unchanged
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def commit(self):
+        """
+        Make this cycle's digests the baseline for the next one.
+
+        Rooms not scraped this cycle (e.g. moved to another shard) are
+        forgotten, so they are persisted in full if they come back.
+        """
+        with self._lock:
+            self._committed, self._pending = self._pending, {}
+
+    def discard(self):
+        """Forget all digests, so the next cycle persists every room."""
+        with self._lock:
+            self._committed, self._pending = {}, {}
+
+
+def get_location_data(location_id, transport=None):
     """
     Fetch all rooms for the given location from the API.
 
     Args:
         location_id (str): Unique identifier for the location
+        transport (optional): Object with a requests-style get(url); defaults
+            to the requests module
 
     Returns:
         dict: Location data including sorted rooms list. Format:
@@ -57,7 +132,7 @@ def get_location_data(location_id):
         requests.exceptions.RequestException: If API request fails
     """
     url = f"{BASE_URL}/{location_id}"
-    response = requests.get(url)
+    response = (transport or requests).get(url)
     response.raise_for_status()
 
     location_data = response.json()
@@ -67,15 +142,20 @@ def get_location_data(location_id):
     return location_data
 
 
-def get_machines(room):
+def get_machines(room, transport=None, digests=None):
     """
     Fetch all machines for the given room from the API.
 
     Args:
         room (dict): Room dictionary containing 'locationId' and 'roomId'
+        transport (optional): Object with a requests-style get(url); defaults
+            to the requests module
+        digests (RoomDigests, optional): Payload digests from the previous
+            cycle; an unchanged payload is not parsed
 
     Returns:
-        list: Sorted list of machine dictionaries, sorted by type and sticker number.
+        list: Sorted list of machine dictionaries, sorted by type and sticker number,
+            or None if `digests` shows the room is unchanged.
             [
                 {
                     "type": str,
@@ -90,14 +170,20 @@ def get_machines(room):
         requests.exceptions.RequestException: If API request fails
     """
     url = f"{BASE_URL}/{room['locationId']}/room/{room['roomId']}/machines"
-    response = requests.get(url)
+    start = time.perf_counter()
+    response = (transport or requests).get(url)
+    elapsed = time.perf_counter() - start
+    ROOM_FETCH_SECONDS.observe(elapsed)
+    profiling.record_room_fetch(room["roomId"], elapsed)
     response.raise_for_status()
+    if digests is not None and digests.check(room["roomId"], response_digest(response)):
+        return None
     return sorted(
         response.json(), key=lambda machine: (machine["type"], machine["stickerNumber"])
     )
 
 
-def scrape_location(location_id):
+def scrape_location(location_id, room_filter=None, transport=None, digests=None):
     """
     Scrape location, rooms, and machines data concurrently from the API.
 
@@ -106,12 +192,21 @@ def scrape_location(location_id):
 
     Args:
         location_id (str): Unique identifier for the location
+        room_filter (callable, optional): Predicate on a room dictionary; only
+            matching rooms are returned and have their machines fetched
+        transport (optional): Object with a requests-style get(url) used for
+            all API calls; defaults to the requests module
+        digests (RoomDigests, optional): Payload digests from the previous
+            cycle; machines of rooms whose payload is unchanged are left out
 
     Returns:
         tuple: Contains three elements:
-            - dict: Location data (without rooms)
-            - list: Room data sorted by roomId
-            - list: Flattened machine data sorted by type and sticker number
+            - LocationRecord: Location data (without rooms)
+            - list: RoomRecords sorted by roomId
+            - list: MachineRecords (flattened machine data) sorted by type and
+              sticker number (only for changed rooms when `digests` is given)
+
+        Records support the dict-style access shown below.
 
     Example Return Format:
         (
@@ -142,19 +237,42 @@ def scrape_location(location_id):
     Raises:
         requests.exceptions.RequestException: If any API request fails
     """
-    location_data = get_location_data(location_id)
+    with profiling.phase("location_fetch"):
+        location_data = get_location_data(location_id, transport)
     rooms = location_data.pop("rooms")
+    if room_filter is not None:
+        rooms = [room for room in rooms if room_filter(room)]
+    location_data = LocationRecord.from_api(location_data)
     machines = []
+    flatten_seconds = 0.0
+    unchanged_rooms = 0
 
-    with ThreadPoolExecutor(max_workers=len(rooms)) as executor:
-        future_to_room = {executor.submit(get_machines, room): room for room in rooms}
+    with profiling.phase("machine_fetch"), ThreadPoolExecutor(
+        max_workers=max(len(rooms), 1)
+    ) as executor:
+        future_to_room = {
+            executor.submit(get_machines, room, transport, digests): room
+            for room in rooms
+        }
 
         for future in as_completed(future_to_room):
-            machines.extend(map(flatten_dict, future.result()))
+            result = future.result()
+            if result is None:
+                unchanged_rooms += 1
+                continue
+            start = time.perf_counter()
+            machines.extend(map(MachineRecord.from_api, result))
+            flatten_seconds += time.perf_counter() - start
+
+    FLATTEN_SECONDS.observe(flatten_seconds)
+    profiling.add_phase("flatten", flatten_seconds)
+    if digests is not None:
+        profiling.annotate(unchangedRooms=unchanged_rooms)
 
-    machines.sort(key=lambda machine: (machine["type"], machine["stickerNumber"]))
+    with profiling.phase("sort"):
+        machines.sort(key=attrgetter("type", "stickerNumber"))
 
-    return location_data, rooms, machines
+    return location_data, [RoomRecord.from_api(room) for room in rooms], machines
 
 
 if __name__ == "__main__":
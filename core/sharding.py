@@ -0,0 +1,40 @@
+import bisect
+import hashlib
+from typing import Iterable, List, Optional, Tuple
+
+# Points per worker on the ring; more points give a more even split
+VIRTUAL_NODES = 64
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys (room IDs) to workers.
+
+    When a worker joins or leaves, only the keys on its arcs of the ring move,
+    so the other workers keep (and keep caching) most of their rooms.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), virtual_nodes: int = VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+        self.nodes = sorted(set(nodes))
+        points: List[Tuple[int, str]] = sorted(
+            (_hash(f"{node}#{index}"), node)
+            for node in self.nodes
+            for index in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> Optional[str]:
+        """Return the worker owning `key`, or None if the ring is empty."""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+    def owns(self, node: str, key: str) -> bool:
+        return self.node_for(key) == node
@@ -0,0 +1,378 @@
+"""
+Shared snapshot of the location tree for database-free API reads.
+
+The scheduler publishes the tree after every cycle to a file (ideally on a
+tmpfs such as /dev/shm) by writing a new file and renaming it over the old
+one. API workers memory-map the current file, so every worker shares the
+same pages and none of them parses, compresses or queries anything for the
+unfiltered tree: its body is stored precompressed in every supported content
+encoding and sent straight from the file. Filtered requests are answered
+from row tables parsed once per snapshot version.
+
+File layout: a fixed header (magic, version, creation time, section count),
+a table of (name, offset, length) section entries, then the sections: the
+JSON body of the unfiltered GET / response ("identity"), the same body in
+each content encoding (e.g. "gzip"), and the JSON row tables ("tables") used
+for filtered and paginated requests.
+"""
+
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from werkzeug.http import http_date
+
+from core import metrics
+from core.compression import ENCODERS, PREFERRED
+from core.database import Location, Room, Machine
+from core.queries import (
+    LOCATION_FIELDS,
+    ROOM_FIELDS,
+    MACHINE_FIELDS,
+    build_tree,
+    decode_cursor,
+    paginate,
+    with_empty_rooms,
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+# Snapshots older than this (seconds) are ignored and reads go to the database
+MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "180"))
+
+MAGIC = b"CSCGOSN2"
+# magic, version, created (epoch seconds), number of sections
+HEADER = struct.Struct("<8sQdI")
+# name, offset from the start of the file, length
+SECTION = struct.Struct("<16sQQ")
+
+SNAPSHOT_READS = metrics.REGISTRY.counter(
+    "cscgo_snapshot_reads_total",
+    "Location tree reads served from the shared snapshot or the database",
+    ("source",),
+)
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is truncated or not a snapshot."""
+
+
+def _default(value: Any) -> Any:
+    # Same encoding as Flask's JSON provider, so snapshot responses match
+    # database ones byte for byte
+    if isinstance(value, datetime.date):
+        return http_date(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_body(value: Any) -> bytes:
+    """Encode a response body exactly like flask.jsonify outside debug mode."""
+    return (
+        json.dumps(value, default=_default, sort_keys=True, separators=(",", ":"))
+        + "\n"
+    ).encode()
+
+
+def _rows(model, fields: Sequence[str], *order) -> List[Dict[str, Any]]:
+    columns = [getattr(model, field) for field in fields]
+    return list(model.select(*columns).order_by(*order).dicts())
+
+
+def build_snapshot() -> Tuple[bytes, bytes]:
+    """
+    Read the full location tree from the database.
+
+    Returns:
+        tuple: The unfiltered response body and the encoded row tables
+    """
+    locations = _rows(Location, LOCATION_FIELDS, Location.locationId)
+    rooms = _rows(Room, ROOM_FIELDS + ("locationId",), Room.roomId)
+    machines = _rows(
+        Machine, ("id", "roomId") + MACHINE_FIELDS, Machine.roomId, Machine.id
+    )
+    body = encode_body(
+        build_tree(
+            locations, rooms, machines, LOCATION_FIELDS, ROOM_FIELDS, MACHINE_FIELDS
+        )
+    )
+    tables = json.dumps(
+        {"locations": locations, "rooms": rooms, "machines": machines},
+        default=_default,
+        separators=(",", ":"),
+    ).encode()
+    return body, tables
+
+
+def publish(path: str, clock: Callable[[], float] = time.time) -> int:
+    """
+    Build a snapshot and atomically replace the one at `path`.
+
+    The body is compressed here, once per snapshot, in every encoding in
+    core.compression. Readers holding the previous file keep their mapping
+    until they switch.
+
+    Returns:
+        int: Version of the published snapshot
+    """
+    body, tables = build_snapshot()
+    sections = {"identity": body}
+    for encoding, encoder in ENCODERS.items():
+        sections[encoding] = encoder(body)
+    sections["tables"] = tables
+
+    created = clock()
+    version = int(created * 1_000_000)
+    offset = HEADER.size + SECTION.size * len(sections)
+    entries = []
+    for name, data in sections.items():
+        entries.append(SECTION.pack(name.encode(), offset, len(data)))
+        offset += len(data)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, version, created, len(sections)))
+            f.writelines(entries)
+            f.writelines(sections.values())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return version
+
+
+class SnapshotTables:
+    """Row tables of one snapshot, indexed for the GET / filters."""
+
+    def __init__(self, data: Dict[str, List[Dict[str, Any]]]):
+        self.locations = data["locations"]
+        self.rooms = data["rooms"]
+        self.rooms_by_id = {room["roomId"]: room for room in self.rooms}
+        self.machines = sorted(data["machines"], key=lambda m: (m["roomId"], m["id"]))
+        self.keys = [(m["roomId"], m["id"]) for m in self.machines]
+        with_machines = {m["roomId"] for m in self.machines}
+        self.empty_room_ids = sorted(
+            room["roomId"] for room in self.rooms if room["roomId"] not in with_machines
+        )
+        # License plate or QR code -> positions in self.machines
+        self.by_code: Dict[str, List[int]] = {}
+        for position, machine in enumerate(self.machines):
+            for code in {machine["licensePlate"], machine["qrCodeId"]}:
+                if code is not None:
+                    self.by_code.setdefault(code, []).append(position)
+
+    def fetch_locations(
+        self,
+        room_id: Optional[str] = None,
+        machine_id: Optional[str] = None,
+        location_fields: Sequence[str] = LOCATION_FIELDS,
+        room_fields: Sequence[str] = ROOM_FIELDS,
+        machine_fields: Sequence[str] = MACHINE_FIELDS,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Same as core.queries.fetch_locations, answered from the snapshot."""
+        rooms = self.rooms
+        start, stop = 0, len(self.machines)
+        if room_id:
+            room = self.rooms_by_id.get(room_id)
+            rooms = [room] if room is not None else []
+            start = bisect_left(self.keys, (room_id,))
+            stop = bisect_left(self.keys, (room_id, float("inf")))
+        if cursor:
+            start = max(start, bisect_right(self.keys, decode_cursor(cursor)))
+
+        if machine_id:
+            positions = [
+                p for p in self.by_code.get(machine_id, ()) if start <= p < stop
+            ]
+        else:
+            positions = range(start, stop)
+        machine_rows = [
+            self.machines[p] for p in islice(positions, limit + 1 if limit else None)
+        ]
+        if (limit or cursor) and not machine_id:
+            empty = self.empty_room_ids
+            if room_id:
+                empty = [room_id] if room_id in empty else []
+            if cursor:
+                empty = empty[bisect_right(empty, decode_cursor(cursor)[0]) :]
+            machine_rows = with_empty_rooms(
+                machine_rows, empty[: limit + 1 if limit else None], limit
+            )
+
+        machine_rows, next_cursor = paginate(machine_rows, limit)
+        result = build_tree(
+            self.locations,
+            rooms,
+            machine_rows,
+            location_fields,
+            room_fields,
+            machine_fields,
+            room_filtered=bool(room_id),
+            machines_narrowed=bool(machine_id or limit or cursor),
+        )
+        return result, next_cursor
+
+
+class SectionFile:
+    """
+    Read-only file object over one section of a snapshot file.
+
+    The file is positioned at the section and reads stop at its end, so WSGI
+    file wrappers can send it with sendfile() (given the section length as
+    Content-Length) or read it in blocks.
+    """
+
+    def __init__(self, file, offset: int, length: int):
+        file.seek(offset)
+        self._file = file
+        self.length = length
+        self._remaining = length
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class Snapshot:
+    """A read-only mapping of one snapshot file."""
+
+    def __init__(self, buffer: mmap.mmap, path: Optional[str] = None, inode=None):
+        if len(buffer) < HEADER.size:
+            raise SnapshotError("Snapshot is truncated")
+        magic, self.version, self.created, count = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise SnapshotError("Not a snapshot file")
+        if len(buffer) < HEADER.size + SECTION.size * count:
+            raise SnapshotError("Snapshot is truncated")
+
+        self._sections: Dict[str, Tuple[int, int]] = {}
+        for index in range(count):
+            name, offset, length = SECTION.unpack_from(
+                buffer, HEADER.size + SECTION.size * index
+            )
+            if len(buffer) < offset + length:
+                raise SnapshotError("Snapshot is truncated")
+            self._sections[name.rstrip(b"\0").decode()] = (offset, length)
+        if "identity" not in self._sections or "tables" not in self._sections:
+            raise SnapshotError("Snapshot is missing sections")
+
+        # Content encodings the body is stored in, in server preference order
+        self.encodings = tuple(name for name in PREFERRED if name in self._sections)
+        self.path = path
+        self._inode = inode
+        self._view = memoryview(buffer)
+        self._tables: Optional[SnapshotTables] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str) -> "Snapshot":
+        with open(path, "rb") as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file
+                raise SnapshotError("Snapshot is truncated")
+            inode = os.fstat(f.fileno()).st_ino
+        return cls(buffer, path, inode)
+
+    def body(self, encoding: Optional[str] = None) -> memoryview:
+        """
+        Response body of the unfiltered GET /, as a view of the mapping.
+
+        Args:
+            encoding: Content encoding from self.encodings, or None for identity
+        """
+        offset, length = self._sections[encoding or "identity"]
+        return self._view[offset : offset + length]
+
+    def open_body(self, encoding: Optional[str] = None) -> Optional[SectionFile]:
+        """
+        Open the body as a file for sendfile(), or return None if the file
+        at self.path has been replaced since it was mapped.
+        """
+        if self.path is None:
+            return None
+        try:
+            file = open(self.path, "rb")
+        except OSError:
+            return None
+        if os.fstat(file.fileno()).st_ino != self._inode:
+            file.close()
+            return None
+        return SectionFile(file, *self._sections[encoding or "identity"])
+
+    @property
+    def tables(self) -> SnapshotTables:
+        """Row tables, parsed on first use."""
+        with self._lock:
+            if self._tables is None:
+                offset, length = self._sections["tables"]
+                raw = self._view[offset : offset + length].tobytes()
+                self._tables = SnapshotTables(json.loads(raw))
+            return self._tables
+
+
+class SnapshotReader:
+    """
+    Follow the snapshot file at `path`.
+
+    Each call stats the file and maps it again only after the scheduler has
+    replaced it; the previous mapping stays valid for requests still using it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_age: float = MAX_AGE,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+        self._snapshot: Optional[Snapshot] = None
+        self._key: Optional[Tuple[int, int, int]] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[Snapshot]:
+        """Return the current snapshot, or None if it is missing or stale."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key != self._key:
+                try:
+                    self._snapshot = Snapshot.open(self.path)
+                except (OSError, SnapshotError) as e:
+                    logger.warning(f"Could not map snapshot {self.path}: {str(e)}")
+                    self._snapshot = None
+                self._key = key
+            snapshot = self._snapshot
+
+        if snapshot is None or self.clock() - snapshot.created > self.max_age:
+            return None
+        return snapshot
+
+
+READER = SnapshotReader(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
@@ -0,0 +1,13 @@
+# Loaded automatically by gunicorn from the working directory
+
+
+def post_fork(server, worker):
+    """
+    Drop any database connection inherited from the master process, and
+    start loading this worker's next-available forecast index.
+    """
+    from core.database import reset_after_fork
+    from core.forecast import REFRESHER
+
+    reset_after_fork()
+    REFRESHER.start()
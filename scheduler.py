@@ -1,9 +1,16 @@
-import sched
+import os
+import signal
 import time
+import socket
 import logging
 import sys
-from core.scraper import scrape_location
-from core.database import Location, Room, Machine
+from core import metrics, profiling, snapshot
+from core.notify import MachineStateTracker, Notifier, SubscriberIndex, WebhookSink
+from core.replay import RecordingTransport, ReplayTransport
+from core.scheduling import FixedRateScheduler
+from core.scraper import RoomDigests, scrape_location
+from core.sharding import HashRing
+from core.database import Location, Room, Machine, Lease, Worker, db, init_db
 
 # Clear any existing handlers
 for handler in logging.root.handlers[:]:
@@ -29,80 +36,384 @@ stderr_handler.setFormatter(formatter)
 # Add handlers to the root logger
 logging.basicConfig(level=logging.DEBUG, handlers=[stdout_handler, stderr_handler])
 
-scheduler = sched.scheduler(time.time, time.sleep)
 LOCATION_ID = "07cfb089-a19f-40c6-a6a7-5874aeb64d1b"
 
+# Only the replica holding this lease scrapes the location
+LEASE_NAME = f"scrape:{LOCATION_ID}"
+LEASE_TTL = float(os.getenv("LEASE_TTL", "15"))
+# Longest persist transaction; each one fences and extends the lease first
+TRANSACTION_SECONDS = LEASE_TTL / 3
+# persist() outcomes
+PERSISTED, PARTIAL, FENCED = "persisted", "partial", "fenced"
+REPLICA_ID = f"{socket.gethostname()}:{os.getpid()}"
+lease_token = None  # Fencing token while we hold the lease
 
-def scheduled_scrape(interval: int) -> None:
+# In sharded mode every replica scrapes the rooms hashed to it instead
+SHARDING = os.getenv("SCRAPE_SHARDING", "").lower() in ("1", "true", "yes")
+WORKER_TTL = float(os.getenv("WORKER_TTL", "30"))
+shard_ring = None  # HashRing over the live workers
+
+# Per-cycle timing reports; PROFILE_CYCLES=K also cProfiles the first K cycles
+profiler = profiling.CycleProfiler(
+    history=int(os.getenv("PROFILE_HISTORY", "60")),
+    cprofile_cycles=int(os.getenv("PROFILE_CYCLES", "0")),
+)
+
+# Record upstream responses to SCRAPE_RECORD_DIR, or scrape recordings from
+# SCRAPE_REPLAY_DIR offline at SCRAPE_REPLAY_SPEED times real time
+RECORD_DIR = os.getenv("SCRAPE_RECORD_DIR")
+REPLAY_DIR = os.getenv("SCRAPE_REPLAY_DIR")
+REPLAY_SPEED = float(os.getenv("SCRAPE_REPLAY_SPEED", "1"))
+transport = None  # Upstream transport for scrape_location; None uses requests
+
+# Payload digests of the rooms persisted by the last cycle
+room_digests = RoomDigests()
+
+# "Machine freed" notifications for Discord subscribers, POSTed to the bot at
+# NOTIFY_WEBHOOK_URL; the subscriber index is reloaded every NOTIFY_REFRESH s
+NOTIFY_WEBHOOK_URL = os.getenv("NOTIFY_WEBHOOK_URL")
+NOTIFY_REFRESH = float(os.getenv("NOTIFY_REFRESH", "60"))
+machine_states = MachineStateTracker()
+subscribers = SubscriberIndex()
+notifier = (
+    Notifier(subscribers, WebhookSink(NOTIFY_WEBHOOK_URL))
+    if NOTIFY_WEBHOOK_URL
+    else None
+)
+
+
+def handle_sigterm(signum, frame) -> None:
+    """Stop like on Ctrl-C, so the lease or worker registration is released."""
+    raise KeyboardInterrupt
+
+
+def make_transport():
+    """Build the upstream transport selected by the record/replay settings."""
+    if REPLAY_DIR:
+        logging.info(f"Replaying recordings from {REPLAY_DIR} at {REPLAY_SPEED}x")
+        return ReplayTransport(REPLAY_DIR, speed=REPLAY_SPEED)
+    if RECORD_DIR:
+        logging.info(f"Recording upstream responses to {RECORD_DIR}")
+        return RecordingTransport(RECORD_DIR)
+    return None
+
+
+def timed_upsert(model, data) -> bool:
+    """Run model.upsert, recording its latency and whether it changed a row."""
+    name = model.__name__
+    with metrics.UPSERT_SECONDS.time(model=name):
+        changed = model.upsert(data)
+    if changed:
+        metrics.UPSERT_ROWS_CHANGED.inc(model=name)
+    return changed
+
+
+def renew_lease() -> None:
+    """Acquire or renew the scrape lease, tracking whether we are the leader."""
+    global lease_token
+    try:
+        token = Lease.acquire(LEASE_NAME, REPLICA_ID, LEASE_TTL)
+    except Exception as e:
+        logging.error(f"Lease renewal failed: {str(e)}")
+        token = None
+
+    if token is not None and token != lease_token:
+        logging.info(f"Acquired scrape lease {LEASE_NAME} (token {token})")
+    elif token is None and lease_token is not None:
+        logging.warning(f"Lost scrape lease {LEASE_NAME}")
+    if token != lease_token or token is None:
+        # Another replica may have written rooms since our digests were
+        # committed, so the next cycle must persist every room
+        room_digests.discard()
+    lease_token = token
+
+
+def heartbeat() -> None:
+    """Refresh our worker registration and rebuild the ring if membership changed."""
+    global shard_ring
+    try:
+        Worker.heartbeat(REPLICA_ID)
+        workers = Worker.live(WORKER_TTL)
+    except Exception as e:
+        logging.error(f"Worker heartbeat failed: {str(e)}")
+        return
+
+    if shard_ring is None or shard_ring.nodes != workers:
+        logging.info(
+            f"Rebalancing rooms across {len(workers)} worker(s): {', '.join(workers)}"
+        )
+        shard_ring = HashRing(workers)
+
+
+def refresh_subscribers() -> None:
+    """Reload the room -> subscribers index from the Discord table."""
+    try:
+        count = subscribers.load()
+    except Exception as e:
+        logging.error(f"Could not load notification subscribers: {str(e)}")
+        return
+    logging.debug(f"Loaded {count} notification subscribers")
+
+
+def notify(machines) -> None:
+    """Notify subscribers of the machines that changed state this cycle."""
+    with profiling.phase("notify"):
+        events = machine_states.diff(machines)
+        sent = notifier.dispatch(events) if notifier is not None else 0
+    if events:
+        logging.info(
+            f"Machine events: {len(events)}, notifications sent: {sent}, "
+            f"queued: {notifier.pending if notifier is not None else 0}"
+        )
+    profiling.annotate(machineEvents=len(events), notificationsSent=sent)
+
+
+def persist(token, location_data, rooms, machines) -> str:
     """
-    Schedule the run function to execute at a regular interval.
+    Upsert scraped data, fenced by the scrape lease.
+
+    Data is written in transactions of at most TRANSACTION_SECONDS, each one
+    starting with a fence that also extends the lease, so a long persist
+    neither outlives the lease nor blocks its renewal for long.
 
     Args:
-        interval: Time in seconds between runs
+        token: Fencing token the scrape was started under, or None in
+            sharded mode where there is no lease
+        location_data: Location data from scrape_location
+        rooms: Room data from scrape_location
+        machines: Machine data from scrape_location
+
+    Returns:
+        str: PERSISTED if all data was written, PARTIAL if some rows failed,
+            or FENCED if the lease was lost and the remaining data discarded
     """
     success = True
+    machine_updates = 0
+    position = 0
+    first = True
+    with profiling.phase("persist"):
+        # Each transaction holds the lease row lock, so keep it well within
+        # the lease TTL: commit and fence again every TRANSACTION_SECONDS
+        while True:
+            with db.atomic():
+                if token is not None and not Lease.fence(
+                    LEASE_NAME, REPLICA_ID, token, LEASE_TTL
+                ):
+                    logging.warning(
+                        f"Scrape lease {LEASE_NAME} lost before writing; "
+                        f"discarding results"
+                    )
+                    return FENCED
+                deadline = time.monotonic() + TRANSACTION_SECONDS
+
+                if first:
+                    first = False
+                    # Track updates
+                    with profiling.phase("location_upsert"):
+                        location_updates = (
+                            1 if timed_upsert(Location, location_data) else 0
+                        )
+
+                    room_updates = 0
+                    with profiling.phase("room_upsert"):
+                        for room in rooms:
+                            if timed_upsert(Room, room):
+                                room_updates += 1
+
+                    # Log machine status summary
+                    available_machines = sum(
+                        1 for m in machines if m.get("timeRemaining", 0) == 0
+                    )
+                    logging.info(
+                        f"Machine status (changed rooms): "
+                        f"Total: {len(machines)}, "
+                        f"Available: {available_machines}, "
+                        f"In Use: {len(machines) - available_machines}"
+                    )
+
+                with profiling.phase("machine_upsert"):
+                    while position < len(machines):
+                        machine = machines[position]
+                        position += 1
+                        try:
+                            if timed_upsert(Machine, machine):
+                                machine_updates += 1
+                        except Exception as e:
+                            success = False
+                            logging.error(
+                                f"Error updating machine {machine.get('licensePlate', 'Unknown')}: {str(e)}"
+                            )
+                        if time.monotonic() >= deadline:
+                            break
+
+            if position >= len(machines):
+                break
+
+    if success:
+        logging.info("Database update completed successfully")
+    else:
+        logging.warning("Database update completed with some errors")
+
+    profiling.annotate(
+        locationUpdates=location_updates,
+        roomUpdates=room_updates,
+        machineUpdates=machine_updates,
+    )
+
+    # Log update summary
+    logging.info(
+        f"Update summary: "
+        f"Locations: {location_updates}, "
+        f"Rooms: {room_updates}, "
+        f"Machines: {machine_updates}"
+    )
+    return PERSISTED if success else PARTIAL
+
+
+def publish_snapshot() -> None:
+    """Publish the location tree read from the database for the API workers."""
+    started = time.perf_counter()
+    try:
+        version = snapshot.publish(snapshot.SNAPSHOT_PATH)
+    except Exception as e:
+        logging.error(f"Could not publish snapshot: {str(e)}")
+        return
+    logging.debug(
+        f"Published snapshot {version} in {time.perf_counter() - started:.3f}s"
+    )
+
+
+def scheduled_scrape() -> None:
+    """
+    Scrape the location once, persist the results and publish the snapshot.
+
+    Run on every tick of the scheduler; a tick is skipped while the previous
+    cycle is still running. Replicas that do not hold the scrape lease skip
+    the cycle entirely; in sharded mode each replica handles only the rooms
+    the hash ring assigns to it. Every replica publishes the snapshot, so the
+    API workers next to it can serve reads without the database.
+    """
+    scrape_cycle()
+    if snapshot.SNAPSHOT_PATH:
+        publish_snapshot()
+
+
+def scrape_cycle() -> None:
+    """Run this replica's share of a scrape cycle, if any; see scheduled_scrape."""
+    room_filter = None
+    if SHARDING:
+        ring, token = shard_ring, None
+        if ring is None:
+            logging.debug("Not registered as a scrape worker yet; skipping cycle")
+            return
+
+        def room_filter(room):
+            return ring.owns(REPLICA_ID, room["roomId"])
+
+    else:
+        token = lease_token
+        if token is None:
+            logging.debug(f"Not holding scrape lease {LEASE_NAME}; skipping cycle")
+            return
+
+    cycle_start = time.perf_counter()
+    metrics.set_route("scheduler")
     try:
-        logging.info(f"Starting scrape for location {LOCATION_ID}")
+        with profiler.cycle():
+            scrape_and_persist(token, room_filter)
+    except Exception as e:
+        logging.error(f"Scraping error: {str(e)}", exc_info=True)
+
+    metrics.SCRAPE_CYCLE_SECONDS.observe(time.perf_counter() - cycle_start)
+    try:
+        metrics.REGISTRY.flush()
+    except OSError as e:
+        logging.warning(f"Could not write metrics snapshot: {str(e)}")
+
 
-        location_data, rooms, machines = scrape_location(LOCATION_ID)
+def scrape_and_persist(token, room_filter) -> None:
+    """Run one scrape and persist its results; see scheduled_scrape."""
+    logging.info(f"Starting scrape for location {LOCATION_ID}")
+
+    # The digest counters are cumulative; report this cycle's share of them
+    hits_before, misses_before = room_digests.hits, room_digests.misses
+    try:
+        location_data, rooms, machines = scrape_location(
+            LOCATION_ID, room_filter, transport=transport, digests=room_digests
+        )
+        hits = room_digests.hits - hits_before
+        lookups = hits + room_digests.misses - misses_before
 
         # Log summary of scraped data
         logging.info(
             f"Scraped data summary: "
             f"Location: {location_data.get('label', 'Unknown')}, "
             f"Rooms: {len(rooms)}, "
-            f"Machines: {len(machines)}"
+            f"Changed machines: {len(machines)}, "
+            f"Unchanged rooms: {hits}/{lookups}"
         )
-
-        # Track updates
-        location_updates = 1 if Location.upsert(location_data) else 0
-
-        room_updates = 0
-        for room in rooms:
-            if Room.upsert(room):
-                room_updates += 1
-
-        # Log machine status summary
-        available_machines = sum(1 for m in machines if m.get("timeRemaining", 0) == 0)
-        logging.info(
-            f"Machine status: "
-            f"Total: {len(machines)}, "
-            f"Available: {available_machines}, "
-            f"In Use: {len(machines) - available_machines}"
+        profiling.annotate(
+            rooms=len(rooms), machines=len(machines), unchangedRooms=hits
         )
 
-        machine_updates = 0
-        for machine in machines:
-            try:
-                if Machine.upsert(machine):
-                    machine_updates += 1
-            except Exception as e:
-                success = False
-                logging.error(
-                    f"Error updating machine {machine.get('licensePlate', 'Unknown')}: {str(e)}"
-                )
-
-        if success:
-            logging.info("Database update completed successfully")
-        else:
-            logging.warning("Database update completed with some errors")
-
-        # Log update summary
-        logging.info(
-            f"Update summary: "
-            f"Locations: {location_updates}, "
-            f"Rooms: {room_updates}, "
-            f"Machines: {machine_updates}"
-        )
+        persisted = persist(token, location_data, rooms, machines)
+    except Exception:
+        room_digests.discard()
+        raise
 
-    except Exception as e:
-        logging.error(f"Scraping error: {str(e)}", exc_info=True)
+    # Unchanged rooms may only be skipped if the last cycle wrote everything
+    if persisted == PERSISTED:
+        room_digests.commit()
+    else:
+        room_digests.discard()
 
-    scheduler.enter(interval, 1, scheduled_scrape, (interval,))
+    # Without the lease the data was not ours to write, and the new leader
+    # notifies subscribers of the same changes
+    if persisted != FENCED:
+        notify(machines)
 
 
 if __name__ == "__main__":
     logging.info("Scraper service starting")
     INTERVAL = 60
-    scheduler.enter(0, 1, scheduled_scrape, (INTERVAL,))
-    scheduler.run()
+    init_db()
+    transport = make_transport()
+    scheduler = FixedRateScheduler()
+    if isinstance(transport, ReplayTransport):
+        # Compress the schedule along with the recording
+        INTERVAL /= REPLAY_SPEED
+
+        def stop_when_replayed():
+            if transport.exhausted:
+                logging.info("Replay finished")
+                scheduler.stop(wait=False)
+
+        scheduler.add_job(stop_when_replayed, INTERVAL, name="replay")
+    if SHARDING:
+        heartbeat()
+        scheduler.add_job(heartbeat, WORKER_TTL / 3, name="heartbeat")
+    else:
+        renew_lease()
+        # Renew well within the TTL so a dead leader is replaced within one TTL
+        scheduler.add_job(renew_lease, LEASE_TTL / 3, name="lease")
+    if notifier is not None:
+        refresh_subscribers()
+        scheduler.add_job(refresh_subscribers, NOTIFY_REFRESH, name="subscribers")
+        # Drain notifications held back by the rate limit between cycles
+        scheduler.add_job(notifier.flush, 1, name="notify")
+    scheduler.add_job(scheduled_scrape, INTERVAL, name="scrape")
+    # systemd and docker stop send SIGTERM; without a handler the process
+    # dies without releasing the lease, and the next leader waits out its TTL
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        logging.info("Scraper service stopping")
+    finally:
+        scheduler.stop(wait=False)
+        if isinstance(transport, RecordingTransport):
+            transport.close()
+        if SHARDING:
+            Worker.deregister(REPLICA_ID)
+        elif lease_token is not None:
+            Lease.release(LEASE_NAME, REPLICA_ID)
@@ -1,6 +1,111 @@
 import os
 import sys
 
+import pytest
+from peewee import SqliteDatabase
+
 # Add project root to Python path
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
+
+from core.database import MODELS, Location, Machine, Room  # noqa: E402
+
+
+class FakeClock:
+    """
+    Clock for code that takes a clock callable; set `now` to move it. `now`
+    may be epoch seconds or a datetime, whichever the code expects.
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(scope="session")
+def test_db():
+    """Create a test database connection"""
+    return SqliteDatabase(":memory:")
+
+
+@pytest.fixture
+def setup_database(test_db):
+    # Bind model classes to test db
+    for model in MODELS:
+        model._meta.database = test_db
+    # Create tables
+    test_db.connect(reuse_if_open=True)
+    test_db.create_tables(MODELS)
+    yield
+    # Clean up
+    test_db.drop_tables(MODELS)
+    test_db.close()
+
+
+def create_machine(room_id, number, **fields):
+    """Create a machine in `room_id` of location loc1; `fields` override defaults."""
+    defaults = {
+        "licensePlate": f"{room_id}-m{number}",
+        "qrCodeId": f"{room_id}-qr{number}",
+        "available": True,
+        "type": "washer",
+        "timeRemaining": number,
+        "mode": "ready",
+        "roomId": room_id,
+        "location": "loc1",
+        "stickerNumber": number,
+        "capability_addTime": True,
+        "capability_showAddTimeNotice": True,
+        "capability_showSettings": True,
+        "controllerType": "test",
+        "doorClosed": True,
+        "freePlay": False,
+        "nfcId": f"nfc-{room_id}-{number}",
+        "opaqueId": f"op-{room_id}-{number}",
+        "settings_cycle": "normal",
+        "settings_soil": "normal",
+    }
+    return Machine.create(**{**defaults, **fields})
+
+
+def create_tree(machine_count=3, room_ids=("room1", "room2")):
+    """Create location loc1 with `machine_count` washers in each room."""
+    location = Location.create(
+        locationId="loc1",
+        description="Test Location",
+        label="Test",
+        dryerCount=0,
+        washerCount=machine_count * len(room_ids),
+        machineCount=machine_count * len(room_ids),
+    )
+    for room_id in room_ids:
+        Room.create(
+            roomId=room_id,
+            locationId=location,
+            connected=True,
+            label=room_id,
+            dryerCount=0,
+            washerCount=machine_count,
+            machineCount=machine_count,
+            freePlay=False,
+        )
+        for number in range(1, machine_count + 1):
+            create_machine(room_id, number)
+    return location
+
+
+@pytest.fixture
+def make_machine():
+    return create_machine
+
+
+@pytest.fixture
+def make_tree():
+    return create_tree
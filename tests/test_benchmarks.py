@@ -0,0 +1,32 @@
+from benchmarks import run
+from benchmarks.campus import FakeTransport, build_campus
+from core.scraper import scrape_location
+
+
+def test_synthetic_campus_scrapes():
+    campus = build_campus(100)
+    location_id = campus["location"]["locationId"]
+
+    location_data, rooms, machines = scrape_location(
+        location_id, transport=FakeTransport(campus)
+    )
+
+    assert location_data["machineCount"] == 100
+    assert len(rooms) == 3
+    assert len(machines) == 100
+    assert "settings_cycle" in machines[0]
+
+
+def test_benchmarks_run_and_compare(tmp_path):
+    databases = [model._meta.database for model in run.MODELS]
+    baseline = tmp_path / "baseline.json"
+    assert (
+        run.main(["--sizes", "10", "--repeat", "1", "--baseline", str(baseline)]) == 0
+    )
+    assert baseline.exists()
+    # The models are bound back to the databases they used before
+    assert [model._meta.database for model in run.MODELS] == databases
+
+    results = {"fast[10]": 0.010, "slow[10]": 0.100}
+    regressions = run.compare(results, {"fast[10]": 0.009, "slow[10]": 0.050}, 0.25)
+    assert regressions == [("slow[10]", 0.050, 0.100)]
@@ -1,30 +1,10 @@
+import datetime
 import pytest
-from peewee import SqliteDatabase
-from core.database import Location, Room, Machine
-
-# Use SQLite for testing
-MODELS = [Location, Room, Machine]
-
-
-@pytest.fixture(scope="session")
-def test_db():
-    """Create a test database connection"""
-    db = SqliteDatabase(":memory:")
-    return db
-
-
-@pytest.fixture
-def setup_database(test_db):
-    # Bind model classes to test db
-    for model in MODELS:
-        model._meta.database = test_db
-    # Create tables
-    test_db.connect()
-    test_db.create_tables(MODELS)
-    yield
-    # Clean up
-    test_db.drop_tables(MODELS)
-    test_db.close()
+from unittest.mock import patch
+from peewee import OperationalError, SqliteDatabase
+from core import database
+from core.database import Location, Room, Machine, Lease, Worker, utcnow
+from core.records import LocationRecord, RoomRecord
 
 
 def test_machine_time_remaining(setup_database):
@@ -134,3 +114,220 @@ def test_machine_time_remaining_constraints(setup_database):
             timeRemaining=-1,
             type="dryer",
         )
+
+
+def test_upsert_records(setup_database):
+    location = LocationRecord(
+        locationId="loc", dryerCount=0, label="L", machineCount=1, washerCount=1
+    )
+    room = RoomRecord(
+        roomId="room",
+        connected=True,
+        dryerCount=0,
+        freePlay=False,
+        label="R",
+        locationId="loc",
+        machineCount=1,
+        washerCount=1,
+    )
+    assert Location.upsert(location)
+    assert Room.upsert(room)
+    assert not Room.upsert(room)
+    room["label"] = "Renamed"
+    assert Room.upsert(room)
+    assert Room.get_by_id("room").label == "Renamed"
+
+
+def test_lease_acquire_and_renew(setup_database):
+    token = Lease.acquire("scrape:loc", "replica-a", ttl=15)
+    assert token == 1
+
+    # Another replica cannot take a live lease
+    assert Lease.acquire("scrape:loc", "replica-b", ttl=15) is None
+
+    # Renewing keeps the fencing token
+    assert Lease.acquire("scrape:loc", "replica-a", ttl=15) == 1
+    assert Lease.fence("scrape:loc", "replica-a", 1, ttl=15)
+    assert not Lease.fence("scrape:loc", "replica-b", 1, ttl=15)
+
+
+def _server_time_in(seconds):
+    """Patch for database.server_time that moves the database clock ahead."""
+    later = utcnow() + datetime.timedelta(seconds=seconds)
+    return lambda database, offset=0.0: later + datetime.timedelta(seconds=offset)
+
+
+def test_lease_failover_bumps_token(setup_database):
+    Lease.acquire("scrape:loc", "replica-a", ttl=15)
+
+    with patch("core.database.server_time", _server_time_in(20)):
+        # The expired lease is taken over with a higher fencing token
+        assert Lease.acquire("scrape:loc", "replica-b", ttl=15) == 2
+        # The old leader's writes are fenced off
+        assert not Lease.fence("scrape:loc", "replica-a", 1, ttl=15)
+        assert Lease.fence("scrape:loc", "replica-b", 2, ttl=15)
+
+
+def test_lease_fence_extends_lease(setup_database):
+    Lease.acquire("scrape:loc", "replica-a", ttl=15)
+    with patch("core.database.server_time", _server_time_in(10)):
+        assert Lease.fence("scrape:loc", "replica-a", 1, ttl=15)
+    # 20s after acquiring, the lease is still live thanks to the fence
+    with patch("core.database.server_time", _server_time_in(20)):
+        assert Lease.acquire("scrape:loc", "replica-b", ttl=15) is None
+
+
+def test_lease_release(setup_database):
+    Lease.acquire("scrape:loc", "replica-a", ttl=15)
+    assert Lease.release("scrape:loc", "replica-a")
+    assert Lease.acquire("scrape:loc", "replica-b", ttl=15) == 2
+
+
+def test_worker_membership(setup_database):
+    Worker.heartbeat("worker-a")
+    Worker.heartbeat("worker-b")
+    Worker.heartbeat("worker-a")
+    assert Worker.live(ttl=30) == ["worker-a", "worker-b"]
+
+    # Liveness follows the database clock, not the local one
+    later = utcnow() + datetime.timedelta(seconds=60)
+    with patch("core.database.utcnow", return_value=later):
+        assert Worker.live(ttl=30) == ["worker-a", "worker-b"]
+    with patch("core.database.server_time", _server_time_in(60)):
+        Worker.heartbeat("worker-b")
+        assert Worker.live(ttl=30) == ["worker-b"]
+
+    Worker.deregister("worker-b")
+    assert Worker.live(ttl=30) == ["worker-a"]
+
+
+def test_database_is_lazy(monkeypatch):
+    monkeypatch.delenv("MYSQL_HOST", raising=False)
+    assert not database.is_configured()
+
+    # First use configures from the environment, which fails without MySQL
+    with pytest.raises(Exception, match="MYSQL_HOST is not set"):
+        database.db.is_closed()
+
+
+def test_configure_db_and_reset_after_fork():
+    sqlite = SqliteDatabase(":memory:")
+    try:
+        assert database.configure_db(sqlite) is sqlite
+        assert database.is_configured()
+        database.db.execute_sql("SELECT 1")
+        assert not sqlite.is_closed()
+
+        database.reset_after_fork()
+        assert sqlite.is_closed()
+    finally:
+        database.db.initialize(None)
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """Location bound to a routed primary and replica, as separate SQLite files."""
+    previous = Location._meta.database
+    primary = SqliteDatabase(str(tmp_path / "primary.db"))
+    replica = SqliteDatabase(str(tmp_path / "replica.db"))
+    for sqlite, label in ((primary, "primary"), (replica, "replica")):
+        Location._meta.database = sqlite
+        sqlite.create_tables([Location])
+        Location.create(
+            locationId="loc", label=label, dryerCount=0, washerCount=0, machineCount=0
+        )
+        sqlite.close()
+
+    lags = {id(replica): 0.0}
+    database.configure_db(primary, [replica])
+    database.router.probe = lambda r: lags[id(r)]
+    Location._meta.database = database.db
+    try:
+        yield lags, replica
+    finally:
+        Location._meta.database = previous
+        database.router.probe = database.replica_lag
+        database.router._lags.clear()
+        database.configure_db(SqliteDatabase(":memory:"))
+        database.db.initialize(None)
+
+
+def test_reads_outside_read_scope_use_primary(replicated):
+    assert Location.get_by_id("loc").label == "primary"
+
+
+def test_read_scope_uses_replica_and_reads_own_writes(replicated):
+    with database.router.reading():
+        assert Location.get_by_id("loc").label == "replica"
+        Location.update(label="written").execute()
+        # After a write, the scope reads from the primary
+        assert Location.get_by_id("loc").label == "written"
+    with database.router.reading():
+        assert Location.get_by_id("loc").label == "replica"
+
+
+def test_lagging_replica_falls_back_to_primary(replicated):
+    lags, replica = replicated
+    lags[id(replica)] = 60.0
+    with database.router.reading():
+        assert Location.get_by_id("loc").label == "primary"
+
+    # The measured lag is cached until the next check
+    lags[id(replica)] = 0.0
+    with database.router.reading():
+        assert Location.get_by_id("loc").label == "primary"
+    database.router._lags.clear()
+    with database.router.reading():
+        assert Location.get_by_id("loc").label == "replica"
+
+
+def test_transactions_read_from_primary(replicated):
+    with database.router.reading(), database.db.atomic():
+        assert Location.get_by_id("loc").label == "primary"
+
+
+def test_unreachable_replica_is_unhealthy_and_probed_less(replicated):
+    lags, replica = replicated
+    probes = []
+
+    def unreachable(r):
+        probes.append(r)
+        raise OperationalError("Can't connect to MySQL server")
+
+    database.router.probe = unreachable
+    with database.router.reading():
+        assert Location.get_by_id("loc").label == "primary"
+    # Failed probes are not retried every LAG_CHECK_INTERVAL
+    checked_at, _ = database.router._lags[id(replica)]
+    with patch.object(
+        database.router, "clock", return_value=checked_at + database.LAG_CHECK_INTERVAL
+    ):
+        with database.router.reading():
+            assert Location.get_by_id("loc").label == "primary"
+    assert len(probes) == 1
+
+
+def test_probe_connections_to_unused_replicas_are_closed(replicated):
+    lags, replica = replicated
+    lags[id(replica)] = 60.0
+
+    def probe(r):
+        r.connect(reuse_if_open=True)
+        return lags[id(r)]
+
+    database.router.probe = probe
+    with database.router.reading():
+        assert Location.get_by_id("loc").label == "primary"
+        assert replica.is_closed()
+
+
+def test_ensure_indexes_adds_missing_index(setup_database, test_db):
+    def indexed_columns():
+        return {tuple(index.columns) for index in test_db.get_indexes("machine")}
+
+    assert ("lastUpdated",) in indexed_columns()
+    test_db.execute_sql('DROP INDEX "machine_lastUpdated"')
+    assert ("lastUpdated",) not in indexed_columns()
+
+    database.ensure_indexes([Machine])
+    assert ("lastUpdated",) in indexed_columns()
@@ -1,12 +1,14 @@
+import gzip
+import json
+import time
 import pytest
 from unittest.mock import patch, mock_open
 from peewee import SqliteDatabase
+import app as app_module
 from app import app
-from core.database import Location, Room, Machine
-
-# Use SQLite for testing
-MODELS = [Location, Room, Machine]
-test_db = SqliteDatabase(":memory:")
+from core import database, forecast, snapshot
+from core.database import Location, Room, Machine, utcnow
+from core.export import export_batches
 
 # Sample mock data for testing
 mock_data = {
@@ -33,20 +35,6 @@ mock_data = {
 }
 
 
-@pytest.fixture
-def setup_database():
-    # Bind model classes to test db
-    for model in MODELS:
-        model._meta.database = test_db
-    # Create tables
-    test_db.connect()
-    test_db.create_tables(MODELS)
-    yield
-    # Clean up
-    test_db.drop_tables(MODELS)
-    test_db.close()
-
-
 @pytest.fixture
 def client(setup_database):
     with app.test_client() as client:
@@ -206,3 +194,357 @@ def test_access_logs_not_found(client):
         response = client.get("/logs/access")
         assert response.status_code == 404
         assert response.data.decode() == "access.log not found"
+
+
+def test_get_data_field_projection(client, setup_database, make_tree):
+    make_tree()
+
+    response = client.get(
+        "/?location_fields=locationId&room_fields=label"
+        "&machine_fields=licensePlate,timeRemaining"
+    )
+    assert response.status_code == 200
+    data = response.get_json()
+    assert set(data[0]) == {"locationId", "rooms"}
+    room = data[0]["rooms"]["room1"]
+    assert set(room) == {"label", "machines"}
+    assert room["machines"][0] == {"licensePlate": "room1-m1", "timeRemaining": 1}
+
+
+def test_get_data_unknown_field(client, setup_database):
+    response = client.get("/?machine_fields=licensePlate,nfcId")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Unknown machine_fields: nfcId"}
+
+
+def test_get_data_pagination(client, setup_database, make_tree):
+    make_tree()
+
+    plates = []
+    cursor = None
+    pages = 0
+    while True:
+        url = "/?limit=4&machine_fields=licensePlate"
+        if cursor:
+            url += f"&cursor={cursor}"
+        response = client.get(url)
+        assert response.status_code == 200
+        for room in response.get_json()[0]["rooms"].values():
+            plates.extend(m["licensePlate"] for m in room["machines"])
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert pages == 2
+    assert plates == [f"{r}-m{n}" for r in ("room1", "room2") for n in (1, 2, 3)]
+
+
+def test_get_data_invalid_cursor(client, setup_database):
+    response = client.get("/?limit=2&cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid cursor"}
+
+
+def test_get_data_gzip(client, setup_database, make_tree):
+    make_tree(machine_count=10)
+    app_module.compression_cache.clear()
+
+    plain = client.get("/")
+    assert "Content-Encoding" not in plain.headers
+
+    first = client.get("/", headers={"Accept-Encoding": "gzip"})
+    second = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in first.headers["Vary"]
+    assert json.loads(gzip.decompress(first.data)) == plain.get_json()
+    assert second.data == first.data
+    assert app_module.compression_cache.misses == 1
+    assert app_module.compression_cache.hits == 1
+
+
+def test_get_data_brotli(client, setup_database, tmp_path, monkeypatch, make_tree):
+    brotli = pytest.importorskip("brotli")
+    make_tree(machine_count=10)
+    plain = client.get("/")
+
+    # Preferred over gzip when the client accepts both
+    response = client.get("/", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data) == plain.data
+
+    # Snapshots store a brotli body too
+    path = str(tmp_path / "tree.snap")
+    snapshot.publish(path)
+    monkeypatch.setattr(snapshot, "READER", snapshot.SnapshotReader(path))
+    response = client.get("/", headers={"Accept-Encoding": "br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert "X-Snapshot-Version" in response.headers
+    assert brotli.decompress(response.data) == plain.data
+
+
+def test_small_response_not_compressed(client, setup_database):
+    response = client.get("/?room=missing", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+
+
+def test_error_logs_tail(client, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "logs").mkdir()
+    (tmp_path / "logs" / "error.log").write_text("one\ntwo\nthree\n")
+
+    response = client.get("/logs/error?tail=2")
+    assert response.status_code == 200
+    assert response.data.decode() == "two\nthree\n"
+
+    response = client.get("/logs/error?tail=x")
+    assert response.status_code == 400
+
+
+def test_claim_batch(client, setup_database, make_tree):
+    make_tree(machine_count=2)
+
+    response = client.post(
+        "/claim",
+        json={
+            "claims": [
+                {"user_id": "user1", "machine_id": "room1-m1"},
+                {"user_id": "user2", "machine_id": "room2-qr2"},
+                {"user_id": "user3", "machine_id": "missing"},
+                {"user_id": "user4", "machine_id": "room1-m1"},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "success": True,
+        "claimed": 2,
+        "requested": 3,
+        "unmatched": ["missing"],
+    }
+
+    users = {m.licensePlate: m.lastUser for m in Machine.select()}
+    # Later claims for the same machine win
+    assert users["room1-m1"] == "user4"
+    assert users["room2-m2"] == "user2"
+    assert users["room1-m2"] is None
+
+
+def test_claim_repeat_is_success(client, setup_database, make_tree):
+    make_tree(machine_count=1)
+    for _ in range(2):
+        response = client.post(
+            "/claim", json={"user_id": "user1", "machine_id": "room1-qr1"}
+        )
+        assert response.status_code == 200
+
+
+def test_claim_batch_missing_fields(client, setup_database):
+    response = client.post("/claim", json={"claims": [{"user_id": "user1"}]})
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Missing required fields"}
+
+
+def test_metrics_endpoint(client, setup_database):
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert 'cscgo_http_request_seconds_count{route="/",method="GET",status="200"}' in (
+        response.data.decode()
+    )
+
+
+def test_cycles_endpoint(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module.profiling, "PROFILE_DIR", str(tmp_path))
+    assert client.get("/cycles").status_code == 404
+
+    (tmp_path / "cycles.json").write_text(
+        json.dumps([{"duration": 1}, {"duration": 2}])
+    )
+    response = client.get("/cycles?limit=1")
+    assert response.status_code == 200
+    assert response.get_json() == [{"duration": 2}]
+
+
+def test_export_ndjson(client, setup_database, make_tree):
+    make_tree()
+    response = client.get("/export?room=room2&fields=licensePlate,timeRemaining")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert "Content-Encoding" not in response.headers
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert rows == [
+        {"licensePlate": f"room2-m{number}", "timeRemaining": number}
+        for number in (1, 2, 3)
+    ]
+
+
+def test_export_csv_gzip(client, setup_database, make_tree):
+    make_tree()
+    response = client.get(
+        "/export?format=csv&fields=id,licensePlate",
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    lines = gzip.decompress(response.data).decode().splitlines()
+    assert lines[0] == "id,licensePlate"
+    assert len(lines) == 7
+
+
+def test_export_filters_and_errors(client, setup_database, make_tree):
+    make_tree()
+    assert client.get("/export?since=2999-01-01").data == b""
+    assert client.get("/export?format=xml").status_code == 400
+    assert client.get("/export?since=yesterday").status_code == 400
+    assert client.get("/export?fields=password").status_code == 400
+
+
+def test_export_batches_page_by_id(setup_database, make_tree):
+    make_tree()
+    batches = list(export_batches(["licensePlate"], batch_size=4))
+    assert [len(batch) for batch in batches] == [4, 2]
+    assert batches[1][-1] == ("room2-m3",)
+
+
+def test_next_available(client, monkeypatch, make_tree):
+    refresher = forecast.ForecastRefresher(forecast.ForecastIndex())
+    monkeypatch.setattr(forecast, "REFRESHER", refresher)
+    monkeypatch.setattr(refresher, "start", lambda: None)
+    assert client.get("/rooms/room1/next-available").status_code == 503
+
+    make_tree()
+    Machine.update(lastUpdated=utcnow()).execute()
+    refresher.refresh()
+    response = client.get("/rooms/room1/next-available")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["roomId"] == "room1"
+    # Every test machine is available; ties go to the first one indexed
+    assert data["machines"]["washer"]["licensePlate"] == "room1-m1"
+    assert data["machines"]["washer"]["minutesUntilAvailable"] == 0
+
+    response = client.get("/rooms/room1/next-available?type=dryer")
+    assert response.get_json()["machines"] == {"dryer": None}
+    assert client.get("/rooms/missing/next-available").status_code == 404
+
+
+def test_get_data_from_snapshot(client, tmp_path, monkeypatch, make_tree):
+    make_tree()
+    expected = client.get("/?room=room2&limit=2").get_json()
+    path = str(tmp_path / "tree.snap")
+    snapshot.publish(path)
+    monkeypatch.setattr(snapshot, "READER", snapshot.SnapshotReader(path))
+
+    # Rows changed after publishing are not visible through the snapshot
+    Machine.update(timeRemaining=9).execute()
+    response = client.get("/")
+    assert response.status_code == 200
+    assert response.headers["X-Snapshot-Version"]
+    assert all(
+        machine["timeRemaining"] != 9
+        for room in response.get_json()[0]["rooms"].values()
+        for machine in room["machines"]
+    )
+
+    # The unfiltered tree is sent precompressed, without compressing per request
+    app_module.compression_cache.clear()
+    compressed = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.data) == response.data
+    assert app_module.compression_cache.misses == 0
+
+    response = client.get("/?room=room2&limit=2")
+    assert response.get_json() == expected
+    assert response.headers["X-Next-Cursor"]
+    assert client.get("/?limit=0").status_code == 400
+
+
+def test_get_data_falls_back_to_database(client, tmp_path, monkeypatch, make_tree):
+    make_tree()
+    path = tmp_path / "tree.snap"
+    reader = snapshot.SnapshotReader(str(path), max_age=60)
+    monkeypatch.setattr(snapshot, "READER", reader)
+    response = client.get("/")
+    assert response.status_code == 200
+    assert "X-Snapshot-Version" not in response.headers
+
+    snapshot.publish(str(path), clock=lambda: 0.0)  # Long stale
+    response = client.get("/")
+    assert "X-Snapshot-Version" not in response.headers
+    assert response.get_json()[0]["locationId"] == "loc1"
+
+
+@pytest.fixture
+def replicated_client(tmp_path, make_tree):
+    """Client of an app reading from a replica that has not seen any writes."""
+    primary = SqliteDatabase(str(tmp_path / "primary.db"))
+    replica = SqliteDatabase(str(tmp_path / "replica.db"))
+    for sqlite in (primary, replica):
+        for model in database.MODELS:
+            model._meta.database = sqlite
+        sqlite.create_tables(database.MODELS)
+        make_tree()
+        sqlite.close()
+
+    database.configure_db(primary, [replica])
+    database.router.probe = lambda r: 0.0
+    previous = {model: model._meta.database for model in database.MODELS}
+    for model in database.MODELS:
+        model._meta.database = database.db
+    try:
+        with app.test_client() as client:
+            yield client
+    finally:
+        for model, previous_database in previous.items():
+            model._meta.database = previous_database
+        database.router.probe = database.replica_lag
+        database.router._lags.clear()
+        database.configure_db(SqliteDatabase(":memory:"))
+        database.db.initialize(None)
+
+
+def _last_user(client, machine_id):
+    (location,) = client.get(f"/?machine={machine_id}").get_json()
+    (room,) = location["rooms"].values()
+    return room["machines"][0]["lastUser"]
+
+
+def test_reads_after_a_claim_see_the_claim(replicated_client):
+    claim = {"user_id": "u1", "machine_id": "room1-m1"}
+    assert replicated_client.post("/claim", json=claim).status_code == 200
+    # The next request of the same client reads from the primary
+    assert _last_user(replicated_client, "room1-m1") == "u1"
+
+    # Other clients, and this one once replicas have caught up, use the replica
+    with app.test_client() as other:
+        assert _last_user(other, "room1-m1") is None
+    replicated_client.set_cookie(
+        app_module.LAST_WRITE_COOKIE, repr(time.time() - database.router.max_lag)
+    )
+    assert _last_user(replicated_client, "room1-m1") is None
+
+
+def test_get_data_after_claim_skips_older_snapshot(
+    client, tmp_path, monkeypatch, make_tree
+):
+    make_tree()
+    path = str(tmp_path / "tree.snap")
+    snapshot.publish(path, clock=lambda: time.time() - 1)
+    monkeypatch.setattr(snapshot, "READER", snapshot.SnapshotReader(path))
+    assert "X-Snapshot-Version" in client.get("/").headers
+
+    claim = {"user_id": "u1", "machine_id": "room1-m1"}
+    assert client.post("/claim", json=claim).status_code == 200
+    response = client.get("/")
+    assert "X-Snapshot-Version" not in response.headers
+    machines = response.get_json()[0]["rooms"]["room1"]["machines"]
+    assert machines[0]["lastUser"] == "u1"
+
+    # Snapshots published after the claim include it
+    snapshot.publish(path, clock=lambda: time.time() + 1)
+    response = client.get("/")
+    assert "X-Snapshot-Version" in response.headers
+    assert response.get_json()[0]["rooms"]["room1"]["machines"][0]["lastUser"] == "u1"
@@ -0,0 +1,110 @@
+import datetime
+
+from core.database import Machine
+from core.forecast import (
+    ForecastIndex,
+    ForecastRefresher,
+    describe,
+    minutes_until,
+    projected_finish,
+)
+
+NOW = datetime.datetime(2025, 1, 1, 12, 0)
+EPOCH = NOW.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def row(machine_id, time_remaining, available=False, room="room1", kind="washer"):
+    return {
+        "id": machine_id,
+        "roomId": room,
+        "type": kind,
+        "licensePlate": f"LP{machine_id}",
+        "stickerNumber": machine_id,
+        "available": available,
+        "timeRemaining": time_remaining,
+        "lastUpdated": NOW,
+    }
+
+
+def test_projected_finish():
+    assert projected_finish(row(1, 0, available=True)) == EPOCH
+    assert projected_finish(row(1, 10)) == EPOCH + 600
+    # Finished but not emptied: no forecast
+    assert projected_finish(row(1, 0)) is None
+    assert projected_finish({**row(1, 5), "lastUpdated": "2025-01-01 12:00:00+00:00"})
+
+
+def test_index_returns_soonest_per_room_and_type():
+    index = ForecastIndex()
+    for machine in (
+        row(1, 30),
+        row(2, 10),
+        row(3, 5, kind="dryer"),
+        row(4, 1, room="r2"),
+    ):
+        index.update(machine)
+
+    finish, details = index.next_available("room1", "washer")
+    assert finish == EPOCH + 600
+    assert details == {"licensePlate": "LP2", "stickerNumber": 2}
+    assert index.types("room1") == ["dryer", "washer"]
+    assert index.next_available("room1", "combo") is None
+
+
+def test_index_updates_supersede_old_entries():
+    index = ForecastIndex()
+    index.update(row(1, 30))
+    index.update(row(2, 10))
+    # Machine 2 got more time; machine 1 is now the soonest
+    index.update(row(2, 60))
+    assert index.next_available("room1", "washer")[1]["licensePlate"] == "LP1"
+    # Machine 1 can no longer be forecast
+    index.update(row(1, 0))
+    assert index.next_available("room1", "washer")[1]["licensePlate"] == "LP2"
+    index.update(row(2, 0))
+    assert index.next_available("room1", "washer") is None
+    assert index.types("room1") == []
+    assert len(index) == 0
+
+
+def test_index_compacts_stale_entries():
+    index = ForecastIndex()
+    for minutes in range(1, 200):
+        index.update(row(1, minutes))
+    assert len(index._heaps[("room1", "washer")]) < 20
+
+
+def test_describe():
+    assert describe(None) is None
+    result = describe((EPOCH + 90, {"licensePlate": "LP1"}), now=EPOCH)
+    assert result == {
+        "licensePlate": "LP1",
+        "availableAt": "2025-01-01T12:01:30+00:00",
+        "minutesUntilAvailable": 2,
+    }
+    assert minutes_until(EPOCH - 10, now=EPOCH) == 0
+
+
+def test_refresher_reads_only_recent_changes(setup_database, make_machine, clock):
+    clock.now = NOW
+    refresher = ForecastRefresher(ForecastIndex(), clock=clock)
+    for number, minutes in ((1, 20), (2, 90)):
+        make_machine(
+            "room1",
+            number,
+            available=False,
+            timeRemaining=minutes,
+            mode="running",
+            lastUpdated=NOW - datetime.timedelta(hours=1),
+        )
+    assert refresher.refresh() == 2
+    assert refresher.ready
+
+    clock.now = NOW + datetime.timedelta(minutes=5)
+    Machine.update(
+        timeRemaining=3, lastUpdated=NOW + datetime.timedelta(minutes=1)
+    ).where(Machine.licensePlate == "room1-m1").execute()
+    assert refresher.refresh() == 1
+    finish, details = refresher.index.next_available("room1", "washer")
+    assert details["licensePlate"] == "room1-m1"
+    assert finish == EPOCH + 4 * 60
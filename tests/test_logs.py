@@ -0,0 +1,106 @@
+import datetime
+import pytest
+from core import logs
+from core.logs import (
+    LogQueryError,
+    parse_since,
+    parse_timestamp,
+    plan_read,
+    stream_segments,
+    tail_offset,
+)
+
+START = datetime.datetime(2025, 1, 31, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def _error_line(minute):
+    stamp = (START + datetime.timedelta(minutes=minute)).strftime(
+        "%Y-%m-%d %H:%M:%S +0000"
+    )
+    return f"[{stamp}] [42] [INFO] line {minute}\n"
+
+
+def _read(path, **kwargs):
+    segments, headers = plan_read(str(path), **kwargs)
+    return b"".join(stream_segments(segments)).decode(), headers
+
+
+def test_parse_timestamp_formats():
+    access = b'127.0.0.1 - - [31/Jan/2025:12:05:00 +0000] "GET / HTTP/1.1" 200 2'
+    error = b"[2025-01-31 12:05:00 +0000] [42] [INFO] Booting worker"
+    expected = START + datetime.timedelta(minutes=5)
+    assert parse_timestamp(access) == expected
+    assert parse_timestamp(error) == expected
+    assert parse_timestamp(b"Traceback (most recent call last):") is None
+
+
+def test_parse_since():
+    assert parse_since("2025-01-31T12:00:00Z") == START
+    assert parse_since(str(START.timestamp())) == START
+    with pytest.raises(LogQueryError):
+        parse_since("yesterday")
+
+
+def test_tail_offset(tmp_path):
+    path = tmp_path / "error.log"
+    path.write_bytes(b"one\ntwo\nthree\n")
+    with open(path, "rb") as f:
+        assert tail_offset(f, 14, 2) == (4, 2)
+        assert tail_offset(f, 14, 10) == (0, 3)
+
+
+def test_tail_reads_rotated_file(tmp_path):
+    path = tmp_path / "error.log"
+    (tmp_path / "error.log.1").write_text("old1\nold2\n")
+    path.write_text("new1\n")
+
+    content, _ = _read(path, tail=2)
+    assert content == "old2\nnew1\n"
+
+
+def test_since_binary_search(tmp_path, monkeypatch):
+    monkeypatch.setattr(logs, "PROBE_SPAN", 64)
+    path = tmp_path / "error.log"
+    lines = []
+    for minute in range(200):
+        lines.append(_error_line(minute))
+        if minute % 10 == 0:
+            lines.append("Traceback (most recent call last):\n")
+    path.write_text("".join(lines))
+
+    since = START + datetime.timedelta(minutes=150)
+    content, _ = _read(path, since=since)
+    assert content.startswith(_error_line(150))
+    assert content.count("[INFO]") == 50
+
+    # Lookups are repeatable once probes are cached
+    assert _read(path, since=since)[0] == content
+
+
+def test_since_spans_rotation(tmp_path):
+    path = tmp_path / "error.log"
+    (tmp_path / "error.log.1").write_text(_error_line(0) + _error_line(1))
+    path.write_text(_error_line(2))
+
+    content, _ = _read(path, since=START + datetime.timedelta(minutes=1))
+    assert content == _error_line(1) + _error_line(2)
+
+
+def test_offset_paging(tmp_path):
+    path = tmp_path / "access.log"
+    path.write_bytes(b"0123456789")
+
+    content, headers = _read(path, offset=2, length=5)
+    assert content == "23456"
+    assert headers == {"X-Log-Size": "10", "X-Next-Offset": "7"}
+
+    content, headers = _read(path, offset=7, length=5)
+    assert content == "789"
+    assert "X-Next-Offset" not in headers
+
+
+def test_conflicting_modes(tmp_path):
+    path = tmp_path / "access.log"
+    path.write_text("")
+    with pytest.raises(LogQueryError):
+        plan_read(str(path), tail=1, offset=0)
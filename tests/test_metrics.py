@@ -0,0 +1,80 @@
+import json
+import os
+from peewee import SqliteDatabase
+from core import metrics
+from core.database import QueryMetricsMixin
+from core.metrics import Registry
+
+
+class InstrumentedSqliteDatabase(QueryMetricsMixin, SqliteDatabase):
+    pass
+
+
+def test_histogram_render():
+    registry = Registry()
+    histogram = registry.histogram(
+        "test_seconds", "Test latency", ("route",), buckets=(0.1, 1.0)
+    )
+    histogram.observe(0.05, route="/")
+    histogram.observe(0.5, route="/")
+    histogram.observe(5, route="/")
+
+    text = registry.render()
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{route="/",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{route="/",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{route="/",le="+Inf"} 3' in text
+    assert 'test_seconds_count{route="/"} 3' in text
+
+
+def test_render_merges_process_snapshots(tmp_path):
+    registry = Registry(str(tmp_path))
+    counter = registry.counter("test_total", "Test counter", ("model",))
+    counter.inc(model="Machine")
+
+    # Snapshot left by another process (e.g. the scheduler)
+    other = Registry()
+    other.counter("test_total", "Test counter", ("model",)).inc(2, model="Machine")
+    other.histogram("other_seconds", "Only in the other process").observe(0.2)
+    (tmp_path / f"{os.getppid()}.json").write_text(json.dumps(other.dump()))
+
+    registry.flush()
+    text = registry.render()
+    assert 'test_total{model="Machine"} 3' in text
+    assert "other_seconds_count 1" in text
+
+
+def test_render_archives_snapshots_of_exited_processes(tmp_path):
+    registry = Registry(str(tmp_path))
+    counter = registry.counter("test_total", "Test counter")
+    counter.inc()
+
+    def exited_worker(pid, amount):
+        other = Registry()
+        other.counter("test_total", "Test counter").inc(amount)
+        other.histogram("other_seconds", "Only in other processes").observe(0.2)
+        (tmp_path / f"{pid}.json").write_text(json.dumps(other.dump()))
+
+    # Far above any real pid_max, so no such processes exist
+    exited_worker(99999998, 5)
+    assert "test_total 6" in registry.render()
+    assert not (tmp_path / "99999998.json").exists()
+
+    # Totals keep counting up as more workers are replaced
+    exited_worker(99999999, 2)
+    text = registry.render()
+    assert "test_total 8" in text
+    assert "other_seconds_count 2" in text
+    assert "test_total 8" in registry.render()
+
+
+def test_query_metrics_mixin():
+    db = InstrumentedSqliteDatabase(":memory:")
+    metrics.set_route("/test-route")
+    try:
+        db.execute_sql("SELECT 1")
+        db.execute_sql("SELECT 2")
+    finally:
+        metrics.set_route(None)
+
+    assert metrics.DB_QUERIES.dump()["values"].count([["/test-route"], 2]) == 1
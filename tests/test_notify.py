@@ -0,0 +1,108 @@
+from core.database import Discord
+from core.notify import (
+    MachineEvent,
+    MachineStateTracker,
+    Notifier,
+    SubscriberIndex,
+)
+from core.records import MachineRecord
+
+
+class ListSink:
+    """Local stand-in for the bot webhook."""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def send(self, notifications):
+        if self.fail:
+            raise ConnectionError("bot unreachable")
+        self.batches.append(notifications)
+
+
+class StaticIndex(SubscriberIndex):
+    def __init__(self, rooms):
+        self._rooms = {room: frozenset(ids) for room, ids in rooms.items()}
+
+
+def machine(plate, time_remaining, available, room="room1"):
+    return MachineRecord(
+        opaqueId=f"op-{plate}",
+        licensePlate=plate,
+        roomId=room,
+        type="washer",
+        stickerNumber=1,
+        timeRemaining=time_remaining,
+        available=available,
+    )
+
+
+def test_tracker_raises_events_on_changes():
+    tracker = MachineStateTracker()
+    assert tracker.diff([machine("a", 10, False), machine("b", 0, True)]) == []
+
+    events = tracker.diff(
+        [machine("a", 0, False), machine("b", 30, False), machine("c", 0, True)]
+    )
+    assert [(event.licensePlate, event.kind) for event in events] == [
+        ("a", "finished"),
+        ("b", "unavailable"),
+    ]
+
+    events = tracker.diff([machine("a", 0, True), machine("a", 0, True)])
+    assert [event.kind for event in events] == ["available"]
+    # Machines absent from a cycle keep their state
+    assert tracker.diff([machine("b", 30, False)]) == []
+
+
+def test_subscriber_index_loads_discord_table(setup_database):
+    Discord.insert_many(
+        [("u1", "room1"), ("u2", "room1"), ("u3", "room2")],
+        fields=[Discord.discordId, Discord.roomId],
+    ).execute()
+    index = SubscriberIndex()
+    assert index.load() == 3
+    assert index.subscribers("room1") == {"u1", "u2"}
+    assert index.subscribers("room3") == frozenset()
+
+
+def test_notifier_fans_out_one_notification_per_subscriber(clock):
+    sink = ListSink()
+    notifier = Notifier(StaticIndex({"room1": ["u1", "u2"]}), sink, clock=clock)
+    events = [
+        MachineEvent("room1", "a", "washer", 1, "finished"),
+        MachineEvent("room1", "b", "dryer", 2, "available"),
+        MachineEvent("room2", "c", "dryer", 3, "available"),
+    ]
+    assert notifier.dispatch(events) == 2
+    (batch,) = sink.batches
+    assert sorted(n.subscriberId for n in batch) == ["u1", "u2"]
+    assert all(n.events == tuple(events[:2]) for n in batch)
+
+
+def test_notifier_rate_limit_queues_and_merges(clock):
+    sink = ListSink()
+    index = StaticIndex({"room1": [f"u{n}" for n in range(5)]})
+    notifier = Notifier(index, sink, rate=1, burst=2, batch_size=1, clock=clock)
+
+    first = MachineEvent("room1", "a", "washer", 1, "finished")
+    assert notifier.dispatch([first]) == 2
+    assert notifier.pending == 3
+    assert [len(batch) for batch in sink.batches] == [1, 1]
+
+    # Later events for queued subscribers join their pending notification
+    second = MachineEvent("room1", "b", "washer", 2, "finished")
+    assert notifier.dispatch([second]) == 0
+    assert notifier.pending == 5
+
+    clock.now += 3
+    assert notifier.flush() == 2
+    assert sink.batches[2][0].events == (first, second)
+
+
+def test_notifier_drops_batch_on_sink_error():
+    notifier = Notifier(StaticIndex({"room1": ["u1"]}), ListSink(fail=True))
+    event = MachineEvent("room1", "a", "washer", 1, "finished")
+    assert notifier.dispatch([event]) == 0
+    assert notifier.pending == 0
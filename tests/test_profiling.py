@@ -0,0 +1,74 @@
+import json
+import pytest
+from core import profiling
+from core.profiling import CycleProfiler, read_reports
+
+
+def test_cycle_report(tmp_path):
+    profiler = CycleProfiler(directory=str(tmp_path), history=2)
+
+    for cycle in range(3):
+        with profiler.cycle():
+            with profiling.phase("location_fetch"):
+                pass
+            profiling.add_phase("flatten", 0.5)
+            profiling.add_phase("flatten", 0.25)
+            profiling.record_room_fetch("fast", 0.1)
+            profiling.record_room_fetch("slow", 2.0)
+            profiling.record_query(0.01)
+            profiling.annotate(cycle=cycle)
+
+    reports = read_reports(str(tmp_path))
+    assert [report["cycle"] for report in reports] == [1, 2]
+    report = reports[-1]
+    assert set(report["phases"]) == {"location_fetch", "flatten"}
+    assert report["phases"]["flatten"] == 0.75
+    assert report["slowestRooms"][0] == {"roomId": "slow", "seconds": 2.0}
+    assert report["dbRoundTrips"] == 1
+    assert report["processPeakRssKb"] > 0
+    # Measured per cycle wherever /proc/self/clear_refs is available
+    assert report["cyclePeakRssKb"] is None or report["cyclePeakRssKb"] > 0
+
+
+def test_hooks_are_noops_outside_a_cycle():
+    profiling.record_query(1.0)
+    with profiling.phase("ignored"):
+        pass
+
+
+def test_failed_cycle_is_reported(tmp_path):
+    profiler = CycleProfiler(directory=str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with profiler.cycle():
+            raise RuntimeError("upstream down")
+    assert profiler.reports[-1]["error"] == "upstream down"
+
+
+def test_trigger_file_enables_cprofile(tmp_path):
+    (tmp_path / profiling.TRIGGER_FILE).write_text("1")
+    profiler = CycleProfiler(directory=str(tmp_path))
+
+    with profiler.cycle():
+        sum(range(1000))
+    with profiler.cycle():
+        pass
+
+    assert not (tmp_path / profiling.TRIGGER_FILE).exists()
+    assert len(list(tmp_path.glob("cycle-*.pstats"))) == 1
+    assert len(json.loads((tmp_path / "cycles.json").read_text())) == 2
+
+
+def test_process_peak_rss_survives_per_cycle_resets(tmp_path, monkeypatch):
+    # Peak RSS readings, each since the previous per-cycle reset
+    readings = iter([500, 100, 200, 200, 50, 700, 700])
+    monkeypatch.setattr(profiling, "_peak_rss_kb", lambda: next(readings))
+    monkeypatch.setattr(profiling, "_reset_peak_rss", lambda: True)
+
+    profiler = CycleProfiler(directory=str(tmp_path))
+    with profiler.cycle():
+        pass
+    with profiler.cycle():
+        pass
+    first, second = profiler.reports
+    assert (first["cyclePeakRssKb"], first["processPeakRssKb"]) == (200, 500)
+    assert (second["cyclePeakRssKb"], second["processPeakRssKb"]) == (700, 700)
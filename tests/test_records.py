@@ -0,0 +1,56 @@
+import pytest
+
+from benchmarks.campus import build_campus
+from core.database import Location, Machine, Room
+from core.records import LocationRecord, MachineRecord, RoomRecord
+from core.scraper import flatten_dict
+
+CAMPUS = build_campus(40)
+
+
+@pytest.mark.parametrize(
+    "record, model",
+    [(LocationRecord, Location), (RoomRecord, Room), (MachineRecord, Machine)],
+)
+def test_fields_match_model_columns(record, model):
+    columns = set(model._meta.fields) - {"id", "lastUpdated", "lastUser"}
+    assert set(record.FIELDS) == columns
+
+
+def test_machine_record_matches_flattened_payload():
+    payload = CAMPUS["machines"]["room-00000"][0]
+    record = MachineRecord.from_api(payload)
+    assert record.as_dict() == flatten_dict(payload)
+    assert dict(record) == flatten_dict(payload)
+    assert record.capability_addTime is payload["capability"]["addTime"]
+
+
+def test_missing_and_unknown_keys():
+    record = MachineRecord.from_api({"type": "washer", "settings": None, "extra": 1})
+    assert record["type"] == "washer"
+    assert record.settings_cycle is None
+    assert "extra" not in record
+    assert record.get("extra", "default") == "default"
+    with pytest.raises(KeyError):
+        record["extra"]
+    with pytest.raises(KeyError):
+        record["extra"] = 1
+
+
+def test_dict_view_and_equality():
+    room = RoomRecord.from_api(CAMPUS["location"]["rooms"][0])
+    copy = RoomRecord(**room)
+    assert copy == room
+    copy["label"] = "Renamed"
+    assert copy != room
+    assert copy.changed_fields(room) == ["label"]
+    assert not copy.differs_from(room, exclude=("label",))
+
+
+def test_diff_against_model_uses_raw_foreign_keys():
+    room = RoomRecord.from_api(CAMPUS["location"]["rooms"][0])
+    # An unsaved instance: loading its location would fail
+    existing = Room(**room)
+    assert not room.differs_from(existing)
+    existing.machineCount += 1
+    assert room.changed_fields(existing) == ["machineCount"]
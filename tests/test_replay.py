@@ -0,0 +1,96 @@
+import os
+
+import pytest
+import requests
+
+from benchmarks.campus import FakeTransport, build_campus
+from core.replay import RecordingTransport, ReplayTransport, read_records, summarize
+from core.scraper import scrape_location
+
+
+def scrape(campus, transport):
+    """Scrape a campus, with machines keyed by plate (fetch order varies)."""
+    location, rooms, machines = scrape_location(
+        campus["location"]["locationId"], transport=transport
+    )
+    return location, rooms, {m["licensePlate"]: m for m in machines}
+
+
+def record_campuses(directory, campuses, clock, interval=60.0, segment_seconds=3600):
+    """Scrape each campus once, `interval` recorded seconds apart."""
+    for campus in campuses:
+        recorder = RecordingTransport(
+            directory, FakeTransport(campus), segment_seconds, clock=clock
+        )
+        scrape_location(campus["location"]["locationId"], transport=recorder)
+        recorder.close()
+        clock.now += interval
+
+
+def test_replay_matches_recorded_scrape(tmp_path, clock):
+    campus = build_campus(100)
+    record_campuses(str(tmp_path), [campus], clock)
+
+    replay = ReplayTransport(str(tmp_path), speed=100)
+    assert scrape(campus, replay) == scrape(campus, FakeTransport(campus))
+    assert replay.exhausted
+
+
+def test_replay_follows_virtual_clock(tmp_path, clock):
+    first, second = build_campus(40, seed=1), build_campus(40, seed=2)
+    record_campuses(str(tmp_path), [first, second], clock, segment_seconds=30)
+    # A new segment per scrape
+    assert len(os.listdir(tmp_path)) == 2
+
+    # The replay starts its virtual clock at the first get
+    replay = ReplayTransport(str(tmp_path), speed=10, clock=clock)
+    assert scrape(first, replay) == scrape(first, FakeTransport(first))
+    assert not replay.exhausted
+
+    clock.now += 6  # 60 recorded seconds
+    assert scrape(second, replay) == scrape(second, FakeTransport(second))
+
+
+def test_unknown_url_is_not_found(tmp_path, clock):
+    record_campuses(str(tmp_path), [build_campus(10)], clock)
+    response = ReplayTransport(str(tmp_path)).get("https://example.com/missing")
+    assert response.status_code == 404
+    with pytest.raises(requests.exceptions.HTTPError):
+        response.raise_for_status()
+
+
+def test_lookahead_leaves_other_urls_current(tmp_path, clock):
+    recorder = RecordingTransport(str(tmp_path), clock=clock)
+    recorder.record("a", 200, b"1")
+    clock.now += 10
+    recorder.record("a", 200, b"2")
+    clock.now += 10
+    recorder.record("b", 200, b"3")
+    recorder.close()
+
+    replay = ReplayTransport(str(tmp_path), clock=clock)
+    # b is only recorded after the virtual time and is served ahead of time,
+    # but a keeps its current record instead of the one 10 seconds later
+    assert replay.get("b").content == b"3"
+    assert replay.get("a").content == b"1"
+    assert not replay.exhausted
+
+
+def test_truncated_segment_keeps_complete_records(tmp_path, clock):
+    record_campuses(str(tmp_path), [build_campus(80)], clock)
+    (path,) = tmp_path.iterdir()
+    data = path.read_bytes()
+    path.write_bytes(data[: len(data) // 2])
+    records = list(read_records(str(tmp_path)))
+    assert len(records) < 3
+    assert summarize(str(tmp_path))["records"] == len(records)
+
+
+def test_summarize(tmp_path, clock):
+    record_campuses(str(tmp_path), [build_campus(80), build_campus(80)], clock)
+    assert summarize(str(tmp_path)) == {
+        "records": 6,
+        "urls": 3,
+        "start": 1000.0,
+        "end": 1060.0,
+    }
@@ -0,0 +1,70 @@
+import threading
+from core.scheduling import FixedRateScheduler
+
+
+def _wait_for_runs(job, runs):
+    for _ in range(200):
+        if job.runs >= runs and not job.running:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f"job ran {job.runs} times, expected {runs}")
+
+
+def test_ticks_do_not_drift(clock):
+    scheduler = FixedRateScheduler(clock=clock)
+    job = scheduler.add_job(lambda: None, 60, name="job")
+
+    assert scheduler.tick() == 60
+    _wait_for_runs(job, 1)
+
+    # Starting a tick 5s late does not push later ticks back
+    clock.now = 1065.0
+    assert scheduler.tick() == 55
+    _wait_for_runs(job, 2)
+    assert job.last_lag == 5.0
+    assert job.next_tick == 1120.0
+    assert job.missed == 0
+    scheduler.stop()
+
+
+def test_align_to_wall_clock(clock):
+    clock.now = 1001.0
+    scheduler = FixedRateScheduler(clock=clock)
+    job = scheduler.add_job(lambda: None, 60, align=True)
+    assert job.next_tick == 1020.0
+    scheduler.stop()
+
+
+def test_overlapping_tick_is_skipped(clock):
+    release = threading.Event()
+    scheduler = FixedRateScheduler(clock=clock)
+    job = scheduler.add_job(release.wait, 60, name="slow")
+
+    scheduler.tick()
+    clock.now = 1060.0
+    scheduler.tick()
+    assert job.missed == 1
+    assert job.next_tick == 1120.0
+
+    release.set()
+    _wait_for_runs(job, 1)
+    assert job.runs == 1
+    scheduler.stop()
+
+
+def test_late_ticks_are_coalesced(clock):
+    calls = []
+    scheduler = FixedRateScheduler(clock=clock)
+    job = scheduler.add_job(calls.append, 60, args=("run",))
+
+    scheduler.tick()
+    _wait_for_runs(job, 1)
+    clock.now = 1190.0
+    scheduler.tick()
+    _wait_for_runs(job, 2)
+
+    # Ticks at 1060, 1120 and 1180 have all passed; only one run is started
+    assert calls == ["run", "run"]
+    assert job.missed == 2
+    assert job.next_tick == 1240.0
+    scheduler.stop()
@@ -1,7 +1,13 @@
 import pytest
 from unittest.mock import patch, Mock
 import requests
-from core.scraper import get_location_data, get_machines, scrape_location
+from benchmarks.campus import FakeTransport, build_campus
+from core.scraper import (
+    RoomDigests,
+    get_location_data,
+    get_machines,
+    scrape_location,
+)
 
 # Sample mock data for testing
 mock_location_response = {
@@ -70,3 +76,56 @@ def test_scrape_location(mock_get_machines, mock_get_location_data):
     # Verify machines are sorted by type and stickerNumber
     assert machines[0]["type"] == "dryer"
     assert machines[1]["type"] == "washer"
+
+
+@patch("core.scraper.get_location_data")
+@patch("core.scraper.get_machines")
+def test_scrape_location_room_filter(mock_get_machines, mock_get_location_data):
+    mock_get_location_data.return_value = {
+        "locationId": "loc",
+        "rooms": [
+            {"roomId": "room1", "locationId": "loc"},
+            {"roomId": "room2", "locationId": "loc"},
+        ],
+    }
+    mock_get_machines.return_value = [{"type": "washer", "stickerNumber": 101}]
+
+    _, rooms, machines = scrape_location(
+        "loc", room_filter=lambda room: room["roomId"] == "room2"
+    )
+
+    assert [room["roomId"] for room in rooms] == ["room2"]
+    assert len(machines) == 1
+    mock_get_machines.assert_called_once_with(
+        {"roomId": "room2", "locationId": "loc"}, None, None
+    )
+
+
+def test_scrape_location_skips_unchanged_rooms():
+    campus = build_campus(80)
+    location_id = campus["location"]["locationId"]
+    transport = FakeTransport(campus)
+    digests = RoomDigests()
+
+    _, rooms, machines = scrape_location(location_id, None, transport, digests)
+    assert len(machines) == 80
+    digests.commit()
+
+    # Nothing changed: no machines to parse or persist
+    _, rooms, machines = scrape_location(location_id, None, transport, digests)
+    assert len(rooms) == 2
+    assert machines == []
+    assert digests.hits == 2
+    digests.commit()
+
+    # One machine changes: only its room is returned
+    campus["machines"]["room-00001"][0]["timeRemaining"] = 99
+    transport = FakeTransport(campus)
+    _, _, machines = scrape_location(location_id, None, transport, digests)
+    assert {m["roomId"] for m in machines} == {"room-00001"}
+    assert digests.hit_rate == 3 / 6
+
+    # A failed persist forgets everything
+    digests.discard()
+    _, _, machines = scrape_location(location_id, None, transport, digests)
+    assert len(machines) == 80
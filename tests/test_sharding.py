@@ -0,0 +1,26 @@
+from core.sharding import HashRing
+
+ROOMS = [f"room-{index}" for index in range(1000)]
+
+
+def test_empty_ring():
+    assert HashRing().node_for("room-1") is None
+
+
+def test_rooms_spread_across_workers():
+    ring = HashRing(["a", "b", "c"])
+    counts = {}
+    for room in ROOMS:
+        owner = ring.node_for(room)
+        counts[owner] = counts.get(owner, 0) + 1
+    assert set(counts) == {"a", "b", "c"}
+    assert min(counts.values()) > 200
+
+
+def test_join_moves_only_new_workers_rooms():
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+    moved = [room for room in ROOMS if before.node_for(room) != after.node_for(room)]
+    # Every room that moved went to the new worker
+    assert all(after.node_for(room) == "d" for room in moved)
+    assert len(moved) < len(ROOMS) / 2
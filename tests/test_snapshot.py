@@ -0,0 +1,119 @@
+import gzip
+import pytest
+from core import snapshot
+from core.database import Machine, Room
+from core.queries import fetch_locations
+
+
+@pytest.fixture
+def tree(setup_database, make_tree):
+    # room2 is created first, so machine ids do not follow roomId order
+    location = make_tree(machine_count=2, room_ids=("room2", "room1"))
+    Machine.update(available=False).where(Machine.stickerNumber == 2).execute()
+    for room_id in ("room0", "room3"):
+        Room.create(
+            roomId=room_id,
+            locationId=location,
+            connected=True,
+            label=room_id,
+            dryerCount=0,
+            washerCount=0,
+            machineCount=0,
+            freePlay=False,
+        )
+
+
+def test_publish_and_read(tree, tmp_path):
+    path = str(tmp_path / "tree.snap")
+    version = snapshot.publish(path)
+    reader = snapshot.SnapshotReader(path)
+    current = reader.current()
+    assert current.version == version
+    locations, _ = fetch_locations()
+    assert current.body() == snapshot.encode_body(locations)
+    assert gzip.decompress(current.body("gzip")) == current.body()
+    # The body can also be read (or sent) from the file, bounded to its section
+    body = current.open_body("gzip")
+    assert body.read() == current.body("gzip")
+    assert body.read() == b""
+    body.close()
+    # The mapping is reused until the file is replaced
+    assert reader.current() is current
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {},
+        {"room_id": "room2"},
+        {"room_id": "missing"},
+        {"machine_id": "room1-qr2"},
+        {"machine_id": "room1-m1", "room_id": "room2"},
+        {"limit": 3},
+        {"limit": 1, "room_id": "room2"},
+        {"limit": 1, "room_id": "room3"},
+        {"limit": 2, "machine_id": "room1-m1"},
+        {"machine_fields": ("licensePlate",), "room_fields": ("label",)},
+    ],
+)
+def test_tables_match_database(tree, tmp_path, params):
+    path = str(tmp_path / "tree.snap")
+    snapshot.publish(path)
+    tables = snapshot.SnapshotReader(path).current().tables
+
+    expected = fetch_locations(**params)
+    assert snapshot.encode_body(tables.fetch_locations(**params)[0]) == (
+        snapshot.encode_body(expected[0])
+    )
+    assert tables.fetch_locations(**params)[1] == expected[1]
+
+
+def test_tables_cursor_pages(tree, tmp_path):
+    path = str(tmp_path / "tree.snap")
+    snapshot.publish(path)
+    tables = snapshot.SnapshotReader(path).current().tables
+
+    for fetch in (tables.fetch_locations, fetch_locations):
+        plates, rooms, cursor = [], set(), None
+        while True:
+            locations, cursor = fetch(limit=3, cursor=cursor)
+            for room_id, room in locations[0]["rooms"].items():
+                rooms.add(room_id)
+                plates.extend(m["licensePlate"] for m in room["machines"])
+            if not cursor:
+                break
+        assert plates == ["room1-m1", "room1-m2", "room2-m1", "room2-m2"]
+        # Rooms without machines are paged through too
+        assert rooms == {"room0", "room1", "room2", "room3"}
+
+
+def test_reader_switches_and_expires(tree, tmp_path, clock):
+    path = str(tmp_path / "tree.snap")
+    reader = snapshot.SnapshotReader(path, max_age=60, clock=clock)
+    assert reader.current() is None
+
+    snapshot.publish(path, clock=clock)
+    first = reader.current()
+    Machine.update(timeRemaining=9).execute()
+    clock.now += 1
+    snapshot.publish(path, clock=clock)
+    second = reader.current()
+    assert second.version > first.version
+    assert b'"timeRemaining":9' in second.body().tobytes()
+    # The replaced snapshot stays readable for requests still using it, but
+    # is no longer sent from the file
+    assert b'"timeRemaining":9' not in first.body().tobytes()
+    assert first.open_body() is None
+
+    clock.now += 120
+    assert reader.current() is None
+
+
+def test_reader_ignores_invalid_file(tmp_path):
+    path = tmp_path / "tree.snap"
+    reader = snapshot.SnapshotReader(str(path))
+    path.write_bytes(b"")
+    assert reader.current() is None
+    path.write_bytes(b"not a snapshot" * 4)
+    assert reader.current() is None